@@ -1,1164 +1,4860 @@
-import pygame
-import random
-import sys
-import operator
-from fractions import Fraction
-import json
-import os
-import time
-
-# Utility: Terminate program cleanly 
-def terminate_program():
-    pygame.quit()
-    sys.exit()
-
-# Initialize Pygame and audio mixer
-pygame.init()
-pygame.mixer.init()
-
-# Screen and performance config
-info = pygame.display.Info()
-SCREEN_W, SCREEN_H = info.current_w, info.current_h
-FPS = 60
-
-# Color palette 
-BG_COLOR = (248, 248, 242)
-GRID_COLOR = (220, 220, 220)
-WOOD_LIGHT = (233, 165, 83)
-WOOD_DARK = (210, 140, 60)
-WOOD_BORDER = (94, 44, 12)
-TEXT_BROWN = (61, 30, 11)
-TEXT_WHITE = (255, 255, 255)
-COLOR_P1 = (78, 205, 196)
-COLOR_P2 = (255, 107, 107)
-COLOR_ROPE_DETAIL = (230, 180, 100)
-BLACK_TRANSPARENT = (0, 0, 0, 180)
-
-# Game states 
-STATE_MAIN_MENU = "main_menu"
-STATE_AUDIO_SETTINGS = "audio_settings"
-STATE_NAME_INPUT = "name_input"
-STATE_GAME_PLAY = "game_play"
-STATE_LEADERBOARD = "leaderboard"
-STATE_GAME_OVER = "game_over"
-
-# Font loading
-def get_font(size):
-    font_files = ["BoldPixels.ttf", "BoldPixels.otf", "pixel.ttf"]
-    for f in font_files:
-        if os.path.exists(f):
-            try:
-                return pygame.font.Font(f, size)
-            except:
-                pass
-    return pygame.font.SysFont("arial", size, bold=True)
-
-FONT_XL = get_font(50)
-FONT_L = get_font(30)
-FONT_M = get_font(20)
-FONT_S = get_font(16)
-
-# Load image 
-def robust_load_image(filenames, scale_size=None):
-    for name in filenames:
-        if os.path.exists(name):
-            try:
-                img = pygame.image.load(name)
-                if scale_size:
-                    img = pygame.transform.scale(img, scale_size)
-                return img
-            except Exception as e:
-                print(f"Failed to load {name}: {e}")
-    return None
-
-# Load assets
-WALLPAPER_IMG = robust_load_image(["wallpaper.png", "wallpaper.jpg"], (SCREEN_W, SCREEN_H))
-INGAME_WALLPAPER_IMG = robust_load_image(["ingamewallpaper.png", "ingamewallpaper.jpg"], (SCREEN_W, SCREEN_H))
-TARGET_LINE_IMG = robust_load_image(["target.png"], (60, 80))
-INDICATOR_IMG = robust_load_image(["indicator.png"], (64, 64))
-PLAYER_LEFT_IMG = robust_load_image(["character1.png", "character1.jpg"], (100, 100))
-PLAYER_RIGHT_IMG = robust_load_image(["character2.png", "character2.jpg"], (100, 100))
-
-# Load and scale rope image
-ROPE_IMG = None
-if os.path.exists("tali.png"):
-    try:
-        loaded_rope = pygame.image.load("tali.png")
-        rope_h = 850
-        ratio = loaded_rope.get_width() / loaded_rope.get_height()
-        rope_w = int(rope_h * ratio)
-        if rope_w < SCREEN_W * 1.5:
-            rope_w = int(SCREEN_W * 1.5)
-        ROPE_IMG = pygame.transform.scale(loaded_rope, (rope_w, rope_h))
-    except:
-        pass
-
-# Global game configuration 
-TARGET_PULL = 8
-TIME_PER_QUESTION = 15
-DIFFICULTY = 'MID'
-GAME_MODE = 'PvP'
-PLAYER_NAMES = {"left": "YOU", "right": "BOT"}
-LEADERBOARD_FILE_PVBOT = 'pvbot_leaderboard.json'
-LEADERBOARD_FILE_PVP = 'pvp_leaderboard.json'
-GAME_SETTINGS = {
-    'music_on': True,
-    'sfx_on': True,
-    'volume': 0.5
-}
-
-# Sound loading 
-SOUND_CLICK = None
-SOUND_CORRECT = None
-SOUND_WRONG = None
-SOUND_COUNTDOWN = None
-SOUND_TIMEOUT = None
-SOUND_WIN = None
-SOUND_LOSE = None
-
-def load_game_sounds():
-    global SOUND_CLICK, SOUND_CORRECT, SOUND_WRONG, SOUND_COUNTDOWN, SOUND_TIMEOUT, SOUND_WIN, SOUND_LOSE
-    try:
-        if os.path.exists("maintheme.mp3"):
-            pygame.mixer.music.load("maintheme.mp3")
-            update_background_music()
-        if os.path.exists("click.mp3"): SOUND_CLICK = pygame.mixer.Sound("click.mp3")
-        if os.path.exists("correct.mp3"): SOUND_CORRECT = pygame.mixer.Sound("correct.mp3")
-        if os.path.exists("incorrect.mp3"): SOUND_WRONG = pygame.mixer.Sound("incorrect.mp3")
-        if os.path.exists("countdown.mp3"): SOUND_COUNTDOWN = pygame.mixer.Sound("countdown.mp3")
-        if os.path.exists("timeout.mp3"): SOUND_TIMEOUT = pygame.mixer.Sound("timeout.mp3")
-        if os.path.exists("win.mp3"): SOUND_WIN = pygame.mixer.Sound("win.mp3")
-        if os.path.exists("lose.mp3"): SOUND_LOSE = pygame.mixer.Sound("lose.mp3")
-    except:
-        pass
-
-def update_background_music():
-    if GAME_SETTINGS['music_on']:
-        if not pygame.mixer.music.get_busy():
-            try:
-                pygame.mixer.music.play(-1)
-            except:
-                pass
-        pygame.mixer.music.unpause()
-        pygame.mixer.music.set_volume(GAME_SETTINGS['volume'])
-    else:
-        pygame.mixer.music.pause()
-
-def play_sfx(sound_obj):
-    if sound_obj and GAME_SETTINGS['sfx_on']:
-        sound_obj.set_volume(GAME_SETTINGS['volume'])
-        sound_obj.play()
-
-def play_win_sound():
-    pygame.mixer.music.stop()
-    play_sfx(SOUND_WIN)
-
-def play_lose_sound():
-    pygame.mixer.music.stop()
-    play_sfx(SOUND_LOSE)
-
-def restart_bg_music():
-    if not pygame.mixer.music.get_busy() and GAME_SETTINGS['music_on']:
-        try:
-            pygame.mixer.music.play(-1)
-        except:
-            pass
-    update_background_music()
-
-load_game_sounds()
-
-# Math and leaderboard logic
-def load_leaderboard(mode='PvBot'):
-    filename = LEADERBOARD_FILE_PVP if mode == 'PvP' else LEADERBOARD_FILE_PVBOT
-    if not os.path.exists(filename):
-        return {'EASY': [], 'MID': [], 'HARD': []}
-    try:
-        with open(filename, 'r') as f:
-            return json.load(f)
-    except:
-        return {'EASY': [], 'MID': [], 'HARD': []}
-
-def save_leaderboard(data, mode='PvBot'):
-    filename = LEADERBOARD_FILE_PVP if mode == 'PvP' else LEADERBOARD_FILE_PVBOT
-    try:
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
-    except:
-        pass
-
-def add_score(player_name, session_time, difficulty, mode='PvBot', winner_name=None):
-    leaderboard = load_leaderboard(mode)
-    new_score = {
-        'name': player_name,
-        'time': round(session_time / 1000, 2),
-        'date': time.strftime("%Y-%m-%d %H:%M:%S")
-    }
-    if mode == 'PvP' and winner_name:
-        new_score['winner'] = winner_name
-    if difficulty not in leaderboard:
-        leaderboard[difficulty] = []
-    leaderboard[difficulty].append(new_score)
-    leaderboard[difficulty].sort(key=lambda x: x['time'])
-    leaderboard[difficulty] = leaderboard[difficulty][:10]
-    save_leaderboard(leaderboard, mode)
-
-def _generate_integer_question(max_val):
-    ops = [('+', operator.add), ('-', operator.sub), ('*', operator.mul)]
-    op_sym, op_func = random.choice(ops)
-    num1 = random.randint(5, max_val)
-    num2 = random.randint(1, max_val // 2)
-    if op_sym == '-' and num2 > num1:
-        num1, num2 = num2, num1
-    return f"{num1} {op_sym} {num2} = ?", str(op_func(num1, num2))
-
-def _generate_fraction_question():
-    ops = [('+', operator.add), ('-', operator.sub)]
-    op_sym, op_func = random.choice(ops)
-    p1 = Fraction(random.randint(1, 5), random.randint(2, 6))
-    p2 = Fraction(random.randint(1, 5), random.randint(2, 6))
-    if op_sym == '-' and p2 > p1:
-        p1, p2 = p2, p1
-    jawaban_obj = op_func(p1, p2).limit_denominator()
-    return f"{p1} {op_sym} {p2} = ?", str(jawaban_obj)
-
-def _generate_root_question():
-    base_sq = random.randint(3, 10)
-    bil_kuadrat = base_sq ** 2
-    base_cube = random.randint(2, 5)
-    bil_kubik = base_cube ** 3
-    if random.choice([True, False]):
-        return f"√{bil_kuadrat} + 3√{bil_kubik} = ?", str(base_sq + base_cube)
-    else:
-        if base_sq > base_cube:
-            return f"√{bil_kuadrat} - 3√{bil_kubik} = ?", str(base_sq - base_cube)
-        else:
-            return f"3√{bil_kubik} - √{bil_kuadrat} = ?", str(base_cube - base_sq)
-
-def generate_mixed_question(difficulty):
-    if difficulty == 'EASY':
-        return _generate_integer_question(max_val=20)
-    elif difficulty == 'MID':
-        return random.choice([lambda: _generate_integer_question(max_val=50), _generate_fraction_question])()
-    elif difficulty == 'HARD':
-        return random.choice([
-            lambda: _generate_integer_question(max_val=100),
-            _generate_fraction_question,
-            _generate_root_question
-        ])()
-    else:
-        return _generate_integer_question(max_val=30)
-
-class PlayerState:
-    def __init__(self, side):
-        self.side = side
-        self.current_input = ""
-        self.last_answer_time = 0
-        self.correct_count = 0
-    def reset_input(self):
-        self.current_input = ""
-
-# UI Button
-class Button:
-    def __init__(self, rect, text="", callback=None, font=FONT_M):
-        self.rect = pygame.Rect(rect)
-        self.text = text
-        self.callback = callback
-        self.font = font
-        self.hover = False
-    def draw(self, surf):
-        fill_color = WOOD_DARK if self.hover else WOOD_LIGHT
-        pygame.draw.rect(surf, WOOD_BORDER, self.rect, border_radius=6)
-        inner_rect = self.rect.inflate(-6, -6)
-        pygame.draw.rect(surf, fill_color, inner_rect, border_radius=4)
-        nail_color = (130, 70, 30)
-        corners = [
-            (inner_rect.left + 3, inner_rect.top + 3),
-            (inner_rect.right - 7, inner_rect.top + 3),
-            (inner_rect.left + 3, inner_rect.bottom - 7),
-            (inner_rect.right - 7, inner_rect.bottom - 7)
-        ]
-        for x, y in corners:
-            pygame.draw.rect(surf, nail_color, (x, y, 4, 4))
-        txt = self.font.render(self.text, True, TEXT_BROWN)
-        txt_r = txt.get_rect(center=self.rect.center)
-        surf.blit(txt, txt_r)
-    def handle_event(self, ev):
-        if ev.type == pygame.MOUSEMOTION:
-            self.hover = self.rect.collidepoint(ev.pos)
-        elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
-            if self.rect.collidepoint(ev.pos):
-                play_sfx(SOUND_CLICK)
-                if self.callback:
-                    self.callback()
-
-# Fallback background if wallpaper missing
-def draw_grid_background(surf):
-    surf.fill(BG_COLOR)
-    for x in range(0, SCREEN_W, 40):
-        pygame.draw.line(surf, GRID_COLOR, (x, 0), (x, SCREEN_H), 1)
-    for y in range(0, SCREEN_H, 40):
-        pygame.draw.line(surf, GRID_COLOR, (0, y), (SCREEN_W, y), 1)
-
-# Main Menu Screen
-class MainMenu:
-    def __init__(self, start_game_callback, leaderboard_callback, settings_callback):
-        self.start_game = start_game_callback
-        self.leaderboard_callback = leaderboard_callback
-        self.settings_callback = settings_callback
-        self.selected_mode = GAME_MODE
-        self.selected_difficulty = DIFFICULTY
-        self.buttons = []
-        self.create_buttons()
-    def create_buttons(self):
-        btn_w, btn_h = 240, 55
-        center_x = SCREEN_W // 2
-        start_y_mode = 200
-        self.buttons.append(Button((center_x - btn_w - 10, start_y_mode, btn_w, btn_h), "Player vs Player", lambda: self.select_mode('PvP')))
-        self.buttons.append(Button((center_x + 10, start_y_mode, btn_w, btn_h), "Player vs BOT", lambda: self.select_mode('PvBot')))
-        start_y_diff = 320
-        diff_w = 160
-        diff_gap = 20
-        total_diff_width = (diff_w * 3) + (diff_gap * 2)
-        start_diff_x = center_x - (total_diff_width // 2)
-        self.buttons.append(Button((start_diff_x, start_y_diff, diff_w, btn_h), "EASY", lambda: self.select_difficulty('EASY')))
-        self.buttons.append(Button((start_diff_x + diff_w + diff_gap, start_y_diff, diff_w, btn_h), "MEDIUM", lambda: self.select_difficulty('MID')))
-        self.buttons.append(Button((start_diff_x + 2 * (diff_w + diff_gap), start_y_diff, diff_w, btn_h), "HARD", lambda: self.select_difficulty('HARD')))
-        start_y_actions = 430
-        self.buttons.append(Button((center_x - 150, start_y_actions, 300, 60), "START GAME", self.on_start, FONT_L))
-        self.buttons.append(Button((center_x - 150, start_y_actions + 75, 300, 45), "LEADERBOARD", self.leaderboard_callback))
-        self.buttons.append(Button((center_x - 150, start_y_actions + 130, 300, 45), "AUDIO SETTINGS", self.settings_callback))
-        self.buttons.append(Button((center_x - 150, start_y_actions + 185, 300, 45), "EXIT", terminate_program))
-    def select_mode(self, mode):
-        self.selected_mode = mode
-    def select_difficulty(self, difficulty):
-        self.selected_difficulty = difficulty
-    def on_start(self):
-        global GAME_MODE, DIFFICULTY
-        GAME_MODE = self.selected_mode
-        DIFFICULTY = self.selected_difficulty
-        self.start_game()
-    def handle_event(self, ev):
-        for b in self.buttons:
-            b.handle_event(ev)
-    def draw(self, surf):
-        if WALLPAPER_IMG:
-            surf.blit(WALLPAPER_IMG, (0, 0))
-        else:
-            surf.fill(BG_COLOR)
-        title_txt = "MATH TUG WAR"
-        t_shadow = FONT_XL.render(title_txt, True, (0, 0, 0))
-        t_main = FONT_XL.render(title_txt, True, TEXT_WHITE)
-        surf.blit(t_shadow, (SCREEN_W // 2 - t_shadow.get_width() // 2 + 4, 64))
-        surf.blit(t_main, (SCREEN_W // 2 - t_main.get_width() // 2, 60))
-        lbl_mode = FONT_L.render("SELECT MODE", True, TEXT_WHITE)
-        surf.blit(lbl_mode, (SCREEN_W // 2 - lbl_mode.get_width() // 2, 160))
-        lbl_diff = FONT_L.render("DIFFICULTY", True, TEXT_WHITE)
-        surf.blit(lbl_diff, (SCREEN_W // 2 - lbl_diff.get_width() // 2, 280))
-        for b in self.buttons:
-            b.draw(surf)
-            is_mode_sel = (b.text == 'Player vs Player' and self.selected_mode == 'PvP') or \
-                          (b.text == 'Player vs BOT' and self.selected_mode == 'PvBot')
-            is_diff_sel = (b.text == 'EASY' and self.selected_difficulty == 'EASY') or \
-                          (b.text == 'MEDIUM' and self.selected_difficulty == 'MID') or \
-                          (b.text == 'HARD' and self.selected_difficulty == 'HARD')
-            if is_mode_sel or is_diff_sel:
-                pygame.draw.rect(surf, (255, 255, 200), b.rect.inflate(6, 6), 3, border_radius=6)
-
-# Audio Settings Screen
-class AudioSettingsScreen:
-    def __init__(self, return_callback):
-        self.return_callback = return_callback
-        self.create_buttons()
-    def create_buttons(self):
-        self.buttons = []
-        center_x = SCREEN_W // 2
-        start_y = 200
-        btn_w, btn_h = 300, 55
-        spacing = 20
-        self.buttons.append(Button(
-            (center_x - btn_w // 2, start_y, btn_w, btn_h),
-            f"Music: {'ON' if GAME_SETTINGS['music_on'] else 'OFF'}",
-            self.toggle_music
-        ))
-        self.buttons.append(Button(
-            (center_x - btn_w // 2, start_y + btn_h + spacing, btn_w, btn_h),
-            f"SFX: {'ON' if GAME_SETTINGS['sfx_on'] else 'OFF'}",
-            self.toggle_sfx
-        ))
-        vol_y = start_y + (btn_h + spacing) * 2
-        self.buttons.append(Button((center_x - 130, vol_y, 60, 55), "-", self.decrease_volume, FONT_L))
-        self.buttons.append(Button((center_x + 70, vol_y, 60, 55), "+", self.increase_volume, FONT_L))
-        self.buttons.append(Button((center_x - 100, 500, 200, 55), "BACK", self.return_callback))
-    def toggle_music(self):
-        GAME_SETTINGS['music_on'] = not GAME_SETTINGS['music_on']
-        update_background_music()
-        self.create_buttons()
-    def toggle_sfx(self):
-        GAME_SETTINGS['sfx_on'] = not GAME_SETTINGS['sfx_on']
-        self.create_buttons()
-    def increase_volume(self):
-        GAME_SETTINGS['volume'] = min(1.0, GAME_SETTINGS['volume'] + 0.1)
-        update_background_music()
-    def decrease_volume(self):
-        GAME_SETTINGS['volume'] = max(0.0, GAME_SETTINGS['volume'] - 0.1)
-        update_background_music()
-    def handle_event(self, ev):
-        for b in self.buttons:
-            b.handle_event(ev)
-    def draw(self, surf):
-        if WALLPAPER_IMG:
-            surf.blit(WALLPAPER_IMG, (0, 0))
-        else:
-            surf.fill(BG_COLOR)
-        title = FONT_XL.render("AUDIO SETTINGS", True, TEXT_WHITE)
-        surf.blit(title, (SCREEN_W // 2 - title.get_width() // 2, 80))
-        for b in self.buttons:
-            b.draw(surf)
-        vol_percent = int(GAME_SETTINGS['volume'] * 100)
-        vol_text = FONT_M.render(f"Volume: {vol_percent}%", True, TEXT_WHITE)
-        center_x = SCREEN_W // 2
-        vol_y = 200 + (55 + 20) * 2 + 15
-        surf.blit(vol_text, (center_x - vol_text.get_width() // 2, vol_y))
-
-# Name Input Screen (for PvP)
-class NameInputScreen:
-    def __init__(self, start_game_callback, quit_callback):
-        self.start_game = start_game_callback
-        self.quit_callback = quit_callback
-        self.p1_input = ""
-        self.p2_input = ""
-        self.active_field = 1
-        self.max_chars = 10
-        center_x = SCREEN_W // 2
-        self.input_rects = {
-            1: pygame.Rect(center_x - 300, 200, 600, 50),
-            2: pygame.Rect(center_x - 300, 350, 600, 50)
-        }
-        self.start_button = Button((center_x - 100, 500, 200, 60), "GO!", self.on_start, FONT_L)
-        self.back_button = Button((20, 20, 100, 40), "BACK", self.quit_callback, FONT_S)
-    def on_start(self):
-        global PLAYER_NAMES
-        name1 = self.p1_input.strip() or "PLAYER 1"
-        name2 = self.p2_input.strip() or "PLAYER 2"
-        PLAYER_NAMES["left"] = name1.upper()
-        PLAYER_NAMES["right"] = name2.upper()
-        self.start_game()
-    def handle_event(self, ev):
-        self.start_button.handle_event(ev)
-        self.back_button.handle_event(ev)
-        if ev.type == pygame.MOUSEBUTTONDOWN:
-            if self.input_rects[1].collidepoint(ev.pos):
-                self.active_field = 1
-            elif self.input_rects[2].collidepoint(ev.pos):
-                self.active_field = 2
-        if ev.type == pygame.KEYDOWN:
-            current_input = self.p1_input if self.active_field == 1 else self.p2_input
-            if ev.key == pygame.K_RETURN:
-                if self.active_field == 1:
-                    self.active_field = 2
-                elif self.active_field == 2 and (self.p1_input or self.p2_input):
-                    self.on_start()
-            elif ev.key == pygame.K_BACKSPACE:
-                current_input = current_input[:-1]
-            elif len(current_input) < self.max_chars and (ev.unicode.isalnum() or ev.key == pygame.K_SPACE):
-                current_input += ev.unicode.upper()
-            if self.active_field == 1:
-                self.p1_input = current_input
-            else:
-                self.p2_input = current_input
-    def draw(self, surf):
-        if WALLPAPER_IMG:
-            surf.blit(WALLPAPER_IMG, (0, 0))
-        else:
-            surf.fill(BG_COLOR)
-        title = FONT_XL.render("ENTER NAMES", True, TEXT_WHITE)
-        surf.blit(title, (SCREEN_W // 2 - title.get_width() // 2, 100))
-        for i in [1, 2]:
-            rect = self.input_rects[i]
-            input_text = self.p1_input if i == 1 else self.p2_input
-            label = FONT_L.render(f"PLAYER {i}:", True, TEXT_WHITE)
-            surf.blit(label, (rect.x, rect.y - 40))
-            pygame.draw.rect(surf, (255, 255, 255), rect, border_radius=5)
-            border_col = COLOR_P1 if self.active_field == i else WOOD_BORDER
-            pygame.draw.rect(surf, border_col, rect, 3, border_radius=5)
-            text_surface = FONT_L.render(input_text, True, TEXT_BROWN)
-            surf.blit(text_surface, (rect.x + 10, rect.y + 10))
-        self.start_button.draw(surf)
-        self.back_button.draw(surf)
-
-# Leaderboard Screen 
-class LeaderboardScreen:
-    def __init__(self, return_callback, quit_callback):
-        self.return_callback = return_callback
-        self.current_mode = 'PvBot'
-        self.current_difficulty = 'EASY'
-        self.leaderboard_data = load_leaderboard(self.current_mode)
-        self.create_buttons()
-    def create_buttons(self):
-        btn_w = 120
-        btn_h = 35
-        gap = 20
-        total_width = 2 * btn_w + gap
-        center_x = SCREEN_W // 2
-        start_x = center_x - total_width // 2
-        self.buttons = [
-            Button((start_x, 20, btn_w, btn_h), "PvBOT", lambda: self.set_mode('PvBOT'), FONT_S),
-            Button((start_x + btn_w + gap, 20, btn_w, btn_h), "PvP", lambda: self.set_mode('PvP'), FONT_S),
-            Button((center_x - 200, 60, btn_w, btn_h), "EASY", lambda: self.set_difficulty('EASY')),
-            Button((center_x - 60, 60, btn_w, btn_h), "MEDIUM", lambda: self.set_difficulty('MID')),
-            Button((center_x + 80, 60, btn_w, btn_h), "HARD", lambda: self.set_difficulty('HARD')),
-            Button((20, 20, 100, 40), "BACK", self.return_callback, FONT_S)
-        ]
-    def set_mode(self, mode):
-        self.current_mode = mode
-        self.leaderboard_data = load_leaderboard(self.current_mode)
-    def set_difficulty(self, diff):
-        self.current_difficulty = diff
-        self.leaderboard_data = load_leaderboard(self.current_mode)
-    def handle_event(self, ev):
-        for b in self.buttons:
-            b.handle_event(ev)
-    def draw(self, surf):
-        if WALLPAPER_IMG:
-            surf.blit(WALLPAPER_IMG, (0, 0))
-        else:
-            surf.fill(BG_COLOR)
-        for b in self.buttons:
-            b.draw(surf)
-            if b.text == self.current_difficulty or (b.text == "MEDIUM" and self.current_difficulty == 'MID'):
-                pygame.draw.rect(surf, (255, 255, 200), b.rect.inflate(4, 4), 3, border_radius=6)
-        table_rect = pygame.Rect(100, 110, SCREEN_W - 200, SCREEN_H - 150)
-        pygame.draw.rect(surf, (0, 0, 0, 150), table_rect, border_radius=10)
-        scores = self.leaderboard_data.get(self.current_difficulty, [])
-        header_font = FONT_L
-        y_pos = 130
-        surf.blit(header_font.render("RANK", True, TEXT_WHITE), (130, y_pos))
-        surf.blit(header_font.render("NAME", True, TEXT_WHITE), (280, y_pos))
-        surf.blit(header_font.render("TIME (s)", True, TEXT_WHITE), (580, y_pos))
-        surf.blit(header_font.render("DATE", True, TEXT_WHITE), (780, y_pos))
-        if self.current_mode == 'PvP':
-            surf.blit(header_font.render("WINNER", True, TEXT_WHITE), (1000, y_pos))
-        pygame.draw.line(surf, TEXT_WHITE, (120, y_pos + 40), (SCREEN_W - 120, y_pos + 40), 2)
-        score_font = FONT_M
-        y_start = 180
-        if not scores:
-            no_score = FONT_L.render("NO SCORES YET", True, (200, 200, 200))
-            surf.blit(no_score, (SCREEN_W // 2 - no_score.get_width() // 2, y_start))
-            return
-        for i, score in enumerate(scores):
-            y = y_start + i * 45
-            if y > SCREEN_H - 50:
-                break
-            surf.blit(score_font.render(str(i + 1), True, TEXT_WHITE), (140, y))
-            surf.blit(score_font.render(score.get('name', 'N/A'), True, TEXT_WHITE), (280, y))
-            time_val = score.get('time')
-            time_text = f"{time_val:.2f}" if time_val is not None else "N/A"
-            surf.blit(score_font.render(time_text, True, TEXT_WHITE), (580, y))
-            surf.blit(score_font.render(score['date'].split(' ')[0], True, TEXT_WHITE), (780, y))
-            if self.current_mode == 'PvP':
-                winner = score.get('winner', '—')
-                win_color = COLOR_P1 if winner == score.get('name') else TEXT_WHITE
-                surf.blit(score_font.render(winner, True, win_color), (1000, y))
-
-# In-game settings panel (adjust target, exit, etc.) 
-class GameplaySettingsPanel:
-    def __init__(self, game_instance, quit_callback):
-        self.game = game_instance
-        self.quit_callback = quit_callback
-        self.is_visible = False
-        self.create_buttons()
-    def create_buttons(self):
-        def increase_target():
-            global TARGET_PULL
-            TARGET_PULL = min(20, TARGET_PULL + 1)
-            self.game.check_winner()
-        def decrease_target():
-            global TARGET_PULL
-            TARGET_PULL = max(3, TARGET_PULL - 1)
-            self.game.check_winner()
-        start_x = SCREEN_W - 245
-        self.buttons = [
-            Button((start_x, 120, 95, 36), "Target -", decrease_target, FONT_S),
-            Button((start_x + 100, 120, 95, 36), "Target +", increase_target, FONT_S),
-            Button((start_x, 170, 200, 30), "BACK TO MENU", self.quit_callback, FONT_S),
-            Button((start_x, 208, 200, 30), "EXIT APP", terminate_program, FONT_S)
-        ]
-    def handle_event(self, ev):
-        if self.is_visible:
-            for b in self.buttons:
-                b.handle_event(ev)
-    def draw(self, surf):
-        if self.is_visible:
-            if not self.buttons:
-                return
-            button_y_top = min(b.rect.y for b in self.buttons)
-            button_y_bottom = max(b.rect.y + b.rect.height for b in self.buttons)
-            padding_top = 10
-            padding_bottom = 10
-            panel_height = button_y_bottom - button_y_top + padding_top + padding_bottom
-            panel_x = SCREEN_W - 260
-            panel_y = button_y_top - padding_top
-            panel_rect = pygame.Rect(panel_x, panel_y, 230, panel_height)
-            pygame.draw.rect(surf, (240, 240, 240), panel_rect, border_radius=10)
-
-            pygame.draw.rect(surf, WOOD_BORDER, panel_rect, 3, border_radius=10)
-            for b in self.buttons:
-                b.draw(surf)
-
-# Main Game Logic
-class Game:
-    def __init__(self, difficulty, mode, quit_callback):
-        self.q_start_time = 0
-        self.position = 0
-        self.difficulty = difficulty
-        self.mode = mode
-        self.left = PlayerState('left')
-        self.right = PlayerState('right')
-        self.left_label = PLAYER_NAMES["left"]
-        self.right_label = PLAYER_NAMES["right"] if mode == 'PvP' else 'BOT'
-        self.quit_callback = quit_callback
-        self.bot_active = (mode == 'PvBot')
-        self.countdown_active = True
-        self.countdown_start_time = pygame.time.get_ticks()
-        self.question_text = ""
-        self.correct_answer = ""
-        self.game_start_time = 0
-        self.winner = None
-        self.game_over_reason = None
-        play_sfx(SOUND_COUNTDOWN)
-        self.timer_paused = False
-        self.pause_start_time = 0
-        self.paused_remaining_time = None  
-        self.create_keypads()
-        self.generate_question()
-        self.settings_panel = GameplaySettingsPanel(self, self.quit_callback)
-        right_label_x = SCREEN_W - 220
-        self.reset_button = Button((right_label_x, 70, 100, 35), "Reset", self.reset_game_from_button, FONT_S)
-        self.settings_button = Button((right_label_x + 110, 70, 50, 35), "Opt", self.toggle_settings, FONT_S)
-
-    def reset_game_from_button(self):
-        self.position = 0
-        self.left = PlayerState('left')
-        self.right = PlayerState('right')
-        self.winner = None
-        self.game_over_reason = None
-        self.countdown_active = True
-        self.countdown_start_time = pygame.time.get_ticks()
-        self.game_start_time = 0
-        play_sfx(SOUND_COUNTDOWN)
-        self.generate_question()
-
-    def toggle_settings(self):
-        self.settings_panel.is_visible = not self.settings_panel.is_visible
-        now = pygame.time.get_ticks()
-        if self.settings_panel.is_visible:
-            if self.q_start_time > 0 and not self.timer_paused:
-                elapsed = now - self.q_start_time
-                self.paused_remaining_time = self.time_limit - elapsed  
-                self.timer_paused = True
-        else:
-            if self.timer_paused and self.q_start_time > 0:
-                self.q_start_time = now - (self.time_limit - self.paused_remaining_time)
-                self.timer_paused = False
-                self.paused_remaining_time = None
-
-    def set_bot_answer_time(self):
-        base_time = TIME_PER_QUESTION * 1000
-        if self.difficulty == 'HARD':
-            delay_start = random.randint(int(0.2 * base_time), int(0.4 * base_time))
-            self.bot_typing_delay = random.randint(100, 200)
-        elif self.difficulty == 'MID':
-            delay_start = random.randint(int(0.4 * base_time), int(0.7 * base_time))
-            self.bot_typing_delay = random.randint(200, 350)
-        else:
-            delay_start = random.randint(int(0.6 * base_time), int(0.9 * base_time))
-            self.bot_typing_delay = random.randint(350, 500)
-        self.bot_answer_time = self.q_start_time + delay_start
-        self.bot_answer_string = str(self.correct_answer)
-        self.bot_char_index = 0
-
-    def create_keypads(self):
-        pad_w, pad_h = 180, 220
-        left_x = 40
-        right_x = SCREEN_W - pad_w - 150
-        y0 = SCREEN_H - pad_h - 30
-        self.buttons = []
-        def make_num_callback(player, digit):
-            return lambda: self.on_digit(player, str(digit))
-        for side, x in [('left', left_x), ('right', right_x)]:
-            if side == 'right' and self.mode == 'PvBot':
-                continue
-            digits = [('7', 7), ('8', 8), ('9', 9), ('/', '/'), ('4', 4), ('5', 5), ('6', 6), ('C', 'C'),
-                      ('1', 1), ('2', 2), ('3', 3), ('.', '.')]
-            col = 0
-            row = 0
-            btn_w = 52
-            btn_h = 48
-            spacing = 6
-            for i, (label, value) in enumerate(digits):
-                bx = x + col * (btn_w + spacing)
-                by = y0 + row * (btn_h + spacing)
-                def make_cb(val=value, sd=side):
-                    if val == 'C':
-                        return lambda: self.clear_input(sd)
-                    elif val == '.':
-                        return lambda: self.on_decimal(sd)
-                    elif val == '/':
-                        return lambda: self.on_digit(sd, '/')
-                    else:
-                        return make_num_callback(sd, val)
-                self.buttons.append(Button((bx, by, btn_w, btn_h), str(label), make_cb(), FONT_M))
-                col += 1
-                if col > 3:
-                    col = 0
-                    row += 1
-            ok_x = x + 2 * (btn_w + spacing)
-            ok_y = y0 + 3 * (btn_h + spacing)
-            self.buttons.append(Button((ok_x, ok_y, btn_w * 2 + spacing, btn_h), "ENTER", lambda s=side: self.submit_input(s), FONT_S))
-
-    def generate_question(self):
-        self.question_text, self.correct_answer = generate_mixed_question(self.difficulty)
-        self.q_start_time = pygame.time.get_ticks()
-        self.time_limit = TIME_PER_QUESTION * 1000
-        self.left.reset_input()
-        self.right.reset_input()
-        if self.bot_active and not self.countdown_active:
-            self.set_bot_answer_time()
-
-    def on_digit(self, side, digit_char):
-        p = self.left if side == 'left' else self.right
-        if len(p.current_input) >= 6:
-            return
-        p.current_input += digit_char
-
-    def on_decimal(self, side):
-        p = self.left if side == 'left' else self.right
-        if '.' not in p.current_input:
-            p.current_input += '.'
-
-    def clear_input(self, side):
-        (self.left if side == 'left' else self.right).reset_input()
-
-    def submit_input(self, side, is_bot=False):
-        p = self.left if side == 'left' else self.right
-        if not is_bot and p.current_input == "":
-            return
-        input_val = p.current_input
-        correct_val = self.correct_answer
-        is_correct = False
-        try:
-            if '/' in correct_val:
-                correct_frac = Fraction(correct_val)
-                try:
-                    user_frac = Fraction(input_val).limit_denominator()
-                    if user_frac == correct_frac:
-                        is_correct = True
-                except:
-                    try:
-                        if abs(float(input_val) - float(correct_frac)) < 0.001:
-                            is_correct = True
-                    except:
-                        pass
-            else:
-                try:
-                    if abs(float(input_val) - float(correct_val)) < 0.001:
-                        is_correct = True
-                except:
-                    pass
-        except:
-            pass
-        if is_correct:
-            move_amount = 1
-            if side == 'left':
-                self.position -= move_amount
-            else:
-                self.position += move_amount
-            p.correct_count += 1
-            play_sfx(SOUND_CORRECT)
-            if self.bot_active:
-                self.bot_answer_string = ""
-                self.bot_char_index = 0
-                self.right.reset_input()
-            if abs(self.position) >= TARGET_PULL:
-                self.check_winner()
-                return
-            self.generate_question()
-        else:
-            if not is_bot:
-                play_sfx(SOUND_WRONG)
-                p.reset_input()
-        self.check_winner()
-
-    def check_winner(self):
-        if self.settings_panel.is_visible:
-            return
-        if abs(self.position) >= TARGET_PULL:
-            self.winner = self.left_label if self.position <= -TARGET_PULL else self.right_label
-            session_time = (pygame.time.get_ticks() - self.game_start_time) if self.game_start_time else 0
-            if self.mode == 'PvBot':
-                if self.winner == self.left_label:
-                    self.game_over_reason = 'win'
-                    add_score(self.left_label, session_time, self.difficulty, mode='PvBot')
-                    play_win_sound()
-                    if hasattr(self, 'show_game_over_callback'):
-                        self.show_game_over_callback('win')
-                else:
-                    self.game_over_reason = 'lose'
-                    play_lose_sound()
-                    if hasattr(self, 'show_game_over_callback'):
-                        self.show_game_over_callback('lose')
-            else:
-                add_score(self.left_label, session_time, self.difficulty,
-                          mode='PvP', winner_name=self.winner)
-                add_score(self.right_label, session_time, self.difficulty,
-                          mode='PvP', winner_name=self.winner)
-                play_win_sound()
-                if hasattr(self, 'show_game_over_callback'):
-                    self.show_game_over_callback(
-                        self.left_label, self.right_label,
-                        self.left.correct_count, self.right.correct_count
-                    )
-
-    def update(self, dt):
-        now = pygame.time.get_ticks()
-        if self.settings_panel.is_visible or self.winner:
-            return
-        if self.countdown_active:
-            if now - self.countdown_start_time > 3500:
-                self.countdown_active = False
-                self.q_start_time = now
-                self.game_start_time = now
-                if self.bot_active:
-                    self.set_bot_answer_time()
-            return
-        if self.bot_active:
-            if (self.bot_char_index < len(self.bot_answer_string) and
-                now >= self.bot_answer_time):
-                char = self.bot_answer_string[self.bot_char_index]
-                self.right.current_input += char
-                self.bot_char_index += 1
-                self.bot_answer_time = now + self.bot_typing_delay
-            elif (self.bot_char_index > 0 and
-                  self.bot_char_index == len(self.bot_answer_string)):
-                self.submit_input('right', is_bot=True)
-        if (self.mode == 'PvP' and
-            self.q_start_time > 0 and
-            now - self.q_start_time > self.time_limit):
-            play_sfx(SOUND_TIMEOUT)
-            if self.position >= 0:
-                self.position -= 1
-            else:
-                self.position += 1
-            self.generate_question()
-            self.check_winner()
-
-    def draw(self, surf):
-        if INGAME_WALLPAPER_IMG:
-            surf.blit(INGAME_WALLPAPER_IMG, (0, 0))
-        else:
-            draw_grid_background(surf)
-        mid_x = SCREEN_W // 2
-        rope_y = SCREEN_H // 2 - 10
-        if not self.countdown_active:
-            left_label = FONT_L.render(self.left_label, True, COLOR_P1)
-            right_label = FONT_L.render(self.right_label, True, COLOR_P2)
-            surf.blit(left_label, (60, 20))
-            surf.blit(right_label, (SCREEN_W - 60 - right_label.get_width(), 20))
-            score_txt = f"{self.left.correct_count} - {self.right.correct_count}"
-            score_s = FONT_XL.render(score_txt, True, (0, 0, 0))
-            score_m = FONT_XL.render(score_txt, True, TEXT_WHITE)
-            s_x = mid_x - score_m.get_width() // 2
-            s_y = 20
-            surf.blit(score_s, (s_x + 3, s_y + 3))
-            surf.blit(score_m, (s_x, s_y))
-            qtxt_main = FONT_XL.render(self.question_text, True, (0, 0, 0))
-            surf.blit(qtxt_main, (SCREEN_W // 2 - qtxt_main.get_width() // 2 + 2, 182))
-            qtxt_main = FONT_XL.render(self.question_text, True, TEXT_WHITE)
-            surf.blit(qtxt_main, (SCREEN_W // 2 - qtxt_main.get_width() // 2, 180))
-            for b in self.buttons:
-                b.draw(surf)
-            self.reset_button.draw(surf)
-            self.settings_button.draw(surf)
-            left_inp_txt = FONT_L.render(self.left.current_input or "0", True, TEXT_BROWN)
-            right_inp_txt = FONT_L.render(self.right.current_input or "0", True, TEXT_BROWN)
-            surf.blit(left_inp_txt, (60, SCREEN_H - 290))
-            surf.blit(right_inp_txt, (SCREEN_W - 160, SCREEN_H - 290))
-            if self.q_start_time > 0:
-                if self.timer_paused and self.paused_remaining_time is not None:
-                    rem = max(0, int(self.paused_remaining_time / 1000))
-                else:
-                    elapsed = pygame.time.get_ticks() - self.q_start_time
-                    rem = max(0, int((self.time_limit - elapsed) / 1000))
-            else:
-                rem = TIME_PER_QUESTION
-            timer_txt = FONT_M.render(f"Time: {rem}s", True, COLOR_P2 if rem <= 5 else TEXT_BROWN)
-            surf.blit(timer_txt, (SCREEN_W // 2 - timer_txt.get_width() // 2, SCREEN_H - 320))
-        rope_center_x = SCREEN_W // 2 + int(self.position * 18)
-        if ROPE_IMG:
-            rope_rect = ROPE_IMG.get_rect()
-            rope_rect.center = (rope_center_x, rope_y)
-            surf.blit(ROPE_IMG, rope_rect)
-        else:
-            pygame.draw.line(surf, (150, 100, 50), (0, rope_y), (SCREEN_W, rope_y), 10)
-            pygame.draw.circle(surf, COLOR_ROPE_DETAIL, (rope_center_x, rope_y), 15)
-        if INDICATOR_IMG:
-            ind_rect = INDICATOR_IMG.get_rect()
-            ind_rect.center = (rope_center_x, rope_y)
-            surf.blit(INDICATOR_IMG, ind_rect)
-        if TARGET_LINE_IMG:
-            offset_dist = TARGET_PULL * 18
-            img_width = TARGET_LINE_IMG.get_width()
-            img_height = TARGET_LINE_IMG.get_height()
-            target_y = rope_y - (img_height // 2)
-            surf.blit(TARGET_LINE_IMG, (mid_x - offset_dist - (img_width // 2), target_y))
-            surf.blit(TARGET_LINE_IMG, (mid_x + offset_dist - (img_width // 2), target_y))
-        else:
-            pygame.draw.line(surf, COLOR_P1, (mid_x - TARGET_PULL * 18, 0), (mid_x - TARGET_PULL * 18, SCREEN_H), 4)
-            pygame.draw.line(surf, COLOR_P2, (mid_x + TARGET_PULL * 18, 0), (mid_x + TARGET_PULL * 18, SCREEN_H), 4)
-        if PLAYER_LEFT_IMG:
-            left_char_x = 60
-            left_char_y = rope_y - (PLAYER_LEFT_IMG.get_height() // 2) - 30
-            surf.blit(PLAYER_LEFT_IMG, (left_char_x, left_char_y))
-        else:
-            pygame.draw.ellipse(surf, COLOR_P1, (20, rope_y - 40, 80, 80))
-        if PLAYER_RIGHT_IMG:
-            right_char_x = SCREEN_W - 60 - PLAYER_RIGHT_IMG.get_width()
-            right_char_y = rope_y - (PLAYER_RIGHT_IMG.get_height() // 2) - 30
-            surf.blit(PLAYER_RIGHT_IMG, (right_char_x, right_char_y))
-        else:
-            pygame.draw.ellipse(surf, COLOR_P2, (SCREEN_W - 100, rope_y - 40, 80, 80))
-        self.settings_panel.draw(surf)
-        if self.countdown_active:
-            overlay = pygame.Surface((SCREEN_W, SCREEN_H), pygame.SRCALPHA)
-            overlay.fill(BLACK_TRANSPARENT)
-            surf.blit(overlay, (0, 0))
-            now = pygame.time.get_ticks()
-            elapsed = now - self.countdown_start_time
-            seconds = 3 - int(elapsed / 1000)
-            if seconds > 0:
-                text = str(seconds)
-                col = (255, 255, 255)
-            elif elapsed < 3500:
-                text = "GO!"
-                col = COLOR_P1
-            else:
-                text = ""
-            if text:
-                cd_txt = FONT_XL.render(text, True, col)
-                scale_factor = 3 if seconds > 0 else 4
-                cd_txt_large = pygame.transform.scale(cd_txt, (cd_txt.get_width() * scale_factor, cd_txt.get_height() * scale_factor))
-                surf.blit(cd_txt_large, (SCREEN_W // 2 - cd_txt_large.get_width() // 2, SCREEN_H // 2 - cd_txt_large.get_height() // 2))
-        if self.winner:
-            overlay = pygame.Surface((SCREEN_W, SCREEN_H), pygame.SRCALPHA)
-            overlay.fill(BLACK_TRANSPARENT)
-            surf.blit(overlay, (0, 0))
-            if self.game_over_reason == 'lose':
-                msg_txt = "YOU LOSE!"
-                col = COLOR_P2
-            else:
-                msg_txt = f"{self.winner} WINS!"
-                col = COLOR_P1
-            win_txt = FONT_XL.render(msg_txt, True, col)
-            surf.blit(win_txt, (SCREEN_W // 2 - win_txt.get_width() // 2, SCREEN_H // 2 - 60))
-            rst_txt = FONT_M.render("Press Reset to play again", True, TEXT_WHITE)
-            surf.blit(rst_txt, (SCREEN_W // 2 - rst_txt.get_width() // 2, SCREEN_H // 2 + 20))
-
-# Game Over Screen
-class GameOverScreen:
-    def __init__(self, reason, player_name=None, p1_name=None, p2_name=None, p1_score=0, p2_score=0, return_callback=None):
-        self.reason = reason
-        self.player_name = player_name
-        self.p1_name = p1_name
-        self.p2_name = p2_name
-        self.p1_score = p1_score
-        self.p2_score = p2_score
-        self.return_callback = return_callback
-        center_x = SCREEN_W // 2
-        self.back_button = Button((center_x - 120, SCREEN_H - 160, 240, 55), "MAIN MENU", return_callback, FONT_L)
-    def handle_event(self, ev):
-        self.back_button.handle_event(ev)
-    def draw(self, surf):
-        if WALLPAPER_IMG:
-            surf.blit(WALLPAPER_IMG, (0, 0))
-        else:
-            surf.fill(BG_COLOR)
-        overlay = pygame.Surface((SCREEN_W, SCREEN_H), pygame.SRCALPHA)
-        overlay.fill(BLACK_TRANSPARENT)
-        surf.blit(overlay, (0, 0))
-        if self.reason == 'lose':  
-            title = FONT_XL.render("GAME OVER", True, COLOR_P2)
-            subtitle = FONT_L.render("The BOT was faster!", True, TEXT_WHITE)
-            surf.blit(title, (SCREEN_W // 2 - title.get_width() // 2, 150))
-            surf.blit(subtitle, (SCREEN_W // 2 - subtitle.get_width() // 2, 230))
-        elif self.reason == 'pvp':  
-            trophy = FONT_XL.render("WINNER!", True, (255, 215, 0))
-            surf.blit(trophy, (SCREEN_W // 2 - trophy.get_width() // 2, 120))
-            winner_name = self.p1_name if self.p1_score > self.p2_score else self.p2_name
-            win_txt = FONT_XL.render(winner_name, True, COLOR_P1)
-            win_shadow = FONT_XL.render(winner_name, True, (0, 0, 0))
-            surf.blit(win_shadow, (SCREEN_W // 2 - win_txt.get_width() // 2 + 3, 200 + 3))
-            surf.blit(win_txt, (SCREEN_W // 2 - win_txt.get_width() // 2, 200))
-            subtitle = FONT_L.render("WINS THE TUG OF WAR!", True, TEXT_WHITE)
-            surf.blit(subtitle, (SCREEN_W // 2 - subtitle.get_width() // 2, 280))
-            score_str = f"{self.p1_score} – {self.p2_score}"
-            score_txt = FONT_L.render(score_str, True, TEXT_WHITE)
-            surf.blit(score_txt, (SCREEN_W // 2 - score_txt.get_width() // 2, 350))
-            label = FONT_S.render("Final Score", True, (200, 200, 200))
-            surf.blit(label, (SCREEN_W // 2 - label.get_width() // 2, 390))
-        self.back_button.draw(surf)
-
-# Main loop 
-def main():
-    screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-    pygame.display.set_caption("Math Tug of War - Ultimate")
-    clock = pygame.time.Clock()
-    current_state = STATE_MAIN_MENU
-    game_instance = None
-    name_input_screen = None
-    leaderboard_screen = None
-    game_over_screen = None
-    audio_settings_screen = None
-
-    def quit_to_menu():
-        nonlocal current_state, game_instance, leaderboard_screen, game_over_screen, audio_settings_screen
-        current_state = STATE_MAIN_MENU
-        game_instance = None
-        leaderboard_screen = None
-        game_over_screen = None
-        audio_settings_screen = None
-        restart_bg_music()
-
-    def show_leaderboard():
-        nonlocal current_state, leaderboard_screen
-        leaderboard_screen = LeaderboardScreen(quit_to_menu, terminate_program)
-        current_state = STATE_LEADERBOARD
-
-    def show_audio_settings():
-        nonlocal current_state, audio_settings_screen
-        audio_settings_screen = AudioSettingsScreen(quit_to_menu)
-        current_state = STATE_AUDIO_SETTINGS
-
-    def start_game_play_callback():
-        nonlocal current_state, game_instance
-        if GAME_MODE == 'PvBot':
-            def pvbot_game_over(reason):
-                nonlocal current_state, game_over_screen
-                if reason == 'win':
-                    game_over_screen = GameOverScreen(
-                        reason='pvp',
-                        p1_name=PLAYER_NAMES["left"],
-                        p2_name="BOT",
-                        p1_score=game_instance.left.correct_count,
-                        p2_score=game_instance.right.correct_count,
-                        return_callback=quit_to_menu
-                    )
-                else:
-                    game_over_screen = GameOverScreen(
-                        reason='lose',
-                        player_name=PLAYER_NAMES["left"],
-                        return_callback=quit_to_menu
-                    )
-                current_state = STATE_GAME_OVER
-            game_instance = Game(DIFFICULTY, GAME_MODE, quit_to_menu)
-            game_instance.show_game_over_callback = pvbot_game_over
-        else:
-            game_instance = Game(DIFFICULTY, GAME_MODE, quit_to_menu)
-            game_instance.show_game_over_callback = show_game_over_pvp
-        current_state = STATE_GAME_PLAY
-
-    def show_game_over_pvp(p1_name, p2_name, p1_score, p2_score):
-        nonlocal current_state, game_over_screen
-        game_over_screen = GameOverScreen(
-            reason='pvp',
-            p1_name=p1_name, p2_name=p2_name,
-            p1_score=p1_score, p2_score=p2_score,
-            return_callback=quit_to_menu
-        )
-        current_state = STATE_GAME_OVER
-
-    def start_game_callback():
-        nonlocal current_state, name_input_screen
-        if GAME_MODE == 'PvP':
-            name_input_screen = NameInputScreen(start_game_play_callback, quit_to_menu)
-            current_state = STATE_NAME_INPUT
-        else:
-            PLAYER_NAMES["left"] = "YOU"
-            PLAYER_NAMES["right"] = "BOT"
-            start_game_play_callback()
-
-    main_menu = MainMenu(start_game_callback, show_leaderboard, show_audio_settings)
-    running = True
-    while running:
-        dt = clock.tick(FPS)
-        for ev in pygame.event.get():
-            if ev.type == pygame.QUIT:
-                terminate_program()
-            if ev.type == pygame.KEYDOWN and (ev.key == pygame.K_RETURN and ev.mod & pygame.KMOD_ALT):
-                pygame.display.toggle_fullscreen()
-            if current_state == STATE_MAIN_MENU:
-                main_menu.handle_event(ev)
-            elif current_state == STATE_AUDIO_SETTINGS:
-                audio_settings_screen.handle_event(ev)
-            elif current_state == STATE_NAME_INPUT:
-                name_input_screen.handle_event(ev)
-            elif current_state == STATE_GAME_PLAY:
-                if game_instance.countdown_active:
-                    continue
-                if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
-                    if game_instance.reset_button.rect.collidepoint(ev.pos):
-                        play_sfx(SOUND_CLICK)
-                        game_instance.reset_game_from_button()
-                        continue
-                    if game_instance.settings_button.rect.collidepoint(ev.pos):
-                        play_sfx(SOUND_CLICK)
-                        game_instance.toggle_settings()
-                        continue
-                    if game_instance.settings_panel.is_visible:
-                        game_instance.settings_panel.handle_event(ev)
-                        continue
-                if not game_instance.settings_panel.is_visible:
-                    for b in game_instance.buttons:
-                        b.handle_event(ev)
-                    if ev.type == pygame.KEYDOWN:
-                        if ev.key == pygame.K_ESCAPE:
-                            quit_to_menu()
-                            continue
-                        if ev.key in [pygame.K_RETURN, pygame.K_KP_ENTER]:
-                            game_instance.submit_input('left')
-                        elif ev.key == pygame.K_BACKSPACE:
-                            game_instance.left.current_input = game_instance.left.current_input[:-1]
-                        elif ev.unicode.isalnum() or ev.unicode in ['.', '/']:
-                            if ev.unicode == '.':
-                                game_instance.on_decimal('left')
-                            elif ev.unicode == '/':
-                                game_instance.on_digit('left', ev.unicode)
-                            else:
-                                game_instance.on_digit('left', ev.unicode)
-            elif current_state == STATE_LEADERBOARD:
-                leaderboard_screen.handle_event(ev)
-            elif current_state == STATE_GAME_OVER:
-                game_over_screen.handle_event(ev)
-
-        if current_state == STATE_MAIN_MENU:
-            main_menu.draw(screen)
-        elif current_state == STATE_AUDIO_SETTINGS:
-            audio_settings_screen.draw(screen)
-        elif current_state == STATE_NAME_INPUT:
-            name_input_screen.draw(screen)
-        elif current_state == STATE_GAME_PLAY:
-            if game_instance:
-                game_instance.update(dt)
-                game_instance.draw(screen)
-        elif current_state == STATE_LEADERBOARD:
-            if leaderboard_screen:
-                leaderboard_screen.draw(screen)
-        elif current_state == STATE_GAME_OVER:
-            if game_over_screen:
-                game_over_screen.draw(screen)
-
-        pygame.display.flip()
-
-    terminate_program()
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import pygame
+import random
+import sys
+import operator
+from fractions import Fraction
+import json
+import os
+import time
+import argparse
+import asyncio
+import bisect
+import heapq
+import io
+import itertools
+import math
+import mmap
+import multiprocessing
+import queue
+import socket
+import threading
+import zlib
+import struct
+import shlex
+import signal
+import subprocess
+import tempfile
+import py_compile
+import zipapp
+import zipfile
+from collections import deque
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Utility: Terminate program cleanly 
+def terminate_program():
+    if TELEMETRY:
+        TELEMETRY.close()
+    if RATINGS.loaded:
+        PIPELINE.submit(RATINGS.save)
+    PIPELINE.shutdown()
+    for recorder in list(ACTIVE_RECORDERS):
+        recorder.close()
+    pygame.quit()
+    sys.exit()
+
+# Headless runs (replay verification, video export) need no window or audio device
+HEADLESS_FLAGS = ('--verify-replay', '--export-replay', '--serve', '--net-test', '--load-test', '--rebuild-ratings',
+                  '--build-bundle')
+if any(flag in sys.argv for flag in HEADLESS_FLAGS):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+# Initialize Pygame and audio mixer
+pygame.init()
+pygame.mixer.init()
+
+# Screen and performance config. By default every screen is laid out and drawn
+# at a fixed logical resolution and scaled to the display once per frame, so
+# frame cost does not grow with the monitor; --native draws at display size.
+info = pygame.display.Info()
+DISPLAY_W, DISPLAY_H = info.current_w, info.current_h
+LOGICAL_SIZE = (1920, 1080)
+RENDER_LOGICAL = '--native' not in sys.argv
+SCREEN_W, SCREEN_H = LOGICAL_SIZE if RENDER_LOGICAL else (DISPLAY_W, DISPLAY_H)
+FPS = 60
+SIM_TICK_MS = 10
+MAX_FRAME_MS = 250
+ROPE_EASE = 0.25
+IDLE_FPS = 5
+IDLE_AFTER_MS = 4000
+
+# Color palette 
+BG_COLOR = (248, 248, 242)
+GRID_COLOR = (220, 220, 220)
+WOOD_LIGHT = (233, 165, 83)
+WOOD_DARK = (210, 140, 60)
+WOOD_BORDER = (94, 44, 12)
+TEXT_BROWN = (61, 30, 11)
+TEXT_WHITE = (255, 255, 255)
+COLOR_P1 = (78, 205, 196)
+COLOR_P2 = (255, 107, 107)
+COLOR_ROPE_DETAIL = (230, 180, 100)
+BLACK_TRANSPARENT = (0, 0, 0, 180)
+
+# Game states 
+STATE_MAIN_MENU = "main_menu"
+STATE_AUDIO_SETTINGS = "audio_settings"
+STATE_NAME_INPUT = "name_input"
+STATE_GAME_PLAY = "game_play"
+STATE_LEADERBOARD = "leaderboard"
+STATE_GAME_OVER = "game_over"
+
+# Asset access. Assets and data files live next to this script, so the game
+# runs from any working directory. Inside a bundle built with --build-bundle
+# the assets come from an indexed pack stored uncompressed in the archive:
+# the archive is mapped into memory once and each asset is handed to pygame
+# as a file-like view of the mapping, without reading it into a copy first.
+# The pack also holds images already decoded and scaled, and sounds already
+# decoded to PCM, so a cold start skips PNG and MP3 decoding.
+BUNDLE_PATH = getattr(__loader__, 'archive', None)
+GAME_DIR = os.path.dirname(os.path.abspath(BUNDLE_PATH or __file__))
+BUNDLE_FILE = os.path.join('dist', 'MathTugWar.pyz')
+ASSET_PACK_NAME = 'assets.pack'
+ASSET_PACK_MAGIC = b'MTWA'
+ASSET_EXTENSIONS = ('.png', '.jpg', '.mp3', '.ogg', '.wav', '.ttf', '.otf')
+ASSET_ALIGN = 16
+# While building a bundle, decoded assets are kept so they can be packed
+RECORD_BAKED = '--build-bundle' in sys.argv
+BAKED_SURFACES = {}
+BAKED_SOUNDS = {}
+
+class AssetBuffer(io.RawIOBase):
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self.view) - self.pos))
+        b[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = (0, self.pos, len(self.view))[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+class AssetPack:
+    def __init__(self, archive):
+        with zipfile.ZipFile(archive) as z:
+            info = z.getinfo(ASSET_PACK_NAME)
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{ASSET_PACK_NAME} is compressed")
+        # Copy-on-write: baked surfaces wrap these pages, and drawing on one
+        # must copy the page rather than fault on a read-only mapping
+        with open(archive, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        name_len, extra_len = struct.unpack_from('<HH', self.map, info.header_offset + 26)
+        start = info.header_offset + 30 + name_len + extra_len
+        if self.map[start:start + 4] != ASSET_PACK_MAGIC:
+            raise ValueError(f"{ASSET_PACK_NAME} is not an asset pack")
+        index_len, = struct.unpack_from('<I', self.map, start + 4)
+        self.index = json.loads(self.map[start + 8:start + 8 + index_len])
+        self.view = memoryview(self.map)[start + align_asset(8 + index_len):start + info.file_size]
+
+    def get(self, name):
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        return self.view[entry['offset']:entry['offset'] + entry['size']]
+
+    def open(self, name):
+        view = self.get(name)
+        return None if view is None else AssetBuffer(view)
+
+def align_asset(n):
+    return -(-n // ASSET_ALIGN) * ASSET_ALIGN
+
+def open_asset_pack():
+    if BUNDLE_PATH:
+        try:
+            return AssetPack(BUNDLE_PATH)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Asset pack unavailable, using loose files: {e}")
+    return None
+
+ASSET_PACK = open_asset_pack()
+
+def asset_path(name):
+    return os.path.join(GAME_DIR, name)
+
+def asset_exists(name):
+    if ASSET_PACK:
+        return name in ASSET_PACK.index
+    return os.path.exists(asset_path(name))
+
+# A path for loose files, a file-like view into the pack in a bundle
+def open_asset(name):
+    return ASSET_PACK.open(name) if ASSET_PACK else asset_path(name)
+
+def asset_stamp(name):
+    if ASSET_PACK:
+        entry = ASSET_PACK.index[name]
+        return entry['size'], entry['mtime']
+    st = os.stat(asset_path(name))
+    return st.st_size, int(st.st_mtime)
+
+# A surface decoded from the pack as-is (the pixels stay in the mapping until
+# convert_assets() copies them into the display format), or built and recorded
+def baked_surface(key, builder):
+    entry = ASSET_PACK.index.get(key) if ASSET_PACK else None
+    if entry:
+        return pygame.image.frombuffer(ASSET_PACK.get(key), entry['shape'], entry['format'])
+    surf = builder()
+    if RECORD_BAKED and surf is not None:
+        BAKED_SURFACES[key] = surf
+    return surf
+
+# Font loading
+def get_font(size):
+    font_files = ["BoldPixels.ttf", "BoldPixels.otf", "pixel.ttf"]
+    for f in font_files:
+        if asset_exists(f):
+            try:
+                return pygame.font.Font(open_asset(f), size)
+            except:
+                pass
+    return pygame.font.SysFont("arial", size, bold=True)
+
+FONT_XL = get_font(50)
+FONT_L = get_font(30)
+FONT_M = get_font(20)
+FONT_S = get_font(16)
+
+# Load image 
+def load_image(name, scale_size=None):
+    img = pygame.image.load(open_asset(name), name)
+    if scale_size:
+        img = pygame.transform.scale(img, scale_size)
+    return img
+
+def robust_load_image(filenames, scale_size=None):
+    for name in filenames:
+        if asset_exists(name):
+            key = f"baked/{name}@{scale_size[0]}x{scale_size[1]}" if scale_size else f"baked/{name}"
+            try:
+                return baked_surface(key, lambda: load_image(name, scale_size))
+            except Exception as e:
+                print(f"Failed to load {name}: {e}")
+    return None
+
+# Load assets
+WALLPAPER_IMG = robust_load_image(["wallpaper.png", "wallpaper.jpg"], (SCREEN_W, SCREEN_H))
+INGAME_WALLPAPER_IMG = robust_load_image(["ingamewallpaper.png", "ingamewallpaper.jpg"], (SCREEN_W, SCREEN_H))
+
+# Load rope as a small repeating tile: only the opaque strip of tali.png,
+# cut to a whole number of twists so the copies line up seamlessly
+ROPE_SCALE_H = 850
+ROPE_TILE_SRC_W = 393  # 13 twists of the rope pattern in tali.png
+
+def load_rope_tile():
+    if not asset_exists("tali.png"):
+        return None, 0
+    try:
+        loaded_rope = load_image("tali.png")
+        scale = ROPE_SCALE_H / loaded_rope.get_height()
+        strip = loaded_rope.get_bounding_rect()
+        strip.width = min(strip.width, ROPE_TILE_SRC_W)
+        tile = loaded_rope.subsurface(strip)
+        tile = pygame.transform.scale(tile, (max(1, round(strip.width * scale)), max(1, round(strip.height * scale))))
+        return tile, round(strip.y * scale) - ROPE_SCALE_H // 2
+    except:
+        return None, 0
+
+ROPE_TILE, ROPE_TILE_OFFSET_Y = load_rope_tile()
+
+# Sprite atlas: gameplay sprites are packed into one surface (shelf packing,
+# tallest first) and drawn as sub-rects of it. Animation frames can be added
+# under names like "player_left/1".
+ATLAS_PADDING = 1
+
+class SpriteAtlas:
+    def __init__(self):
+        self.surface = None
+        self.index = {}
+
+    def build(self, sprites):
+        items = sorted(((name, img) for name, img in sprites.items() if img),
+                       key=lambda item: (-item[1].get_height(), -item[1].get_width()))
+        if not items:
+            return
+        area = sum((img.get_width() + ATLAS_PADDING) * (img.get_height() + ATLAS_PADDING) for _, img in items)
+        width = max(max(img.get_width() for _, img in items), int((area ** 0.5) * 1.2))
+        x = y = shelf_h = 0
+        for name, img in items:
+            w, h = img.get_size()
+            if x + w > width:
+                x = 0
+                y += shelf_h + ATLAS_PADDING
+                shelf_h = 0
+            self.index[name] = pygame.Rect(x, y, w, h)
+            x += w + ATLAS_PADDING
+            shelf_h = max(shelf_h, h)
+        self.surface = pygame.Surface((width, y + shelf_h), pygame.SRCALPHA)
+        for name, img in items:
+            self.surface.blit(img, self.index[name])
+
+    # Called once the display exists so blits need no per-pixel format conversion
+    def convert(self):
+        if self.surface:
+            self.surface = self.surface.convert_alpha()
+
+    def get(self, name):
+        return self.index.get(name)
+
+    def blit(self, surf, name, dest):
+        surf.blit(self.surface, dest, self.index[name])
+
+    # A copy of the atlas with every sprite resized (smaller kiosk viewports)
+    def scaled(self, factor):
+        atlas = SpriteAtlas()
+        if self.surface:
+            atlas.build({name: pygame.transform.smoothscale(self.surface.subsurface(rect),
+                                                           (max(1, round(rect.width * factor)),
+                                                            max(1, round(rect.height * factor))))
+                         for name, rect in self.index.items()})
+            if pygame.display.get_surface():
+                atlas.convert()
+        return atlas
+
+SPRITES = SpriteAtlas()
+SPRITES.build({
+    'target': robust_load_image(["target.png"], (60, 80)),
+    'indicator': robust_load_image(["indicator.png"], (64, 64)),
+    'player_left': robust_load_image(["character1.png", "character1.jpg"], (100, 100)),
+    'player_right': robust_load_image(["character2.png", "character2.jpg"], (100, 100)),
+    'rope': ROPE_TILE,
+})
+
+
+# Global game configuration 
+TARGET_PULL = 8
+TARGET_PULL_RANGE = (3, 20)
+TIME_PER_QUESTION = 15
+DIFFICULTY = 'MID'
+GAME_MODE = 'PvP'
+PLAYER_NAMES = {"left": "YOU", "right": "BOT"}
+MATCH_SEED = None
+RECORD_REPLAYS = True
+REPLAY_DIR = os.path.join(GAME_DIR, 'replays')
+LEADERBOARD_FILE_PVBOT = os.path.join(GAME_DIR, 'pvbot_leaderboard.json')
+LEADERBOARD_FILE_PVP = os.path.join(GAME_DIR, 'pvp_leaderboard.json')
+LEADERBOARD_LOCK = threading.Lock()
+GAME_SETTINGS = {
+    'music_on': True,
+    'sfx_on': True,
+    'volume': 0.5
+}
+
+# Sound loading 
+MUSIC_END_EVENT = pygame.USEREVENT + 1
+SOUND_CLICK = None
+SOUND_CORRECT = None
+SOUND_WRONG = None
+SOUND_COUNTDOWN = None
+SOUND_TIMEOUT = None
+SOUND_WIN = None
+SOUND_LOSE = None
+
+# Audio manager: decoded PCM is cached on disk in the mixer's own sample format,
+# and each SFX category plays on its own reserved channels. When a pool is full
+# the lowest-priority (then oldest) sound is cut instead of the new one.
+AUDIO_CACHE_DIR = os.path.join(GAME_DIR, '.audio_cache')
+SFX_POOLS = {'ui': 2, 'answer': 4, 'alert': 2, 'result': 2}
+
+class AudioManager:
+    def __init__(self):
+        self.sounds = {}
+        self.pools = {}
+        self.playing = {}
+        self.volume = None
+
+    def setup_channels(self):
+        total = sum(SFX_POOLS.values())
+        pygame.mixer.set_num_channels(max(total, pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(total)
+        index = 0
+        for category, count in SFX_POOLS.items():
+            self.pools[category] = [pygame.mixer.Channel(index + i) for i in range(count)]
+            index += count
+
+    def cache_key(self, filename):
+        freq, fmt, channels = pygame.mixer.get_init()
+        size, mtime = asset_stamp(filename)
+        return f"{os.path.splitext(filename)[0]}-{size}-{mtime}-{freq}-{fmt}-{channels}.pcm"
+
+    def decode(self, filename):
+        key = self.cache_key(filename)
+        pcm = ASSET_PACK.get('baked/' + key) if ASSET_PACK else None
+        if pcm is not None:
+            return pygame.mixer.Sound(buffer=pcm)
+        path = os.path.join(AUDIO_CACHE_DIR, key)
+        try:
+            with open(path, 'rb') as f:
+                sound = pygame.mixer.Sound(buffer=f.read())
+        except OSError:
+            sound = self.decode_file(filename, path)
+        if RECORD_BAKED:
+            BAKED_SOUNDS['baked/' + key] = sound
+        return sound
+
+    def decode_file(self, filename, path):
+        sound = pygame.mixer.Sound(open_asset(filename))
+        try:
+            os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(sound.get_raw())
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+        return sound
+
+    def load(self, filename, category, priority):
+        if not asset_exists(filename):
+            return None
+        sound = self.decode(filename)
+        self.sounds[sound] = (category, priority)
+        return sound
+
+    def set_volume(self, volume):
+        if volume == self.volume:
+            return
+        self.volume = volume
+        for pool in self.pools.values():
+            for channel in pool:
+                channel.set_volume(volume)
+
+    def play(self, sound):
+        category, priority = self.sounds.get(sound, ('ui', 0))
+        pool = self.pools.get(category)
+        if not pool:
+            sound.play()
+            return
+        channel = next((c for c in pool if not c.get_busy()), None)
+        if channel is None:
+            channel = min(pool, key=lambda c: self.playing.get(c, (0, 0)))
+            if self.playing.get(channel, (0, 0))[0] > priority:
+                return
+        channel.play(sound)
+        self.playing[channel] = (priority, pygame.time.get_ticks())
+
+AUDIO = AudioManager()
+
+def load_game_sounds():
+    global SOUND_CLICK, SOUND_CORRECT, SOUND_WRONG, SOUND_COUNTDOWN, SOUND_TIMEOUT, SOUND_WIN, SOUND_LOSE
+    try:
+        AUDIO.setup_channels()
+        AUDIO.set_volume(GAME_SETTINGS['volume'])
+        if asset_exists("maintheme.mp3"):
+            pygame.mixer.music.load(open_asset("maintheme.mp3"), "mp3")
+            update_background_music()
+        SOUND_CLICK = AUDIO.load("click.mp3", 'ui', 0)
+        SOUND_CORRECT = AUDIO.load("correct.mp3", 'answer', 2)
+        SOUND_WRONG = AUDIO.load("incorrect.mp3", 'answer', 1)
+        SOUND_COUNTDOWN = AUDIO.load("countdown.mp3", 'alert', 3)
+        SOUND_TIMEOUT = AUDIO.load("timeout.mp3", 'alert', 3)
+        SOUND_WIN = AUDIO.load("win.mp3", 'result', 5)
+        SOUND_LOSE = AUDIO.load("lose.mp3", 'result', 5)
+    except:
+        pass
+
+def update_background_music():
+    if GAME_SETTINGS['music_on']:
+        if not pygame.mixer.music.get_busy():
+            try:
+                pygame.mixer.music.play(-1)
+            except:
+                pass
+        pygame.mixer.music.unpause()
+        pygame.mixer.music.set_volume(GAME_SETTINGS['volume'])
+    else:
+        pygame.mixer.music.pause()
+    AUDIO.set_volume(GAME_SETTINGS['volume'])
+
+def play_sfx(sound_obj):
+    if sound_obj and GAME_SETTINGS['sfx_on']:
+        AUDIO.play(sound_obj)
+
+def play_win_sound():
+    pygame.mixer.music.stop()
+    play_sfx(SOUND_WIN)
+
+def play_lose_sound():
+    pygame.mixer.music.stop()
+    play_sfx(SOUND_LOSE)
+
+def restart_bg_music():
+    if not pygame.mixer.music.get_busy() and GAME_SETTINGS['music_on']:
+        try:
+            pygame.mixer.music.play(-1)
+        except:
+            pass
+    update_background_music()
+
+load_game_sounds()
+
+# End-of-match side effects (persistence, stats, sync) run in submission order
+# on one worker thread, so the frame that ends a match only enqueues them.
+# Stats/sync stages register in MATCH_END_HOOKS and receive the match result.
+MATCH_END_HOOKS = []
+
+class GameOverPipeline:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def submit(self, func, *args, **kwargs):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="game-over-pipeline", daemon=True)
+            self.thread.start()
+        self.jobs.put((func, args, kwargs))
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                func, args, kwargs = job
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"Game-over job failed: {e}")
+            finally:
+                self.jobs.task_done()
+
+    # Wait until everything queued so far is written (no-op on the worker itself)
+    def flush(self):
+        if self.thread is not None and threading.current_thread() is not self.thread:
+            self.jobs.join()
+
+    def shutdown(self):
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread.join()
+            self.thread = None
+
+PIPELINE = GameOverPipeline()
+
+def run_match_end_hooks(result):
+    for hook in MATCH_END_HOOKS:
+        hook(result)
+
+# Math and leaderboard logic
+def load_leaderboard(mode='PvBot'):
+    PIPELINE.flush()
+    filename = LEADERBOARD_FILE_PVP if mode == 'PvP' else LEADERBOARD_FILE_PVBOT
+    if not os.path.exists(filename):
+        return {'EASY': [], 'MID': [], 'HARD': []}
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except:
+        return {'EASY': [], 'MID': [], 'HARD': []}
+
+def save_leaderboard(data, mode='PvBot'):
+    filename = LEADERBOARD_FILE_PVP if mode == 'PvP' else LEADERBOARD_FILE_PVBOT
+    try:
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(filename + '.tmp', filename)
+    except:
+        pass
+
+def add_score(player_name, session_time, difficulty, mode='PvBot', winner_name=None, seed=None):
+    with LEADERBOARD_LOCK:
+        _add_score(player_name, session_time, difficulty, mode, winner_name, seed)
+
+def _add_score(player_name, session_time, difficulty, mode, winner_name, seed):
+    leaderboard = load_leaderboard(mode)
+    new_score = {
+        'name': player_name,
+        'time': round(session_time / 1000, 2),
+        'date': time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    if mode == 'PvP' and winner_name:
+        new_score['winner'] = winner_name
+    if seed is not None:
+        new_score['seed'] = seed
+    if difficulty not in leaderboard:
+        leaderboard[difficulty] = []
+    leaderboard[difficulty].append(new_score)
+    leaderboard[difficulty].sort(key=lambda x: x['time'])
+    leaderboard[difficulty] = leaderboard[difficulty][:10]
+    save_leaderboard(leaderboard, mode)
+
+# Player ratings: every finished match is appended to MATCH_HISTORY_FILE and
+# applied as one Elo update to an in-memory index of ratings by name. A
+# snapshot (ratings plus the history offset it covers) saves replaying the
+# whole history at startup; only the tail written since is streamed in.
+# Bots are fixed anchors per difficulty, so PvBot results are rated too.
+MATCH_HISTORY_FILE = os.path.join(GAME_DIR, 'match_history.jsonl')
+RATINGS_FILE = os.path.join(GAME_DIR, 'ratings.json')
+RATING_START = 1200
+RATING_BOTS = {'EASY': 1000, 'MID': 1200, 'HARD': 1400}
+RATING_K = 32
+RATING_K_PROVISIONAL = 64
+RATING_PROVISIONAL_GAMES = 10
+RATING_CHUNK = 1 << 20
+RATING_SNAPSHOT_EVERY = 256
+
+class RatingBook:
+    def __init__(self, history=MATCH_HISTORY_FILE, snapshot=RATINGS_FILE):
+        self.history = history
+        self.snapshot = snapshot
+        self.players = {}
+        self.offset = 0
+        self.loaded = False
+        self.dirty = False
+        self.unsaved = 0
+
+    def rating(self, name):
+        entry = self.players.get(name)
+        return entry[0] if entry else RATING_START
+
+    def player(self, name):
+        entry = self.players.get(name)
+        if entry is None:
+            entry = self.players[name] = [RATING_START, 0, 0]
+        return entry
+
+    # One Elo update; entries are [rating, games, wins] lists updated in place
+    def apply(self, mode, difficulty, left, right, winner):
+        if left == right:
+            return
+        score = 1.0 if winner == left else 0.0 if winner == right else 0.5
+        a = self.player(left)
+        if mode == 'PvBot':
+            if difficulty not in RATING_BOTS:
+                return
+            b = None
+            rating_b = RATING_BOTS[difficulty]
+        else:
+            b = self.player(right)
+            rating_b = b[0]
+        expected = 1 / (1 + 10 ** ((rating_b - a[0]) / 400))
+        delta = score - expected
+        a[0] += (RATING_K_PROVISIONAL if a[1] < RATING_PROVISIONAL_GAMES else RATING_K) * delta
+        a[1] += 1
+        a[2] += score == 1.0
+        if b is not None:
+            b[0] -= (RATING_K_PROVISIONAL if b[1] < RATING_PROVISIONAL_GAMES else RATING_K) * delta
+            b[1] += 1
+            b[2] += score == 0.0
+
+    # Stream history lines from self.offset to EOF. Each chunk of complete lines
+    # is parsed with one json.loads call, which keeps millions of matches fast.
+    def replay_history(self):
+        try:
+            f = open(self.history, 'rb')
+        except OSError:
+            return
+        apply = self.apply
+        with f:
+            f.seek(self.offset)
+            rest = b''
+            while True:
+                chunk = f.read(RATING_CHUNK)
+                if not chunk:
+                    break
+                chunk = rest + chunk
+                end = chunk.rfind(b'\n') + 1
+                rest = chunk[end:]
+                if not end:
+                    continue
+                try:
+                    matches = json.loads(b'[' + chunk[:end - 1].replace(b'\n', b',') + b']')
+                except ValueError:
+                    matches = []
+                    for line in chunk[:end].splitlines():
+                        try:
+                            matches.append(json.loads(line))
+                        except ValueError:
+                            pass
+                for m in matches:
+                    apply(m.get('mode'), m.get('difficulty'), m.get('left'), m.get('right'), m.get('winner'))
+                self.offset += end
+                self.dirty = True
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.snapshot, 'r') as f:
+                data = json.load(f)
+            if os.path.getsize(self.history) >= data['offset']:
+                self.players = data['players']
+                self.offset = data['offset']
+        except (OSError, ValueError, KeyError, TypeError):
+            self.players = {}
+            self.offset = 0
+        if not os.path.exists(self.history):
+            import_leaderboard_history(self.history)
+        self.replay_history()
+
+    def rebuild(self):
+        self.players = {}
+        self.offset = 0
+        self.loaded = True
+        self.dirty = True
+        self.replay_history()
+        self.write_snapshot()
+
+    # MATCH_END_HOOKS stage: first take in matches other processes (server
+    # shards) appended, then append ours and rate it
+    def record(self, result):
+        with LEADERBOARD_LOCK:
+            self.load()
+            self.replay_history()
+            line = json.dumps(result, separators=(',', ':')) + '\n'
+            with open(self.history, 'ab') as f:
+                f.write(line.encode('utf-8'))
+                self.offset = f.tell()
+            self.apply(result['mode'], result['difficulty'], result['left'], result['right'], result['winner'])
+            self.dirty = True
+            self.unsaved += 1
+            if self.unsaved >= RATING_SNAPSHOT_EVERY:
+                self.write_snapshot()
+
+    def save(self):
+        with LEADERBOARD_LOCK:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        if not self.dirty:
+            return
+        try:
+            with open(self.snapshot + '.tmp', 'w') as f:
+                json.dump({'offset': self.offset, 'players': self.players}, f, separators=(',', ':'))
+            os.replace(self.snapshot + '.tmp', self.snapshot)
+            self.dirty = False
+            self.unsaved = 0
+        except OSError:
+            pass
+
+    def top(self, count=10):
+        PIPELINE.flush()
+        with LEADERBOARD_LOCK:
+            self.load()
+            self.replay_history()
+            return heapq.nlargest(count, self.players.items(), key=lambda item: item[1][0])
+
+# Seed the history from PvP leaderboard rows: both players of a match were
+# saved with the same seed and date, and the row's winner decides the result
+def import_leaderboard_history(path):
+    board = load_leaderboard('PvP')
+    matches = []
+    for difficulty, rows in board.items():
+        pairs = {}
+        for row in rows:
+            if row.get('winner') and row.get('seed') is not None:
+                pairs.setdefault((row['seed'], row.get('date')), []).append(row)
+        for (seed, date), pair in pairs.items():
+            if len(pair) == 2:
+                matches.append({'mode': 'PvP', 'difficulty': difficulty, 'left': pair[0]['name'],
+                                'right': pair[1]['name'], 'winner': pair[0]['winner'],
+                                'time': pair[0].get('time'), 'seed': seed, 'date': date})
+    if not matches:
+        return
+    matches.sort(key=lambda m: m['date'] or '')
+    try:
+        with open(path, 'a') as f:
+            f.write(''.join(json.dumps(m, separators=(',', ':')) + '\n' for m in matches))
+    except OSError:
+        pass
+
+RATINGS = RatingBook()
+MATCH_END_HOOKS.append(RATINGS.record)
+
+# Every match draws from its own seeded streams, so the same seed replays the same questions
+def new_match_seed():
+    if MATCH_SEED is not None:
+        return MATCH_SEED
+    return random.SystemRandom().randrange(1, 1 << 31)
+
+def make_rng_streams(seed):
+    return random.Random(f"{seed}:questions"), random.Random(f"{seed}:bot")
+
+INTEGER_OPS = {'+': operator.add, '-': operator.sub, '*': operator.mul}
+FRACTION_OPS = {'+': operator.add, '-': operator.sub}
+
+def integer_question(op_sym, num1, num2):
+    return f"{num1} {op_sym} {num2} = ?", str(INTEGER_OPS[op_sym](num1, num2))
+
+def fraction_question(op_sym, p1, p2):
+    return f"{p1} {op_sym} {p2} = ?", str(FRACTION_OPS[op_sym](p1, p2).limit_denominator())
+
+def root_question(add, base_sq, base_cube):
+    bil_kuadrat = base_sq ** 2
+    bil_kubik = base_cube ** 3
+    if add:
+        return f"√{bil_kuadrat} + 3√{bil_kubik} = ?", str(base_sq + base_cube)
+    else:
+        if base_sq > base_cube:
+            return f"√{bil_kuadrat} - 3√{bil_kubik} = ?", str(base_sq - base_cube)
+        else:
+            return f"3√{bil_kubik} - √{bil_kuadrat} = ?", str(base_cube - base_sq)
+
+def _generate_integer_question(max_val, rng=random):
+    op_sym = rng.choice(tuple(INTEGER_OPS))
+    num1 = rng.randint(5, max_val)
+    num2 = rng.randint(1, max_val // 2)
+    if op_sym == '-' and num2 > num1:
+        num1, num2 = num2, num1
+    return integer_question(op_sym, num1, num2)
+
+def _generate_fraction_question(rng=random):
+    op_sym = rng.choice(tuple(FRACTION_OPS))
+    p1 = Fraction(rng.randint(1, 5), rng.randint(2, 6))
+    p2 = Fraction(rng.randint(1, 5), rng.randint(2, 6))
+    if op_sym == '-' and p2 > p1:
+        p1, p2 = p2, p1
+    return fraction_question(op_sym, p1, p2)
+
+def _generate_root_question(rng=random):
+    base_sq = rng.randint(3, 10)
+    base_cube = rng.randint(2, 5)
+    return root_question(rng.choice([True, False]), base_sq, base_cube)
+
+# Question families per difficulty; picking one draws from the rng exactly as
+# the old inline choice did, so recorded seeds replay the same questions
+QUESTION_FAMILIES = {
+    'EASY': ('integer',),
+    'MID': ('integer', 'fraction'),
+    'HARD': ('integer', 'fraction', 'root'),
+}
+INTEGER_MAX = {'EASY': 20, 'MID': 50, 'HARD': 100}
+
+def pick_question_family(difficulty, rng=random):
+    families = QUESTION_FAMILIES.get(difficulty, ('integer',))
+    return families[0] if len(families) == 1 else rng.choice(families)
+
+def generate_family_question(family, difficulty, rng=random):
+    if family == 'fraction':
+        return _generate_fraction_question(rng)
+    if family == 'root':
+        return _generate_root_question(rng)
+    return _generate_integer_question(max_val=INTEGER_MAX.get(difficulty, 30), rng=rng)
+
+# No-repeat scheduling. Each family's questions form a finite space of
+# distinct operand tuples (swapped subtractions and equal fractions such as
+# 2/4 and 1/2 collapse into one entry), enumerated once per process. A match
+# walks every space in a lazily shuffled order: a Fisher-Yates shuffle whose
+# displaced entries live in a dict, so each draw is O(1) with one rng call,
+# nothing is redrawn as the space fills up, and a question only comes back
+# after its whole space has been served.
+QUESTION_SPACES = {}
+FRACTION_PARTS = (range(1, 6), range(2, 7))
+ROOT_BASES = (range(3, 11), range(2, 6))
+
+def integer_space(max_val):
+    return [(op_sym, num1, num2) for op_sym in INTEGER_OPS
+            for num1 in range(5, max_val + 1) for num2 in range(1, max_val // 2 + 1)
+            if op_sym != '-' or num2 <= num1]
+
+def fraction_space():
+    values = sorted({Fraction(n, d) for n in FRACTION_PARTS[0] for d in FRACTION_PARTS[1]})
+    return [(op_sym, p1, p2) for op_sym in FRACTION_OPS for p1 in values for p2 in values
+            if op_sym != '-' or p2 <= p1]
+
+def root_space():
+    return [(add, base_sq, base_cube) for add in (True, False)
+            for base_sq in ROOT_BASES[0] for base_cube in ROOT_BASES[1]]
+
+QUESTION_BUILDERS = {'integer': integer_question, 'fraction': fraction_question, 'root': root_question}
+
+def question_space(family, difficulty):
+    key = (family, INTEGER_MAX.get(difficulty, 30)) if family == 'integer' else (family,)
+    space = QUESTION_SPACES.get(key)
+    if space is None:
+        if family == 'fraction':
+            space = fraction_space()
+        elif family == 'root':
+            space = root_space()
+        else:
+            space = integer_space(key[1])
+        space = QUESTION_SPACES[key] = tuple(space)
+    return space
+
+class QuestionDeck:
+    def __init__(self, space):
+        self.space = space
+        self.swaps = {}
+        self.drawn = 0
+
+    def draw(self, rng):
+        if self.drawn == len(self.space):
+            self.drawn = 0
+            self.swaps.clear()
+        i = self.drawn
+        j = rng.randrange(i, len(self.space))
+        top = self.swaps.pop(i, i)
+        if j == i:
+            pick = top
+        else:
+            pick = self.swaps.get(j, j)
+            self.swaps[j] = top
+        self.drawn += 1
+        return self.space[pick]
+
+class QuestionScheduler:
+    def __init__(self):
+        self.decks = {}
+
+    def draw(self, family, difficulty, rng):
+        deck = self.decks.get((family, difficulty))
+        if deck is None:
+            deck = self.decks[(family, difficulty)] = QuestionDeck(question_space(family, difficulty))
+        return QUESTION_BUILDERS[family](*deck.draw(rng))
+
+# Adaptive difficulty. Each human side keeps, per kind of question (a family
+# at an operand range), exponentially weighted estimates of accuracy, response
+# time and its spread, updated in O(1) per answer. The next question is the
+# kind closest to the target accuracy and response time. Against the bot, the
+# share of questions the human should win is derived from the target match
+# length (with a pull target of T and about N questions left in the time, the
+# human must win (1 + T / N) / 2 of them), and the bot's delay is set at that
+# quantile of the human's response time, corrected by how often they actually
+# win. Everything runs off sim time and the match rngs, so replays still match.
+ADAPTIVE = 'ADAPTIVE'
+ADAPTIVE_KINDS = (('integer', 'EASY'), ('integer', 'MID'), ('fraction', 'MID'), ('integer', 'HARD'), ('root', 'HARD'))
+ADAPTIVE_PRIORS = {  # (accuracy, response time in ms) before a side has answered
+    ('integer', 'EASY'): (0.9, 4000),
+    ('integer', 'MID'): (0.8, 6000),
+    ('fraction', 'MID'): (0.6, 10000),
+    ('integer', 'HARD'): (0.7, 8000),
+    ('root', 'HARD'): (0.7, 9000),
+}
+ADAPTIVE_ALPHA = 0.3
+ADAPTIVE_TARGET_ACCURACY = 0.8
+ADAPTIVE_QUESTION_MS = 6000
+ADAPTIVE_MATCH_MS = 90000
+ADAPTIVE_EXPLORE = 0.15
+ADAPTIVE_WIN_RANGE = (0.55, 0.95)
+ADAPTIVE_PACE_GAIN = 3.0
+ADAPTIVE_PACE_RANGE = (0.25, 4.0)
+
+class SkillEstimate:
+    def __init__(self, accuracy, latency):
+        self.accuracy = accuracy
+        self.latency = latency
+        self.deviation = latency / 3
+
+    def answer(self, correct, latency):
+        self.accuracy += ADAPTIVE_ALPHA * ((1.0 if correct else 0.0) - self.accuracy)
+        if correct:
+            self.observe(latency)
+
+    # No answer after elapsed ms (the bot won or time ran out): the response
+    # time is at least that long
+    def censored(self, elapsed):
+        if elapsed > self.latency:
+            self.observe(elapsed)
+
+    def observe(self, latency):
+        self.deviation += ADAPTIVE_ALPHA * (abs(latency - self.latency) - self.deviation)
+        self.latency += ADAPTIVE_ALPHA * (latency - self.latency)
+
+class AdaptiveController:
+    def __init__(self, sides):
+        self.skills = {side: {} for side in sides}
+        # Per side, how far from the priors the answers so far have been (speed
+        # as a ratio of the prior response time, accuracy as an offset), so a
+        # kind seen for the first time starts from the player's form
+        self.form = {side: [1.0, 0.0] for side in sides}
+        self.human_wins = None
+        self.win_target = 0.5
+        self.pace = 1.0
+
+    def skill(self, side, kind):
+        estimate = self.skills[side].get(kind)
+        if estimate is None:
+            estimate = self.skills[side][kind] = SkillEstimate(*self.expected(side, kind))
+        return estimate
+
+    # (accuracy, response time) for a kind, from the player's form until they have answered one
+    def expected(self, side, kind):
+        estimate = self.skills[side].get(kind)
+        if estimate is not None:
+            return estimate.accuracy, estimate.latency
+        accuracy, latency = ADAPTIVE_PRIORS[kind]
+        speed, offset = self.form[side]
+        return min(1.0, max(0.0, accuracy + offset)), latency * speed
+
+    def update_form(self, side, kind, correct, latency):
+        accuracy, prior_latency = ADAPTIVE_PRIORS[kind]
+        form = self.form[side]
+        if correct is not None:
+            form[1] += ADAPTIVE_ALPHA * ((1.0 if correct else 0.0) - accuracy - form[1])
+        if latency is not None:
+            form[0] += ADAPTIVE_ALPHA * (latency / prior_latency - form[0])
+
+    def cost(self, kind):
+        total = 0.0
+        for side in self.skills:
+            accuracy, latency = self.expected(side, kind)
+            total += abs(accuracy - ADAPTIVE_TARGET_ACCURACY) + abs(latency - ADAPTIVE_QUESTION_MS) / ADAPTIVE_QUESTION_MS
+        return total
+
+    # The best kind, or now and then the runner-up so estimates stay current
+    def pick(self, rng):
+        ranked = sorted(ADAPTIVE_KINDS, key=self.cost)
+        return ranked[1] if rng.random() < ADAPTIVE_EXPLORE else ranked[0]
+
+    def answer(self, side, kind, correct, latency):
+        if side in self.skills:
+            self.skill(side, kind).answer(correct, latency)
+            self.update_form(side, kind, correct, latency if correct else None)
+
+    # A question ended with winner (None on a timeout) answering first: every
+    # other human side had not answered after elapsed ms
+    def resolved(self, kind, winner, elapsed):
+        for side in self.skills:
+            if side != winner:
+                estimate = self.skill(side, kind)
+                if elapsed > estimate.latency:
+                    self.update_form(side, kind, None, elapsed)
+                estimate.censored(elapsed)
+
+    def bot_delay(self, kind, target_pull, remaining_ms, base, rng):
+        estimate = self.skill('left', kind)
+        expected = estimate.latency / max(estimate.accuracy, 0.1)
+        questions = max(1.0, remaining_ms / expected)
+        low, high = ADAPTIVE_WIN_RANGE
+        self.win_target = min(high, max(low, (1 + target_pull / questions) / 2))
+        delay = (expected + NormalDist().inv_cdf(self.win_target) * estimate.deviation) * self.pace
+        return int(min(2 * base, max(0.1 * base, delay)) * rng.uniform(0.9, 1.1))
+
+    def question_won(self, human):
+        won = 1.0 if human else 0.0
+        if self.human_wins is None:
+            self.human_wins = self.win_target
+        self.human_wins += ADAPTIVE_ALPHA * (won - self.human_wins)
+        low, high = ADAPTIVE_PACE_RANGE
+        self.pace = min(high, max(low, self.pace * math.exp(ADAPTIVE_PACE_GAIN * ADAPTIVE_ALPHA *
+                                                            (self.win_target - self.human_wins))))
+
+class PlayerState:
+    def __init__(self, side):
+        self.side = side
+        self.current_input = ""
+        self.last_answer_time = 0
+        self.correct_count = 0
+        self.wrong_count = 0
+    def reset_input(self):
+        self.current_input = ""
+
+def check_answer(input_val, correct_val):
+    is_correct = False
+    try:
+        if '/' in correct_val:
+            correct_frac = Fraction(correct_val)
+            try:
+                user_frac = Fraction(input_val).limit_denominator()
+                if user_frac == correct_frac:
+                    is_correct = True
+            except:
+                try:
+                    if abs(float(input_val) - float(correct_frac)) < 0.001:
+                        is_correct = True
+                except:
+                    pass
+        else:
+            try:
+                if abs(float(input_val) - float(correct_val)) < 0.001:
+                    is_correct = True
+            except:
+                pass
+    except:
+        pass
+    return is_correct
+
+# UI Button
+class Button:
+    def __init__(self, rect, text="", callback=None, font=FONT_M):
+        self.rect = pygame.Rect(rect)
+        self.text = text
+        self.callback = callback
+        self.font = font
+        self.hover = False
+    def draw(self, surf):
+        fill_color = WOOD_DARK if self.hover else WOOD_LIGHT
+        pygame.draw.rect(surf, WOOD_BORDER, self.rect, border_radius=6)
+        inner_rect = self.rect.inflate(-6, -6)
+        pygame.draw.rect(surf, fill_color, inner_rect, border_radius=4)
+        nail_color = (130, 70, 30)
+        corners = [
+            (inner_rect.left + 3, inner_rect.top + 3),
+            (inner_rect.right - 7, inner_rect.top + 3),
+            (inner_rect.left + 3, inner_rect.bottom - 7),
+            (inner_rect.right - 7, inner_rect.bottom - 7)
+        ]
+        for x, y in corners:
+            pygame.draw.rect(surf, nail_color, (x, y, 4, 4))
+        txt = self.font.render(self.text, True, TEXT_BROWN)
+        txt_r = txt.get_rect(center=self.rect.center)
+        surf.blit(txt, txt_r)
+    def handle_event(self, ev):
+        if ev.type == pygame.MOUSEMOTION:
+            self.hover = self.rect.collidepoint(ev.pos)
+        elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+            if self.rect.collidepoint(ev.pos):
+                play_sfx(SOUND_CLICK)
+                if self.callback:
+                    self.callback()
+
+# Fallback background if wallpaper missing
+def draw_grid_background(surf):
+    width, height = surf.get_size()
+    surf.fill(BG_COLOR)
+    for x in range(0, width, 40):
+        pygame.draw.line(surf, GRID_COLOR, (x, 0), (x, height), 1)
+    for y in range(0, height, 40):
+        pygame.draw.line(surf, GRID_COLOR, (0, y), (width, y), 1)
+
+# Rendered strings shared by every screen and match. Labels, questions and
+# most counters repeat from frame to frame, so a string is rasterized once;
+# the least recently used entry is dropped when the cache is full.
+TEXT_CACHE_SIZE = 512
+TEXT_CACHE = {}
+
+def cached_text(font, text, color):
+    key = (font, text, color)
+    surf = TEXT_CACHE.pop(key, None)
+    if surf is None:
+        surf = font.render(text, True, color)
+        if len(TEXT_CACHE) >= TEXT_CACHE_SIZE:
+            del TEXT_CACHE[next(iter(TEXT_CACHE))]
+    TEXT_CACHE[key] = surf
+    return surf
+
+# Glyph atlas for fields that change with every keystroke or second (timer,
+# score, input fields), where whole strings rarely repeat. Each (font, color)
+# rasterizes the small alphabet those fields use once, and strings are laid
+# out glyph by glyph with the font's advances: O(length) blits, no rendering.
+# Strings with other characters fall back to the string cache.
+GLYPH_CHARS = "0123456789/.- Time:s"
+GLYPH_ATLASES = {}
+
+class GlyphAtlas:
+    def __init__(self, font, color, chars=GLYPH_CHARS):
+        self.font = font
+        self.color = color
+        chars = ''.join(sorted(set(chars)))
+        glyphs = [font.render(ch, True, color) for ch in chars]
+        self.surface = new_layer((max(1, sum(g.get_width() for g in glyphs)), font.get_height()), alpha=True)
+        self.surface.fill((0, 0, 0, 0))
+        self.glyphs = {}
+        x = 0
+        for ch, glyph, metrics in zip(chars, glyphs, font.metrics(chars)):
+            # Only the inked part of a glyph is kept and blitted, at its offset in the cell
+            ink = glyph.get_bounding_rect()
+            self.surface.blit(glyph, (x, ink.y), ink)
+            advance = metrics[4] if metrics else glyph.get_width()
+            self.glyphs[ch] = (pygame.Rect(x, ink.y, ink.width, ink.height), ink.x, ink.y, advance)
+            x += ink.width
+
+    def width(self, text):
+        try:
+            return sum([self.glyphs[ch][3] for ch in text])
+        except KeyError:
+            return self.font.size(text)[0]
+
+    def draw(self, surf, text, dest):
+        x, y = dest
+        runs = []
+        try:
+            for ch in text:
+                area, dx, dy, advance = self.glyphs[ch]
+                if area.width:
+                    runs.append((self.surface, (x + dx, y + dy), area))
+                x += advance
+        except KeyError:
+            surf.blit(cached_text(self.font, text, self.color), dest)
+            return
+        surf.blits(runs, doreturn=False)
+
+def glyph_atlas(font, color):
+    atlas = GLYPH_ATLASES.get((font, color))
+    if atlas is None:
+        atlas = GLYPH_ATLASES[(font, color)] = GlyphAtlas(font, color)
+    return atlas
+
+# Pre-rendered static layers shared by screens (dim overlay, dimmed wallpaper,
+# countdown digits); built once, often ahead of time while a screen is idle
+LAYER_CACHE = {}
+
+def new_layer(size, alpha=False):
+    layer = pygame.Surface(size, pygame.SRCALPHA if alpha else 0)
+    if pygame.display.get_surface():
+        layer = layer.convert_alpha() if alpha else layer.convert()
+    return layer
+
+def cached_layer(key, builder):
+    layer = LAYER_CACHE.get(key)
+    if layer is None:
+        layer = LAYER_CACHE[key] = builder()
+    return layer
+
+def build_overlay(size=None):
+    overlay = new_layer(size or (SCREEN_W, SCREEN_H), alpha=True)
+    overlay.fill(BLACK_TRANSPARENT)
+    return overlay
+
+def overlay_layer(size=None):
+    size = size or (SCREEN_W, SCREEN_H)
+    return cached_layer(('overlay', size), lambda: build_overlay(size))
+
+def build_menu_background():
+    layer = new_layer((SCREEN_W, SCREEN_H))
+    if WALLPAPER_IMG:
+        layer.blit(WALLPAPER_IMG, (0, 0))
+    else:
+        layer.fill(BG_COLOR)
+    return layer
+
+def build_dimmed_background():
+    layer = cached_layer('menu_bg', build_menu_background).copy()
+    layer.blit(overlay_layer(), (0, 0))
+    return layer
+
+def build_ingame_background(size):
+    layer = new_layer(size)
+    if INGAME_WALLPAPER_IMG:
+        try:
+            layer.blit(pygame.transform.smoothscale(INGAME_WALLPAPER_IMG, size), (0, 0))
+        except ValueError:
+            layer.blit(pygame.transform.scale(INGAME_WALLPAPER_IMG, size), (0, 0))
+    else:
+        draw_grid_background(layer)
+    return layer
+
+def build_countdown_text(text, col, scale_factor, font=FONT_XL):
+    cd_txt = font.render(text, True, col)
+    return pygame.transform.scale(cd_txt, (cd_txt.get_width() * scale_factor, cd_txt.get_height() * scale_factor))
+
+def prewarm_shared_layers():
+    overlay_layer()
+    cached_layer('dimmed_bg', build_dimmed_background)
+
+# Fonts and sprites for one viewport scale, plus that viewport's layers. A
+# full-screen Game uses the global assets; kiosk viewports of the same size
+# share one scaled set, so extra matches add no rasterizing or resizing.
+MIN_FONT_SIZE = 10
+VIEW_ASSETS = {}
+
+class ViewAssets:
+    def __init__(self, scale):
+        self.scale = scale
+        if scale == 1:
+            self.font_xl, self.font_l, self.font_m, self.font_s = FONT_XL, FONT_L, FONT_M, FONT_S
+            self.sprites = SPRITES
+        else:
+            self.font_xl, self.font_l, self.font_m, self.font_s = (
+                get_font(max(MIN_FONT_SIZE, round(size * scale))) for size in (50, 30, 20, 16))
+            self.sprites = SPRITES.scaled(scale)
+        self.rope_offset_y = self.px(ROPE_TILE_OFFSET_Y)
+
+    def px(self, value):
+        return round(value * self.scale)
+
+    def background(self, size):
+        return cached_layer(('ingame_bg', size), lambda: build_ingame_background(size))
+
+    def countdown(self, text):
+        col, factor = (COLOR_P1, 4) if text == "GO!" else ((255, 255, 255), 3)
+        return cached_layer(('countdown', text, self.scale),
+                            lambda: build_countdown_text(text, col, factor, self.font_xl))
+
+    def prewarm(self, size):
+        self.background(size)
+        overlay_layer(size)
+        for text in ("3", "2", "1", "GO!"):
+            self.countdown(text)
+        for font, color in ((self.font_xl, TEXT_WHITE), (self.font_xl, (0, 0, 0)), (self.font_l, TEXT_BROWN),
+                            (self.font_m, TEXT_BROWN), (self.font_m, COLOR_P2)):
+            glyph_atlas(font, color)
+
+def view_assets(scale):
+    assets = VIEW_ASSETS.get(scale)
+    if assets is None:
+        assets = VIEW_ASSETS[scale] = ViewAssets(scale)
+    return assets
+
+# Main Menu Screen
+class MainMenu:
+    def __init__(self, start_game_callback, leaderboard_callback, settings_callback):
+        self.start_game = start_game_callback
+        self.leaderboard_callback = leaderboard_callback
+        self.settings_callback = settings_callback
+        self.selected_mode = GAME_MODE
+        self.selected_difficulty = DIFFICULTY
+        self.layer = None
+        self.buttons = []
+        self.create_buttons()
+    def create_buttons(self):
+        btn_w, btn_h = 240, 55
+        center_x = SCREEN_W // 2
+        start_y_mode = 200
+        self.buttons.append(Button((center_x - btn_w - 10, start_y_mode, btn_w, btn_h), "Player vs Player", lambda: self.select_mode('PvP')))
+        self.buttons.append(Button((center_x + 10, start_y_mode, btn_w, btn_h), "Player vs BOT", lambda: self.select_mode('PvBot')))
+        start_y_diff = 320
+        diff_w = 160
+        diff_gap = 20
+        total_diff_width = (diff_w * 4) + (diff_gap * 3)
+        start_diff_x = center_x - (total_diff_width // 2)
+        self.buttons.append(Button((start_diff_x, start_y_diff, diff_w, btn_h), "EASY", lambda: self.select_difficulty('EASY')))
+        self.buttons.append(Button((start_diff_x + diff_w + diff_gap, start_y_diff, diff_w, btn_h), "MEDIUM", lambda: self.select_difficulty('MID')))
+        self.buttons.append(Button((start_diff_x + 2 * (diff_w + diff_gap), start_y_diff, diff_w, btn_h), "HARD", lambda: self.select_difficulty('HARD')))
+        self.buttons.append(Button((start_diff_x + 3 * (diff_w + diff_gap), start_y_diff, diff_w, btn_h), "ADAPTIVE", lambda: self.select_difficulty(ADAPTIVE)))
+        start_y_actions = 430
+        self.buttons.append(Button((center_x - 150, start_y_actions, 300, 60), "START GAME", self.on_start, FONT_L))
+        self.buttons.append(Button((center_x - 150, start_y_actions + 75, 300, 45), "LEADERBOARD", self.leaderboard_callback))
+        self.buttons.append(Button((center_x - 150, start_y_actions + 130, 300, 45), "AUDIO SETTINGS", self.settings_callback))
+        self.buttons.append(Button((center_x - 150, start_y_actions + 185, 300, 45), "EXIT", terminate_program))
+    def select_mode(self, mode):
+        self.selected_mode = mode
+    def select_difficulty(self, difficulty):
+        self.selected_difficulty = difficulty
+    def on_start(self):
+        global GAME_MODE, DIFFICULTY
+        GAME_MODE = self.selected_mode
+        DIFFICULTY = self.selected_difficulty
+        self.start_game()
+    def handle_event(self, ev):
+        for b in self.buttons:
+            b.handle_event(ev)
+    def prerender(self):
+        self.layer = cached_layer('menu_bg', build_menu_background).copy()
+        title_txt = "MATH TUG WAR"
+        t_shadow = FONT_XL.render(title_txt, True, (0, 0, 0))
+        t_main = FONT_XL.render(title_txt, True, TEXT_WHITE)
+        self.layer.blit(t_shadow, (SCREEN_W // 2 - t_shadow.get_width() // 2 + 4, 64))
+        self.layer.blit(t_main, (SCREEN_W // 2 - t_main.get_width() // 2, 60))
+        lbl_mode = FONT_L.render("SELECT MODE", True, TEXT_WHITE)
+        self.layer.blit(lbl_mode, (SCREEN_W // 2 - lbl_mode.get_width() // 2, 160))
+        lbl_diff = FONT_L.render("DIFFICULTY", True, TEXT_WHITE)
+        self.layer.blit(lbl_diff, (SCREEN_W // 2 - lbl_diff.get_width() // 2, 280))
+    def draw(self, surf):
+        if self.layer is None:
+            self.prerender()
+        surf.blit(self.layer, (0, 0))
+        for b in self.buttons:
+            b.draw(surf)
+            is_mode_sel = (b.text == 'Player vs Player' and self.selected_mode == 'PvP') or \
+                          (b.text == 'Player vs BOT' and self.selected_mode == 'PvBot')
+            is_diff_sel = (b.text == 'EASY' and self.selected_difficulty == 'EASY') or \
+                          (b.text == 'MEDIUM' and self.selected_difficulty == 'MID') or \
+                          (b.text == 'HARD' and self.selected_difficulty == 'HARD') or \
+                          (b.text == 'ADAPTIVE' and self.selected_difficulty == ADAPTIVE)
+            if is_mode_sel or is_diff_sel:
+                pygame.draw.rect(surf, (255, 255, 200), b.rect.inflate(6, 6), 3, border_radius=6)
+
+# Audio Settings Screen
+class AudioSettingsScreen:
+    def __init__(self, return_callback):
+        self.return_callback = return_callback
+        self.create_buttons()
+    def create_buttons(self):
+        self.buttons = []
+        center_x = SCREEN_W // 2
+        start_y = 200
+        btn_w, btn_h = 300, 55
+        spacing = 20
+        self.buttons.append(Button(
+            (center_x - btn_w // 2, start_y, btn_w, btn_h),
+            f"Music: {'ON' if GAME_SETTINGS['music_on'] else 'OFF'}",
+            self.toggle_music
+        ))
+        self.buttons.append(Button(
+            (center_x - btn_w // 2, start_y + btn_h + spacing, btn_w, btn_h),
+            f"SFX: {'ON' if GAME_SETTINGS['sfx_on'] else 'OFF'}",
+            self.toggle_sfx
+        ))
+        vol_y = start_y + (btn_h + spacing) * 2
+        self.buttons.append(Button((center_x - 130, vol_y, 60, 55), "-", self.decrease_volume, FONT_L))
+        self.buttons.append(Button((center_x + 70, vol_y, 60, 55), "+", self.increase_volume, FONT_L))
+        self.buttons.append(Button((center_x - 100, 500, 200, 55), "BACK", self.return_callback))
+    def toggle_music(self):
+        GAME_SETTINGS['music_on'] = not GAME_SETTINGS['music_on']
+        update_background_music()
+        self.create_buttons()
+    def toggle_sfx(self):
+        GAME_SETTINGS['sfx_on'] = not GAME_SETTINGS['sfx_on']
+        self.create_buttons()
+    def increase_volume(self):
+        GAME_SETTINGS['volume'] = min(1.0, GAME_SETTINGS['volume'] + 0.1)
+        update_background_music()
+    def decrease_volume(self):
+        GAME_SETTINGS['volume'] = max(0.0, GAME_SETTINGS['volume'] - 0.1)
+        update_background_music()
+    def handle_event(self, ev):
+        for b in self.buttons:
+            b.handle_event(ev)
+    def draw(self, surf):
+        if WALLPAPER_IMG:
+            surf.blit(WALLPAPER_IMG, (0, 0))
+        else:
+            surf.fill(BG_COLOR)
+        title = FONT_XL.render("AUDIO SETTINGS", True, TEXT_WHITE)
+        surf.blit(title, (SCREEN_W // 2 - title.get_width() // 2, 80))
+        for b in self.buttons:
+            b.draw(surf)
+        vol_percent = int(GAME_SETTINGS['volume'] * 100)
+        vol_text = FONT_M.render(f"Volume: {vol_percent}%", True, TEXT_WHITE)
+        center_x = SCREEN_W // 2
+        vol_y = 200 + (55 + 20) * 2 + 15
+        surf.blit(vol_text, (center_x - vol_text.get_width() // 2, vol_y))
+
+# Name Input Screen (for PvP)
+class NameInputScreen:
+    def __init__(self, start_game_callback, quit_callback):
+        self.start_game = start_game_callback
+        self.quit_callback = quit_callback
+        self.p1_input = ""
+        self.p2_input = ""
+        self.active_field = 1
+        self.max_chars = 10
+        center_x = SCREEN_W // 2
+        self.input_rects = {
+            1: pygame.Rect(center_x - 300, 200, 600, 50),
+            2: pygame.Rect(center_x - 300, 350, 600, 50)
+        }
+        self.start_button = Button((center_x - 100, 500, 200, 60), "GO!", self.on_start, FONT_L)
+        self.back_button = Button((20, 20, 100, 40), "BACK", self.quit_callback, FONT_S)
+    def on_start(self):
+        global PLAYER_NAMES
+        name1 = self.p1_input.strip() or "PLAYER 1"
+        name2 = self.p2_input.strip() or "PLAYER 2"
+        PLAYER_NAMES["left"] = name1.upper()
+        PLAYER_NAMES["right"] = name2.upper()
+        self.start_game()
+    def handle_event(self, ev):
+        self.start_button.handle_event(ev)
+        self.back_button.handle_event(ev)
+        if ev.type == pygame.MOUSEBUTTONDOWN:
+            if self.input_rects[1].collidepoint(ev.pos):
+                self.active_field = 1
+            elif self.input_rects[2].collidepoint(ev.pos):
+                self.active_field = 2
+        if ev.type == pygame.KEYDOWN:
+            current_input = self.p1_input if self.active_field == 1 else self.p2_input
+            if ev.key == pygame.K_RETURN:
+                if self.active_field == 1:
+                    self.active_field = 2
+                elif self.active_field == 2 and (self.p1_input or self.p2_input):
+                    self.on_start()
+            elif ev.key == pygame.K_BACKSPACE:
+                current_input = current_input[:-1]
+            elif len(current_input) < self.max_chars and (ev.unicode.isalnum() or ev.key == pygame.K_SPACE):
+                current_input += ev.unicode.upper()
+            if self.active_field == 1:
+                self.p1_input = current_input
+            else:
+                self.p2_input = current_input
+    def draw(self, surf):
+        if WALLPAPER_IMG:
+            surf.blit(WALLPAPER_IMG, (0, 0))
+        else:
+            surf.fill(BG_COLOR)
+        title = FONT_XL.render("ENTER NAMES", True, TEXT_WHITE)
+        surf.blit(title, (SCREEN_W // 2 - title.get_width() // 2, 100))
+        for i in [1, 2]:
+            rect = self.input_rects[i]
+            input_text = self.p1_input if i == 1 else self.p2_input
+            label = FONT_L.render(f"PLAYER {i}:", True, TEXT_WHITE)
+            surf.blit(label, (rect.x, rect.y - 40))
+            pygame.draw.rect(surf, (255, 255, 255), rect, border_radius=5)
+            border_col = COLOR_P1 if self.active_field == i else WOOD_BORDER
+            pygame.draw.rect(surf, border_col, rect, 3, border_radius=5)
+            text_surface = FONT_L.render(input_text, True, TEXT_BROWN)
+            surf.blit(text_surface, (rect.x + 10, rect.y + 10))
+        self.start_button.draw(surf)
+        self.back_button.draw(surf)
+
+# Leaderboard Screen 
+class LeaderboardScreen:
+    def __init__(self, return_callback, quit_callback):
+        self.return_callback = return_callback
+        self.current_mode = 'PvBot'
+        self.current_difficulty = 'EASY'
+        self.leaderboard_data = load_leaderboard(self.current_mode)
+        self.table_rect = pygame.Rect(100, 110, SCREEN_W - 200, SCREEN_H - 150)
+        self.table_layer = None
+        self.create_buttons()
+    def create_buttons(self):
+        btn_w = 120
+        btn_h = 35
+        gap = 20
+        total_width = 3 * btn_w + 2 * gap
+        center_x = SCREEN_W // 2
+        start_x = center_x - total_width // 2
+        self.buttons = [
+            Button((start_x, 20, btn_w, btn_h), "PvBOT", lambda: self.set_mode('PvBOT'), FONT_S),
+            Button((start_x + btn_w + gap, 20, btn_w, btn_h), "PvP", lambda: self.set_mode('PvP'), FONT_S),
+            Button((start_x + 2 * (btn_w + gap), 20, btn_w, btn_h), "RATING", lambda: self.set_mode('RATING'),
+                   FONT_S),
+            Button((center_x - 200, 60, btn_w, btn_h), "EASY", lambda: self.set_difficulty('EASY')),
+            Button((center_x - 60, 60, btn_w, btn_h), "MEDIUM", lambda: self.set_difficulty('MID')),
+            Button((center_x + 80, 60, btn_w, btn_h), "HARD", lambda: self.set_difficulty('HARD')),
+            Button((20, 20, 100, 40), "BACK", self.return_callback, FONT_S)
+        ]
+    def set_mode(self, mode):
+        self.current_mode = mode
+        if mode == 'RATING':
+            self.ratings = RATINGS.top()
+        else:
+            self.leaderboard_data = load_leaderboard(self.current_mode)
+        self.table_layer = None
+    def set_difficulty(self, diff):
+        self.current_difficulty = diff
+        if self.current_mode == 'RATING':
+            self.current_mode = 'PvBot'
+        self.leaderboard_data = load_leaderboard(self.current_mode)
+        self.table_layer = None
+    def handle_event(self, ev):
+        for b in self.buttons:
+            b.handle_event(ev)
+    # The table text only changes with the tab, so it is rendered once into a layer
+    def prerender(self):
+        layer = new_layer(self.table_rect.size, alpha=True)
+        layer.fill((0, 0, 0, 0))
+        ox, oy = self.table_rect.topleft
+        self.table_layer = layer
+        if self.current_mode == 'RATING':
+            self.prerender_ratings(layer, ox, oy)
+            return
+        scores = self.leaderboard_data.get(self.current_difficulty, [])
+        header_font = FONT_L
+        y_pos = 130 - oy
+        layer.blit(header_font.render("RANK", True, TEXT_WHITE), (130 - ox, y_pos))
+        layer.blit(header_font.render("NAME", True, TEXT_WHITE), (280 - ox, y_pos))
+        layer.blit(header_font.render("TIME (s)", True, TEXT_WHITE), (580 - ox, y_pos))
+        layer.blit(header_font.render("DATE", True, TEXT_WHITE), (780 - ox, y_pos))
+        if self.current_mode == 'PvP':
+            layer.blit(header_font.render("WINNER", True, TEXT_WHITE), (1000 - ox, y_pos))
+        pygame.draw.line(layer, TEXT_WHITE, (120 - ox, y_pos + 40), (SCREEN_W - 120 - ox, y_pos + 40), 2)
+        score_font = FONT_M
+        y_start = 180
+        if not scores:
+            no_score = FONT_L.render("NO SCORES YET", True, (200, 200, 200))
+            layer.blit(no_score, (SCREEN_W // 2 - no_score.get_width() // 2 - ox, y_start - oy))
+            return
+        for i, score in enumerate(scores):
+            y = y_start + i * 45
+            if y > SCREEN_H - 50:
+                break
+            y -= oy
+            layer.blit(score_font.render(str(i + 1), True, TEXT_WHITE), (140 - ox, y))
+            layer.blit(score_font.render(score.get('name', 'N/A'), True, TEXT_WHITE), (280 - ox, y))
+            time_val = score.get('time')
+            time_text = f"{time_val:.2f}" if time_val is not None else "N/A"
+            layer.blit(score_font.render(time_text, True, TEXT_WHITE), (580 - ox, y))
+            layer.blit(score_font.render(score['date'].split(' ')[0], True, TEXT_WHITE), (780 - ox, y))
+            if self.current_mode == 'PvP':
+                winner = score.get('winner', '—')
+                win_color = COLOR_P1 if winner == score.get('name') else TEXT_WHITE
+                layer.blit(score_font.render(winner, True, win_color), (1000 - ox, y))
+
+    # Ratings span every difficulty and mode, so the difficulty tabs do not apply
+    def prerender_ratings(self, layer, ox, oy):
+        y_pos = 130 - oy
+        for text, x in (("RANK", 130), ("NAME", 280), ("RATING", 580), ("GAMES", 780), ("WIN %", 1000)):
+            layer.blit(FONT_L.render(text, True, TEXT_WHITE), (x - ox, y_pos))
+        pygame.draw.line(layer, TEXT_WHITE, (120 - ox, y_pos + 40), (SCREEN_W - 120 - ox, y_pos + 40), 2)
+        y_start = 180
+        if not self.ratings:
+            no_score = FONT_L.render("NO RATED MATCHES YET", True, (200, 200, 200))
+            layer.blit(no_score, (SCREEN_W // 2 - no_score.get_width() // 2 - ox, y_start - oy))
+            return
+        for i, (name, (rating, games, wins)) in enumerate(self.ratings):
+            y = y_start + i * 45
+            if y > SCREEN_H - 50:
+                break
+            y -= oy
+            layer.blit(FONT_M.render(str(i + 1), True, TEXT_WHITE), (140 - ox, y))
+            layer.blit(FONT_M.render(name, True, TEXT_WHITE), (280 - ox, y))
+            layer.blit(FONT_M.render(str(round(rating)), True, TEXT_WHITE), (580 - ox, y))
+            layer.blit(FONT_M.render(str(games), True, TEXT_WHITE), (780 - ox, y))
+            layer.blit(FONT_M.render(f"{100 * wins / games:.0f}", True, TEXT_WHITE), (1000 - ox, y))
+
+    def draw(self, surf):
+        surf.blit(cached_layer('menu_bg', build_menu_background), (0, 0))
+        for b in self.buttons:
+            b.draw(surf)
+            if self.current_mode == 'RATING':
+                selected = b.text == 'RATING'
+            else:
+                selected = b.text == self.current_difficulty or (b.text == "MEDIUM" and self.current_difficulty == 'MID')
+            if selected:
+                pygame.draw.rect(surf, (255, 255, 200), b.rect.inflate(4, 4), 3, border_radius=6)
+        pygame.draw.rect(surf, (0, 0, 0, 150), self.table_rect, border_radius=10)
+        if self.table_layer is None:
+            self.prerender()
+        surf.blit(self.table_layer, self.table_rect)
+
+# In-game settings panel (adjust target, exit, etc.) 
+class GameplaySettingsPanel:
+    def __init__(self, game_instance, quit_callback):
+        self.game = game_instance
+        self.quit_callback = quit_callback
+        self.is_visible = False
+        self.create_buttons()
+    def create_buttons(self):
+        def set_target(value):
+            global TARGET_PULL
+            TARGET_PULL = value
+            self.game.set_target_pull(value)
+        def increase_target():
+            set_target(min(TARGET_PULL_RANGE[1], self.game.target_pull + 1))
+        def decrease_target():
+            set_target(max(TARGET_PULL_RANGE[0], self.game.target_pull - 1))
+        px = self.game.view.px
+        font = self.game.view.font_s
+        start_x = self.game.width - px(245)
+        self.buttons = [
+            Button((start_x, px(120), px(95), px(36)), "Target -", decrease_target, font),
+            Button((start_x + px(100), px(120), px(95), px(36)), "Target +", increase_target, font),
+            Button((start_x, px(170), px(200), px(30)), "BACK TO MENU", self.quit_callback, font),
+            Button((start_x, px(208), px(200), px(30)), "EXIT APP", terminate_program, font)
+        ]
+    def handle_event(self, ev):
+        if self.is_visible:
+            for b in self.buttons:
+                b.handle_event(ev)
+    def draw(self, surf):
+        if self.is_visible:
+            if not self.buttons:
+                return
+            px = self.game.view.px
+            button_y_top = min(b.rect.y for b in self.buttons)
+            button_y_bottom = max(b.rect.y + b.rect.height for b in self.buttons)
+            padding_top = px(10)
+            padding_bottom = px(10)
+            panel_height = button_y_bottom - button_y_top + padding_top + padding_bottom
+            panel_x = self.game.width - px(260)
+            panel_y = button_y_top - padding_top
+            panel_rect = pygame.Rect(panel_x, panel_y, px(230), panel_height)
+            pygame.draw.rect(surf, (240, 240, 240), panel_rect, border_radius=10)
+
+            pygame.draw.rect(surf, WOOD_BORDER, panel_rect, 3, border_radius=10)
+            for b in self.buttons:
+                b.draw(surf)
+
+# Bot timing per difficulty: first key after (low, high) of the question time,
+# then (low, high) ms between keystrokes
+BOT_TIMING = {
+    'EASY': (0.6, 0.9, 350, 500),
+    'MID': (0.4, 0.7, 200, 350),
+    'HARD': (0.2, 0.4, 100, 200),
+}
+
+# Main Game Logic
+class Game:
+    def __init__(self, difficulty, mode, quit_callback, seed=None, size=None, telemetry=True, no_repeat=True,
+                 time_per_question=None):
+        self.no_repeat = no_repeat
+        self.time_per_question = TIME_PER_QUESTION if time_per_question is None else time_per_question
+        self.reseed(new_match_seed() if seed is None else seed)
+        self.telemetry = TELEMETRY if telemetry else None
+        self.question_index = 0
+        self.question_family = None
+        self.question_tier = None
+        # Everything is laid out in the Game's own viewport (a kiosk quadrant
+        # or the whole canvas) and drawn with that viewport's shared assets
+        self.width, self.height = size or (SCREEN_W, SCREEN_H)
+        self.view = view_assets(min(self.width / SCREEN_W, self.height / SCREEN_H))
+        self.sim_tick = 0
+        self.accumulator = 0
+        self.synced_ms = None
+        self.q_start_time = 0
+        self.position = 0
+        self.rope_pos = 0.0
+        self.prev_rope_pos = 0.0
+        self.target_pull = TARGET_PULL
+        self.difficulty = difficulty
+        self.mode = mode
+        self.left = PlayerState('left')
+        self.right = PlayerState('right')
+        self.left_label = PLAYER_NAMES["left"]
+        self.right_label = PLAYER_NAMES["right"] if mode == 'PvP' else 'BOT'
+        self.quit_callback = quit_callback
+        self.bot_active = (mode == 'PvBot')
+        self.adaptive = AdaptiveController(('left',) if self.bot_active else ('left', 'right')) \
+            if difficulty == ADAPTIVE else None
+        self.countdown_active = True
+        self.countdown_start_time = self.now()
+        self.question_text = ""
+        self.correct_answer = ""
+        self.game_start_time = 0
+        self.winner = None
+        self.game_over_reason = None
+        self.timer_paused = False
+        self.pause_start_time = 0
+        self.paused_remaining_time = None  
+        self.timeouts = 0
+        self.recorder = None
+        self.replay = None
+        self.replay_tag = ''
+        self.record_results = True
+        self.create_keypads()
+        self.generate_question()
+        self.settings_panel = GameplaySettingsPanel(self, self.quit_callback)
+        px = self.view.px
+        right_label_x = self.width - px(220)
+        self.reset_button = Button((right_label_x, px(70), px(100), px(35)), "Reset",
+                                   self.reset_game_from_button, self.view.font_s)
+        self.settings_button = Button((right_label_x + px(110), px(70), px(50), px(35)), "Opt",
+                                      self.toggle_settings, self.view.font_s)
+
+    def reseed(self, seed):
+        self.seed = seed
+        self.question_rng, self.bot_rng = make_rng_streams(seed)
+        self.questions = QuestionScheduler() if self.no_repeat else None
+
+    def start_recording(self):
+        if RECORD_REPLAYS:
+            try:
+                self.recorder = ReplayRecorder(replay_path_for(self.seed, self.replay_tag), self)
+            except OSError as e:
+                print(f"Replay recording disabled: {e}")
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.record(self.sim_tick, REC_END, arg=zigzag(self.position))
+            PIPELINE.submit(self.recorder.close)
+            self.recorder = None
+
+    # Leaving a match (quit to menu); networked games also hang up here
+    def leave(self):
+        self.stop_recording()
+        if self.telemetry:
+            self.telemetry.flush()
+
+    def record(self, op, side='left', arg=0):
+        if self.recorder:
+            self.recorder.record(self.sim_tick, op, side, arg)
+        if self.telemetry and op in TELEMETRY_KEY_OPS:
+            self.telemetry.key(self, side, op, arg)
+
+    def set_target_pull(self, value):
+        self.target_pull = value
+        self.record(REC_TARGET, arg=value)
+        self.check_winner()
+
+    def reset_game_from_button(self, seed=None):
+        seed = new_match_seed() if seed is None else seed
+        self.record(REC_RESET, arg=seed)
+        self.reseed(seed)
+        self.position = 0
+        self.left = PlayerState('left')
+        self.right = PlayerState('right')
+        self.winner = None
+        self.game_over_reason = None
+        self.countdown_active = True
+        self.countdown_start_time = self.now()
+        self.game_start_time = 0
+        play_sfx(SOUND_COUNTDOWN)
+        self.generate_question()
+
+    def now(self):
+        return self.sim_tick * SIM_TICK_MS
+
+    def toggle_settings(self):
+        self.record(REC_SETTINGS)
+        self.settings_panel.is_visible = not self.settings_panel.is_visible
+        now = self.now()
+        if self.settings_panel.is_visible:
+            if self.q_start_time > 0 and not self.timer_paused:
+                elapsed = now - self.q_start_time
+                self.paused_remaining_time = self.time_limit - elapsed  
+                self.timer_paused = True
+        else:
+            if self.timer_paused and self.q_start_time > 0:
+                self.q_start_time = now - (self.time_limit - self.paused_remaining_time)
+                self.timer_paused = False
+                self.paused_remaining_time = None
+
+    def is_animating(self):
+        return not (self.winner or self.settings_panel.is_visible)
+
+    # Games may be built ahead of time; the countdown starts when one is shown
+    def start(self):
+        play_sfx(SOUND_COUNTDOWN)
+
+    def set_labels(self, left_label, right_label):
+        self.left_label = left_label
+        self.right_label = right_label if self.mode == 'PvP' else 'BOT'
+
+    def prerender(self):
+        prewarm_shared_layers()
+        self.view.prewarm((self.width, self.height))
+        cached_text(self.view.font_xl, self.question_text, TEXT_WHITE)
+
+    def set_bot_answer_time(self):
+        base_time = self.time_per_question * 1000
+        if self.adaptive:
+            elapsed = self.now() - self.game_start_time
+            delay_start = self.adaptive.bot_delay(
+                (self.question_family, self.question_tier), self.target_pull + self.position,
+                ADAPTIVE_MATCH_MS - elapsed, base_time, self.bot_rng)
+            self.bot_typing_delay = self.bot_rng.randint(*BOT_TIMING[self.question_tier][2:])
+        else:
+            low, high, type_low, type_high = BOT_TIMING.get(self.difficulty, BOT_TIMING['EASY'])
+            delay_start = self.bot_rng.randint(int(low * base_time), int(high * base_time))
+            self.bot_typing_delay = self.bot_rng.randint(type_low, type_high)
+        self.bot_answer_time = self.q_start_time + delay_start
+        self.bot_answer_string = str(self.correct_answer)
+        self.bot_char_index = 0
+
+    # Typing from a keyboard zone or controller seated at one of the local sides
+    def type_input(self, side, op, arg):
+        if side in self.local_sides():
+            apply_input(self, op, side, arg)
+
+    # Sides whose keypads are drawn and clickable on this screen
+    def local_sides(self):
+        return ('left',) if self.mode == 'PvBot' else ('left', 'right')
+
+    def create_keypads(self):
+        px = self.view.px
+        pad_w, pad_h = px(180), px(220)
+        left_x = px(40)
+        right_x = self.width - pad_w - px(150)
+        y0 = self.height - pad_h - px(30)
+        self.buttons = []
+        def make_num_callback(player, digit):
+            return lambda: self.on_digit(player, str(digit))
+        for side, x in [('left', left_x), ('right', right_x)]:
+            if side not in self.local_sides():
+                continue
+            digits = [('7', 7), ('8', 8), ('9', 9), ('/', '/'), ('4', 4), ('5', 5), ('6', 6), ('C', 'C'),
+                      ('1', 1), ('2', 2), ('3', 3), ('.', '.')]
+            col = 0
+            row = 0
+            btn_w = px(52)
+            btn_h = px(48)
+            spacing = px(6)
+            for i, (label, value) in enumerate(digits):
+                bx = x + col * (btn_w + spacing)
+                by = y0 + row * (btn_h + spacing)
+                def make_cb(val=value, sd=side):
+                    if val == 'C':
+                        return lambda: self.clear_input(sd)
+                    elif val == '.':
+                        return lambda: self.on_decimal(sd)
+                    elif val == '/':
+                        return lambda: self.on_digit(sd, '/')
+                    else:
+                        return make_num_callback(sd, val)
+                self.buttons.append(Button((bx, by, btn_w, btn_h), str(label), make_cb(), self.view.font_m))
+                col += 1
+                if col > 3:
+                    col = 0
+                    row += 1
+            ok_x = x + 2 * (btn_w + spacing)
+            ok_y = y0 + 3 * (btn_h + spacing)
+            self.buttons.append(Button((ok_x, ok_y, btn_w * 2 + spacing, btn_h), "ENTER", lambda s=side: self.submit_input(s), self.view.font_s))
+
+    def generate_question(self):
+        if self.adaptive:
+            self.question_family, self.question_tier = self.adaptive.pick(self.question_rng)
+        else:
+            self.question_family = pick_question_family(self.difficulty, self.question_rng)
+            self.question_tier = self.difficulty
+        if self.questions:
+            self.question_text, self.correct_answer = self.questions.draw(
+                self.question_family, self.question_tier, self.question_rng)
+        else:
+            self.question_text, self.correct_answer = generate_family_question(
+                self.question_family, self.question_tier, self.question_rng)
+        self.question_index += 1
+        # A question drawn under the countdown (including a prewarmed Game's
+        # first one) is logged when the countdown ends and it is actually shown
+        if self.telemetry and not self.countdown_active:
+            self.telemetry.question(self)
+        self.q_start_time = self.now()
+        self.time_limit = self.time_per_question * 1000
+        self.left.reset_input()
+        self.right.reset_input()
+        if self.bot_active and not self.countdown_active:
+            self.set_bot_answer_time()
+
+    def on_digit(self, side, digit_char):
+        p = self.left if side == 'left' else self.right
+        if len(p.current_input) >= 6:
+            return
+        self.record(REC_DIGIT, side, ord(digit_char))
+        p.current_input += digit_char
+
+    def on_decimal(self, side):
+        p = self.left if side == 'left' else self.right
+        if '.' not in p.current_input:
+            self.record(REC_DECIMAL, side)
+            p.current_input += '.'
+
+    def backspace(self, side):
+        p = self.left if side == 'left' else self.right
+        if p.current_input:
+            self.record(REC_BACKSPACE, side)
+            p.current_input = p.current_input[:-1]
+
+    def clear_input(self, side):
+        self.record(REC_CLEAR, side)
+        (self.left if side == 'left' else self.right).reset_input()
+
+    def submit_input(self, side, is_bot=False):
+        p = self.left if side == 'left' else self.right
+        if not is_bot and p.current_input == "":
+            return
+        if not is_bot:
+            self.record(REC_SUBMIT, side)
+        correct = check_answer(p.current_input, self.correct_answer)
+        p.last_answer_time = self.now()
+        if self.telemetry:
+            self.telemetry.submit(self, side, p.current_input, correct, is_bot)
+        if self.adaptive:
+            kind = (self.question_family, self.question_tier)
+            elapsed = self.now() - self.q_start_time
+            self.adaptive.answer(side, kind, correct, elapsed)
+            if correct:
+                self.adaptive.resolved(kind, side, elapsed)
+                if self.bot_active:
+                    self.adaptive.question_won(side == 'left')
+        if correct:
+            move_amount = 1
+            if side == 'left':
+                self.position -= move_amount
+            else:
+                self.position += move_amount
+            p.correct_count += 1
+            play_sfx(SOUND_CORRECT)
+            if self.bot_active:
+                self.bot_answer_string = ""
+                self.bot_char_index = 0
+                self.right.reset_input()
+            if abs(self.position) >= self.target_pull:
+                self.check_winner()
+                return
+            self.generate_question()
+        else:
+            if not is_bot:
+                play_sfx(SOUND_WRONG)
+                p.wrong_count += 1
+                p.reset_input()
+        self.check_winner()
+
+    def check_winner(self):
+        if self.settings_panel.is_visible:
+            return
+        if abs(self.position) >= self.target_pull:
+            self.winner = self.left_label if self.position <= -self.target_pull else self.right_label
+            session_time = (self.now() - self.game_start_time) if self.game_start_time else 0
+            self.stop_recording()
+            if self.telemetry:
+                self.telemetry.flush()
+            if self.record_results:
+                self.submit_results(session_time)
+            if self.mode == 'PvBot':
+                if self.winner == self.left_label:
+                    self.game_over_reason = 'win'
+                    play_win_sound()
+                    if hasattr(self, 'show_game_over_callback'):
+                        self.show_game_over_callback('win')
+                else:
+                    self.game_over_reason = 'lose'
+                    play_lose_sound()
+                    if hasattr(self, 'show_game_over_callback'):
+                        self.show_game_over_callback('lose')
+            else:
+                play_win_sound()
+                if hasattr(self, 'show_game_over_callback'):
+                    self.show_game_over_callback(
+                        self.left_label, self.right_label,
+                        self.left.correct_count, self.right.correct_count
+                    )
+
+    def submit_results(self, session_time):
+        # Adaptive matches are steered to a set length, so their times do not rank
+        if self.difficulty != ADAPTIVE:
+            if self.mode == 'PvBot':
+                if self.winner == self.left_label:
+                    PIPELINE.submit(add_score, self.left_label, session_time, self.difficulty,
+                                    mode='PvBot', seed=self.seed)
+            else:
+                PIPELINE.submit(add_score, self.left_label, session_time, self.difficulty,
+                                mode='PvP', winner_name=self.winner, seed=self.seed)
+                PIPELINE.submit(add_score, self.right_label, session_time, self.difficulty,
+                                mode='PvP', winner_name=self.winner, seed=self.seed)
+        PIPELINE.submit(run_match_end_hooks, {
+            'mode': self.mode,
+            'difficulty': self.difficulty,
+            'left': self.left_label,
+            'right': self.right_label,
+            'winner': self.winner,
+            'left_score': self.left.correct_count,
+            'right_score': self.right.correct_count,
+            'time': round(session_time / 1000, 2),
+            'seed': self.seed,
+            'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+
+    # Next sim tick at which step() changes the match; nothing happens in between
+    # except the rope easing, so headless servers can jump straight to it
+    def next_event_tick(self):
+        if self.settings_panel.is_visible or self.winner:
+            return None
+        if self.countdown_active:
+            return (self.countdown_start_time + 3500) // SIM_TICK_MS + 1
+        due = []
+        if self.bot_active:
+            if self.bot_char_index < len(self.bot_answer_string):
+                due.append(-(-self.bot_answer_time // SIM_TICK_MS))
+            elif self.bot_char_index > 0:
+                due.append(self.sim_tick + 1)
+        if self.mode == 'PvP' and self.q_start_time > 0:
+            due.append((self.q_start_time + self.time_limit) // SIM_TICK_MS + 1)
+        return max(min(due), self.sim_tick + 1) if due else None
+
+    def catch_up(self, tick):
+        while True:
+            due = self.next_event_tick()
+            if due is None or due > tick:
+                break
+            self.sim_tick = due - 1
+            self.step()
+        self.sim_tick = max(self.sim_tick, tick)
+        self.prev_rope_pos = self.rope_pos = self.position
+
+    # Brings the sim up to an absolute time in pygame ticks. The main loop syncs
+    # to each input's arrival stamp before applying it, then to the frame time,
+    # so inputs land on the sim tick they arrived in whatever the frame rate
+    def sync(self, now_ms):
+        if self.synced_ms is not None and now_ms > self.synced_ms:
+            self.update(now_ms - self.synced_ms)
+        if self.synced_ms is None or now_ms > self.synced_ms:
+            self.synced_ms = now_ms
+
+    # Simulation runs in fixed SIM_TICK_MS steps; the frame time only feeds the accumulator
+    def update(self, dt):
+        self.accumulator += min(dt, MAX_FRAME_MS) * (self.replay.speed if self.replay else 1)
+        while self.accumulator >= SIM_TICK_MS:
+            self.accumulator -= SIM_TICK_MS
+            if self.replay:
+                self.replay.apply_due(self)
+            self.step()
+
+    def step(self):
+        self.sim_tick += 1
+        now = self.now()
+        self.prev_rope_pos = self.rope_pos
+        self.rope_pos += (self.position - self.rope_pos) * ROPE_EASE
+        if self.settings_panel.is_visible or self.winner:
+            return
+        if self.countdown_active:
+            if now - self.countdown_start_time > 3500:
+                self.countdown_active = False
+                self.q_start_time = now
+                self.game_start_time = now
+                if self.telemetry:
+                    self.telemetry.question(self)
+                if self.bot_active:
+                    self.set_bot_answer_time()
+            return
+        if self.bot_active:
+            if (self.bot_char_index < len(self.bot_answer_string) and
+                now >= self.bot_answer_time):
+                char = self.bot_answer_string[self.bot_char_index]
+                self.record(REC_BOT_KEY, 'right', ord(char))
+                self.right.current_input += char
+                self.bot_char_index += 1
+                self.bot_answer_time = now + self.bot_typing_delay
+            elif (self.bot_char_index > 0 and
+                  self.bot_char_index == len(self.bot_answer_string)):
+                self.submit_input('right', is_bot=True)
+        if (self.mode == 'PvP' and
+            self.q_start_time > 0 and
+            now - self.q_start_time > self.time_limit):
+            play_sfx(SOUND_TIMEOUT)
+            self.timeouts += 1
+            if self.telemetry:
+                self.telemetry.timeout(self)
+            if self.adaptive:
+                self.adaptive.resolved((self.question_family, self.question_tier), None, self.time_limit)
+            if self.position >= 0:
+                self.position -= 1
+            else:
+                self.position += 1
+            self.generate_question()
+            self.check_winner()
+
+    # Mouse and touch input on the match: Reset, Opt, the settings panel and the keypads
+    def handle_pointer(self, ev):
+        if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+            if self.reset_button.rect.collidepoint(ev.pos):
+                play_sfx(SOUND_CLICK)
+                self.reset_game_from_button()
+                return
+            if self.settings_button.rect.collidepoint(ev.pos):
+                play_sfx(SOUND_CLICK)
+                self.toggle_settings()
+                return
+            if self.settings_panel.is_visible:
+                self.settings_panel.handle_event(ev)
+                return
+        if not self.settings_panel.is_visible:
+            for b in self.buttons:
+                b.handle_event(ev)
+
+    def draw(self, surf):
+        view = self.view
+        px = view.px
+        width, height = self.width, self.height
+        surf.blit(view.background((width, height)), (0, 0))
+        mid_x = width // 2
+        rope_y = height // 2 - px(10)
+        if not self.countdown_active:
+            left_label = cached_text(view.font_l, self.left_label, COLOR_P1)
+            right_label = cached_text(view.font_l, self.right_label, COLOR_P2)
+            surf.blit(left_label, (px(60), px(20)))
+            surf.blit(right_label, (width - px(60) - right_label.get_width(), px(20)))
+            score_txt = f"{self.left.correct_count} - {self.right.correct_count}"
+            score_m = glyph_atlas(view.font_xl, TEXT_WHITE)
+            s_x = mid_x - score_m.width(score_txt) // 2
+            s_y = px(20)
+            glyph_atlas(view.font_xl, (0, 0, 0)).draw(surf, score_txt, (s_x + px(3), s_y + px(3)))
+            score_m.draw(surf, score_txt, (s_x, s_y))
+            qtxt_main = cached_text(view.font_xl, self.question_text, (0, 0, 0))
+            surf.blit(qtxt_main, (mid_x - qtxt_main.get_width() // 2 + px(2), px(182)))
+            qtxt_main = cached_text(view.font_xl, self.question_text, TEXT_WHITE)
+            surf.blit(qtxt_main, (mid_x - qtxt_main.get_width() // 2, px(180)))
+            for b in self.buttons:
+                b.draw(surf)
+            self.reset_button.draw(surf)
+            self.settings_button.draw(surf)
+            inputs = glyph_atlas(view.font_l, TEXT_BROWN)
+            inputs.draw(surf, self.left.current_input or "0", (px(60), height - px(290)))
+            inputs.draw(surf, self.right.current_input or "0", (width - px(160), height - px(290)))
+            if self.q_start_time > 0:
+                if self.timer_paused and self.paused_remaining_time is not None:
+                    rem = max(0, int(self.paused_remaining_time / 1000))
+                else:
+                    elapsed = self.now() - self.q_start_time
+                    rem = max(0, int((self.time_limit - elapsed) / 1000))
+            else:
+                rem = self.time_per_question
+            timer_txt = f"Time: {rem}s"
+            timer = glyph_atlas(view.font_m, COLOR_P2 if rem <= 5 else TEXT_BROWN)
+            timer.draw(surf, timer_txt, (mid_x - timer.width(timer_txt) // 2, height - px(320)))
+            seed_txt = cached_text(view.font_s, f"Seed: {self.seed}", TEXT_BROWN)
+            surf.blit(seed_txt, (mid_x - seed_txt.get_width() // 2, height - px(30)))
+        alpha = self.accumulator / SIM_TICK_MS
+        step_w = 18 * view.scale
+        rope_center_x = mid_x + int((self.prev_rope_pos + (self.rope_pos - self.prev_rope_pos) * alpha) * step_w)
+        sprites = view.sprites
+        rope_tile = sprites.get('rope')
+        if rope_tile:
+            # Tile only across the visible width, phased so the twists move with the rope
+            tile_y = rope_y + view.rope_offset_y
+            x = rope_center_x % rope_tile.width - rope_tile.width
+            while x < width:
+                sprites.blit(surf, 'rope', (x, tile_y))
+                x += rope_tile.width
+        else:
+            pygame.draw.line(surf, (150, 100, 50), (0, rope_y), (width, rope_y), px(10))
+            pygame.draw.circle(surf, COLOR_ROPE_DETAIL, (rope_center_x, rope_y), px(15))
+        indicator_rect = sprites.get('indicator')
+        if indicator_rect:
+            ind_rect = indicator_rect.copy()
+            ind_rect.center = (rope_center_x, rope_y)
+            sprites.blit(surf, 'indicator', ind_rect)
+        target_rect = sprites.get('target')
+        offset_dist = int(self.target_pull * step_w)
+        if target_rect:
+            img_width = target_rect.width
+            img_height = target_rect.height
+            target_y = rope_y - (img_height // 2)
+            sprites.blit(surf, 'target', (mid_x - offset_dist - (img_width // 2), target_y))
+            sprites.blit(surf, 'target', (mid_x + offset_dist - (img_width // 2), target_y))
+        else:
+            pygame.draw.line(surf, COLOR_P1, (mid_x - offset_dist, 0), (mid_x - offset_dist, height), px(4))
+            pygame.draw.line(surf, COLOR_P2, (mid_x + offset_dist, 0), (mid_x + offset_dist, height), px(4))
+        left_rect = sprites.get('player_left')
+        if left_rect:
+            left_char_x = px(60)
+            left_char_y = rope_y - (left_rect.height // 2) - px(30)
+            sprites.blit(surf, 'player_left', (left_char_x, left_char_y))
+        else:
+            pygame.draw.ellipse(surf, COLOR_P1, (px(20), rope_y - px(40), px(80), px(80)))
+        right_rect = sprites.get('player_right')
+        if right_rect:
+            right_char_x = width - px(60) - right_rect.width
+            right_char_y = rope_y - (right_rect.height // 2) - px(30)
+            sprites.blit(surf, 'player_right', (right_char_x, right_char_y))
+        else:
+            pygame.draw.ellipse(surf, COLOR_P2, (width - px(100), rope_y - px(40), px(80), px(80)))
+        self.settings_panel.draw(surf)
+        if self.countdown_active:
+            surf.blit(overlay_layer((width, height)), (0, 0))
+            elapsed = self.now() - self.countdown_start_time
+            seconds = 3 - int(elapsed / 1000)
+            if seconds > 0:
+                text = str(seconds)
+            elif elapsed < 3500:
+                text = "GO!"
+            else:
+                text = ""
+            if text:
+                cd_txt_large = view.countdown(text)
+                surf.blit(cd_txt_large, (mid_x - cd_txt_large.get_width() // 2, height // 2 - cd_txt_large.get_height() // 2))
+        if self.winner:
+            surf.blit(overlay_layer((width, height)), (0, 0))
+            if self.game_over_reason == 'lose':
+                msg_txt = "YOU LOSE!"
+                col = COLOR_P2
+            else:
+                msg_txt = f"{self.winner} WINS!"
+                col = COLOR_P1
+            win_txt = cached_text(view.font_xl, msg_txt, col)
+            surf.blit(win_txt, (mid_x - win_txt.get_width() // 2, height // 2 - px(60)))
+            rst_txt = cached_text(view.font_m, "Press Reset to play again", TEXT_WHITE)
+            surf.blit(rst_txt, (mid_x - rst_txt.get_width() // 2, height // 2 + px(20)))
+
+# Game Over Screen
+class GameOverScreen:
+    def __init__(self, reason, player_name=None, p1_name=None, p2_name=None, p1_score=0, p2_score=0, return_callback=None, seed=None):
+        self.reason = reason
+        self.seed = seed
+        self.player_name = player_name
+        self.p1_name = p1_name
+        self.p2_name = p2_name
+        self.p1_score = p1_score
+        self.p2_score = p2_score
+        self.return_callback = return_callback
+        center_x = SCREEN_W // 2
+        self.back_button = Button((center_x - 120, SCREEN_H - 160, 240, 55), "MAIN MENU", return_callback, FONT_L)
+        self.layer = None
+    def handle_event(self, ev):
+        self.back_button.handle_event(ev)
+    def draw(self, surf):
+        if self.layer is None:
+            self.prerender()
+        surf.blit(self.layer, (0, 0))
+        self.back_button.draw(surf)
+    def prerender(self):
+        self.layer = cached_layer('dimmed_bg', build_dimmed_background).copy()
+        surf = self.layer
+        if self.reason == 'lose':  
+            title = FONT_XL.render("GAME OVER", True, COLOR_P2)
+            subtitle = FONT_L.render("The BOT was faster!", True, TEXT_WHITE)
+            surf.blit(title, (SCREEN_W // 2 - title.get_width() // 2, 150))
+            surf.blit(subtitle, (SCREEN_W // 2 - subtitle.get_width() // 2, 230))
+        elif self.reason == 'pvp':  
+            trophy = FONT_XL.render("WINNER!", True, (255, 215, 0))
+            surf.blit(trophy, (SCREEN_W // 2 - trophy.get_width() // 2, 120))
+            winner_name = self.p1_name if self.p1_score > self.p2_score else self.p2_name
+            win_txt = FONT_XL.render(winner_name, True, COLOR_P1)
+            win_shadow = FONT_XL.render(winner_name, True, (0, 0, 0))
+            surf.blit(win_shadow, (SCREEN_W // 2 - win_txt.get_width() // 2 + 3, 200 + 3))
+            surf.blit(win_txt, (SCREEN_W // 2 - win_txt.get_width() // 2, 200))
+            subtitle = FONT_L.render("WINS THE TUG OF WAR!", True, TEXT_WHITE)
+            surf.blit(subtitle, (SCREEN_W // 2 - subtitle.get_width() // 2, 280))
+            score_str = f"{self.p1_score} – {self.p2_score}"
+            score_txt = FONT_L.render(score_str, True, TEXT_WHITE)
+            surf.blit(score_txt, (SCREEN_W // 2 - score_txt.get_width() // 2, 350))
+            label = FONT_S.render("Final Score", True, (200, 200, 200))
+            surf.blit(label, (SCREEN_W // 2 - label.get_width() // 2, 390))
+        if self.seed is not None:
+            seed_txt = FONT_S.render(f"Seed: {self.seed}", True, (200, 200, 200))
+            surf.blit(seed_txt, (SCREEN_W // 2 - seed_txt.get_width() // 2, SCREEN_H - 90))
+
+# Match replays: an append-only log of varint-encoded records, each one
+# (tick delta, opcode * 2 + side, argument), after a small header.
+REPLAY_MAGIC = b'MTWR'
+REPLAY_VERSION = 2
+REPLAY_VERSIONS = (1, 2)
+REPLAY_BUFFER = 4096
+(REC_DIGIT, REC_DECIMAL, REC_BACKSPACE, REC_CLEAR, REC_SUBMIT,
+ REC_SETTINGS, REC_TARGET, REC_RESET, REC_BOT_KEY, REC_END) = range(1, 11)
+ACTIVE_RECORDERS = set()
+REPLAY_SPEED_KEYS = {'1': 1, '2': 2, '3': 4, '4': 8}
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+def write_varint(buf, value):
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def write_replay_str(buf, text):
+    raw = text.encode('utf-8')
+    write_varint(buf, len(raw))
+    buf.extend(raw)
+
+def read_replay_str(data, pos):
+    length, pos = read_varint(data, pos)
+    if pos + length > len(data):
+        raise IndexError("string runs past the end of the data")
+    return data[pos:pos + length].decode('utf-8'), pos + length
+
+def replay_path_for(seed, tag=''):
+    return os.path.join(REPLAY_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{seed}{tag}.mtwr")
+
+# Matches with the same seed started in the same second (a rematch, or server
+# matches under --seed) would share a name, so later ones get a counter suffix
+def create_replay_file(path):
+    stem, ext = os.path.splitext(path)
+    for n in itertools.count(1):
+        candidate = path if n == 1 else f"{stem}-{n}{ext}"
+        try:
+            return candidate, open(candidate, 'xb', buffering=REPLAY_BUFFER)
+        except FileExistsError:
+            pass
+
+# Replays the recorded (and networked) input ops against a Game
+def apply_input(game, op, side, arg):
+    if op == REC_DIGIT:
+        game.on_digit(side, chr(arg))
+    elif op == REC_DECIMAL:
+        game.on_decimal(side)
+    elif op == REC_BACKSPACE:
+        game.backspace(side)
+    elif op == REC_CLEAR:
+        game.clear_input(side)
+    elif op == REC_SUBMIT:
+        game.submit_input(side)
+    elif op == REC_SETTINGS:
+        game.toggle_settings()
+    elif op == REC_TARGET:
+        game.set_target_pull(arg)
+    elif op == REC_RESET:
+        game.reset_game_from_button(arg)
+
+class ReplayRecorder:
+    def __init__(self, path, game):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path, self.file = create_replay_file(path)
+        self.last_tick = 0
+        header = bytearray(REPLAY_MAGIC)
+        for value in (REPLAY_VERSION, SIM_TICK_MS, game.seed, game.target_pull, game.time_per_question):
+            write_varint(header, value)
+        for text in (game.difficulty, game.mode, game.left_label, game.right_label):
+            write_replay_str(header, text)
+        self.file.write(header)
+        ACTIVE_RECORDERS.add(self)
+
+    def record(self, tick, op, side='left', arg=0):
+        buf = bytearray()
+        write_varint(buf, tick - self.last_tick)
+        write_varint(buf, op * 2 + (side == 'right'))
+        write_varint(buf, arg)
+        self.last_tick = tick
+        self.file.write(buf)
+
+    def close(self):
+        if self in ACTIVE_RECORDERS:
+            ACTIVE_RECORDERS.discard(self)
+            self.file.close()
+
+# During playback the Game's own bot keystrokes are checked against the recorded ones
+class ReplayVerifier:
+    def __init__(self, expected_bot_keys, until=None):
+        self.expected = expected_bot_keys
+        self.until = until
+        self.index = 0
+        self.mismatches = 0
+
+    def record(self, tick, op, side='left', arg=0):
+        if op != REC_BOT_KEY or (self.until is not None and tick > self.until):
+            return
+        if self.index >= len(self.expected) or self.expected[self.index] != (tick, arg):
+            self.mismatches += 1
+        self.index += 1
+
+    def close(self):
+        pass
+
+class ReplayPlayer:
+    def __init__(self, path, speed=1):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != REPLAY_MAGIC:
+            raise ValueError(f"{path} is not a Math Tug War replay")
+        pos = 4
+        header = []
+        try:
+            for _ in range(5):
+                value, pos = read_varint(data, pos)
+                header.append(value)
+            version, tick_ms, self.seed, self.target_pull, self.time_per_question = header
+            if version not in REPLAY_VERSIONS or tick_ms != SIM_TICK_MS:
+                raise ValueError(f"{path}: unsupported replay (version {version}, tick {tick_ms} ms)")
+            self.version = version
+            self.difficulty, pos = read_replay_str(data, pos)
+            self.mode, pos = read_replay_str(data, pos)
+            self.left_label, pos = read_replay_str(data, pos)
+            self.right_label, pos = read_replay_str(data, pos)
+        except (IndexError, UnicodeDecodeError):
+            raise ValueError(f"{path}: truncated or damaged replay header")
+        self.events = []
+        self.bot_keys = []
+        self.final_position = None
+        self.end_tick = None
+        tick = 0
+        # A recording cut short (the game was killed mid-match) ends at its
+        # last complete record
+        while pos < len(data):
+            try:
+                delta, pos = read_varint(data, pos)
+                code, pos = read_varint(data, pos)
+                arg, pos = read_varint(data, pos)
+            except IndexError:
+                break
+            tick += delta
+            op, side = code // 2, ('right' if code % 2 else 'left')
+            if op == REC_BOT_KEY:
+                self.bot_keys.append((tick, arg))
+            elif op == REC_END:
+                self.final_position = unzigzag(arg)
+                self.end_tick = tick
+            else:
+                self.events.append((tick, op, side, arg))
+        self.last_tick = tick
+        self.size = len(data)
+        self.speed = speed
+        self.index = 0
+        # Past the end of a cut-short recording there is nothing to check against
+        self.verifier = ReplayVerifier(self.bot_keys, self.last_tick if self.end_tick is None else None)
+
+    def build_game(self, quit_callback):
+        # Version 1 replays were recorded with independently sampled questions
+        game = Game(self.difficulty, self.mode, quit_callback, seed=self.seed, telemetry=False,
+                    no_repeat=self.version >= 2, time_per_question=self.time_per_question)
+        game.target_pull = self.target_pull
+        game.left_label = self.left_label
+        game.right_label = self.right_label
+        game.record_results = False
+        game.recorder = self.verifier
+        game.replay = self
+        return game
+
+    def apply_due(self, game):
+        while self.index < len(self.events) and self.events[self.index][0] <= game.sim_tick:
+            _, op, side, arg = self.events[self.index]
+            self.index += 1
+            apply_input(game, op, side, arg)
+
+    def finished(self, game):
+        if self.index < len(self.events):
+            return False
+        end_tick = self.end_tick if self.end_tick is not None else self.last_tick
+        return bool(game.winner) or game.sim_tick >= end_tick
+
+    # Max-speed headless playback: step the simulation without rendering
+    def verify(self):
+        game = self.build_game(lambda: None)
+        while not self.finished(game):
+            self.apply_due(game)
+            game.step()
+        ok = (self.verifier.mismatches == 0 and self.verifier.index == len(self.bot_keys) and
+              (self.final_position is None or self.final_position == game.position))
+        return ok, game
+
+# Question telemetry: each question's lifecycle (shown, keystrokes, submits
+# with correctness and response time, timeout) becomes one compact JSON line.
+# Events are batched on the main thread and written in order by the game-over
+# pipeline's worker to rotating files. Response times also feed constant-memory
+# P² quantile sketches per question family and difficulty, which the teacher
+# overlay (T during a match) reads without touching the files.
+TELEMETRY = None
+TELEMETRY_DIR = os.path.join(GAME_DIR, 'telemetry')
+TELEMETRY_MAX_BYTES = 4 << 20
+TELEMETRY_KEEP = 5
+TELEMETRY_BATCH = 64
+TELEMETRY_FLUSH_MS = 2000
+TELEMETRY_KEY_OPS = {REC_DIGIT: 'digit', REC_DECIMAL: 'decimal', REC_BACKSPACE: 'backspace', REC_CLEAR: 'clear'}
+
+# Streaming quantile estimate in five markers (Jain & Chlamtac's P² algorithm)
+class P2Quantile:
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5 or self.positions[4] == 5:
+            return q[round(self.p * (len(q) - 1))]
+        return q[2]
+
+class FamilyStats:
+    def __init__(self):
+        self.shown = 0
+        self.correct = 0
+        self.wrong = 0
+        self.timeouts = 0
+        self.median = P2Quantile(0.5)
+        self.p90 = P2Quantile(0.9)
+
+    def accuracy(self):
+        answered = self.correct + self.wrong
+        return self.correct / answered if answered else None
+
+class QuestionTelemetry:
+    def __init__(self, directory=TELEMETRY_DIR, max_bytes=TELEMETRY_MAX_BYTES, keep=TELEMETRY_KEEP):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.events = []
+        self.last_flush = time.monotonic()
+        self.stats = {}
+        self.version = 0
+        self.file = None
+
+    def family_stats(self, game):
+        key = (game.question_family, game.question_tier)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = FamilyStats()
+        return stats
+
+    def emit(self, game, kind, **fields):
+        event = {'ev': kind, 'ts': round(time.time(), 3), 'match': game.seed, 'q': game.question_index,
+                 'tick': game.now()}
+        event.update(fields)
+        self.events.append(event)
+        if (len(self.events) >= TELEMETRY_BATCH or
+                (time.monotonic() - self.last_flush) * 1000 >= TELEMETRY_FLUSH_MS):
+            self.flush()
+
+    def question(self, game):
+        self.family_stats(game).shown += 1
+        self.version += 1
+        self.emit(game, 'question', family=game.question_family, difficulty=game.question_tier, mode=game.mode,
+                  text=game.question_text, answer=str(game.correct_answer))
+
+    def key(self, game, side, op, arg):
+        if op == REC_DIGIT:
+            self.emit(game, 'key', side=side, key=TELEMETRY_KEY_OPS[op], char=chr(arg))
+        else:
+            self.emit(game, 'key', side=side, key=TELEMETRY_KEY_OPS[op])
+
+    def submit(self, game, side, answer, correct, is_bot):
+        latency = game.now() - game.q_start_time
+        if not is_bot:
+            stats = self.family_stats(game)
+            if correct:
+                stats.correct += 1
+                stats.median.add(latency)
+                stats.p90.add(latency)
+            else:
+                stats.wrong += 1
+            self.version += 1
+        self.emit(game, 'submit', side=side, answer=answer, correct=correct, latency=latency, bot=is_bot)
+
+    def timeout(self, game):
+        self.family_stats(game).timeouts += 1
+        self.version += 1
+        self.emit(game, 'timeout', latency=game.time_limit)
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.events:
+            PIPELINE.submit(self.write, self.events)
+            self.events = []
+
+    def close(self):
+        self.flush()
+        PIPELINE.submit(self.close_file)
+
+    def path(self, index=0):
+        return os.path.join(self.directory, f"questions.{index}.jsonl" if index else "questions.jsonl")
+
+    # The methods below run on the pipeline worker
+    def write(self, events):
+        if self.file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(self.path(), 'a', encoding='utf-8')
+        self.file.write(''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events))
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.close_file()
+        for index in range(self.keep - 1, 0, -1):
+            if os.path.exists(self.path(index)):
+                os.replace(self.path(index), self.path(index + 1))
+        os.replace(self.path(), self.path(1))
+
+    def close_file(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+# Teacher overlay: per-family accuracy and response times from the telemetry
+# sketches. The table is only re-rendered when the stats have changed.
+TEACHER_COLUMNS = ('FAMILY', 'LEVEL', 'SHOWN', 'RIGHT', 'WRONG', 'TIMEOUT', 'MEDIAN', 'P90')
+TEACHER_COLUMN_W = 92
+TEACHER_ROW_H = 24
+
+def format_ms(ms):
+    return '-' if ms is None else f"{ms / 1000:.1f}s"
+
+class TeacherOverlay:
+    def __init__(self):
+        self.visible = False
+        self.version = None
+        self.layer = None
+
+    def toggle(self):
+        self.visible = not self.visible and TELEMETRY is not None
+
+    def build(self):
+        rows = [TEACHER_COLUMNS]
+        for (family, difficulty), stats in sorted(TELEMETRY.stats.items(), key=lambda item: str(item[0])):
+            rows.append((str(family).upper(), difficulty, str(stats.shown), str(stats.correct), str(stats.wrong),
+                         str(stats.timeouts), format_ms(stats.median.value()), format_ms(stats.p90.value())))
+        width = TEACHER_COLUMN_W * len(TEACHER_COLUMNS) + 20
+        layer = pygame.Surface((width, TEACHER_ROW_H * len(rows) + 16), pygame.SRCALPHA)
+        layer.fill(BLACK_TRANSPARENT)
+        for r, row in enumerate(rows):
+            for c, cell in enumerate(row):
+                layer.blit(cached_text(FONT_S, cell, TEXT_WHITE), (10 + c * TEACHER_COLUMN_W, 8 + r * TEACHER_ROW_H))
+        return layer
+
+    def draw(self, surf):
+        if not self.visible:
+            return
+        if self.version != TELEMETRY.version:
+            self.layer = self.build()
+            self.version = TELEMETRY.version
+        surf.blit(self.layer, self.layer.get_rect(midtop=(surf.get_width() // 2, 10)))
+
+# Offscreen replay export: the main thread steps and draws the match at a fixed
+# frame rate, a thread pool compresses frames (zlib releases the GIL) or feeds
+# raw RGB to an external encoder in order.
+EXPORT_FPS = 30
+EXPORT_TAIL_SECONDS = 2
+EXPORT_PNG_LEVEL = 1
+EXPORT_RGB_MASKS = (0xFF, 0xFF00, 0xFF0000, 0)
+
+# Surfaces laid out as R, G, B bytes can be read back with a single copy
+def rgb_bytes(surface):
+    if surface.get_pitch() == surface.get_width() * 3 and surface.get_masks() == EXPORT_RGB_MASKS:
+        return surface.get_buffer().raw
+    return pygame.image.tobytes(surface, 'RGB')
+
+def encode_png(rgb, width, height):
+    stride = width * 3
+    raw = b''.join(b'\x00' + rgb[y * stride:(y + 1) * stride] for y in range(height))
+    def chunk(tag, body):
+        return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw, EXPORT_PNG_LEVEL)) +
+            chunk(b'IEND', b''))
+
+class ReplayExporter:
+    def __init__(self, player, out, size=None, fps=EXPORT_FPS, raw=False, encoder=None, workers=None):
+        self.player = player
+        self.out = out
+        self.size = size or (SCREEN_W, SCREEN_H)
+        self.fps = fps
+        self.raw = raw or bool(encoder)
+        self.encoder = encoder
+        self.workers = workers or os.cpu_count() or 2
+        self.frames = 0
+
+    def write_png(self, index, rgb):
+        with open(os.path.join(self.out, f"frame_{index:06d}.png"), 'wb') as f:
+            f.write(encode_png(rgb, self.size[0], self.size[1]))
+
+    def run(self):
+        game = self.player.build_game(lambda: None)
+        canvas = pygame.Surface((SCREEN_W, SCREEN_H), 0, 24, EXPORT_RGB_MASKS)
+        scaled = pygame.Surface(self.size, 0, 24, EXPORT_RGB_MASKS) if self.size != (SCREEN_W, SCREEN_H) else None
+        if self.encoder:
+            proc = subprocess.Popen(shlex.split(self.encoder), stdin=subprocess.PIPE)
+            sink = proc.stdin
+        elif self.raw:
+            proc = None
+            sink = sys.stdout.buffer if self.out == '-' else open(self.out, 'wb')
+        else:
+            proc = None
+            sink = None
+            os.makedirs(self.out, exist_ok=True)
+        # Raw output must stay in order, so it gets a single writer thread
+        pool = ThreadPoolExecutor(max_workers=1 if sink else self.workers)
+        pending = deque()
+        tail = EXPORT_TAIL_SECONDS * self.fps
+        try:
+            while tail > 0:
+                if self.player.finished(game):
+                    tail -= 1
+                dt = (self.frames + 1) * 1000 // self.fps - self.frames * 1000 // self.fps
+                game.update(dt)
+                game.draw(canvas)
+                frame = canvas
+                if scaled:
+                    pygame.transform.scale(canvas, self.size, scaled)
+                    frame = scaled
+                rgb = rgb_bytes(frame)
+                if sink:
+                    pending.append(pool.submit(sink.write, rgb))
+                else:
+                    pending.append(pool.submit(self.write_png, self.frames, rgb))
+                self.frames += 1
+                while len(pending) > self.workers * 2:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+        finally:
+            pool.shutdown()
+            if sink and sink is not sys.stdout.buffer:
+                sink.close()
+            if proc:
+                proc.wait()
+        return self.frames
+
+# Networked PvP over UDP. A match server owns every match: it runs a normal
+# Game per match, applies each client's input ops (the replay opcodes) exactly
+# once and in order, and sends snapshots at the network tick rate whenever a
+# match changed. Clients resend unacknowledged inputs in every input packet
+# until a snapshot acks them and predict their own input field by replaying
+# the still-pending ops on top of the server's copy. Every packet carries a
+# connection id, so one socket can carry many clients (load testing). Headless
+# matches are not stepped every tick: a timer wheel shared by all matches of a
+# shard wakes a match only at its next countdown end, bot keystroke or
+# question timeout. LossyLink adds latency, jitter and loss for testing.
+NET_PORT = 50517
+NET_TICK_RATE = 30
+NET_VERSION = 2
+NET_MAGIC = b'MT' + bytes([NET_VERSION])
+NET_MAX_PACKET = 2048
+NET_MAX_INPUTS = 32
+NET_RESEND_MS = 50
+NET_HELLO_MS = 250
+NET_PING_MS = 500
+NET_KEEPALIVE_MS = 1000
+NET_STALE_MS = 2000
+NET_TIMEOUT_MS = 5000
+NET_SWEEP_MS = 1000
+NET_METRICS_MS = 1000
+NET_METRICS_LOG_S = 5
+NET_WHEEL_SLOTS = 1024
+NET_SOCKET_BUFFER = 4 << 20
+NET_SIDES = ('left', 'right')
+NET_MODES = ('PvP', 'PvBot')
+NET_DIFFICULTIES = ('EASY', 'MID', 'HARD')
+(NET_HELLO, NET_WELCOME, NET_INPUT, NET_SNAPSHOT, NET_PING, NET_PONG, NET_BYE,
+ NET_REDIRECT, NET_STATS, NET_METRICS) = range(1, 11)
+NET_INPUT_OPS = (REC_DIGIT, REC_DECIMAL, REC_BACKSPACE, REC_CLEAR, REC_SUBMIT, REC_TARGET, REC_RESET)
+NET_INPUT_CHARS = '0123456789/'
+NET_SNAPSHOT_FIELDS = ('tick', 'seed', 'waiting', 'countdown', 'position', 'target',
+                       'left_score', 'right_score', 'left_wrong', 'right_wrong', 'timeouts',
+                       'q_start_time', 'countdown_start_time', 'game_start_time', 'time_limit')
+NET_SNAPSHOT_TEXT = ('question', 'left_input', 'right_input', 'left_label', 'right_label', 'winner')
+NET_SERVER = None
+NET_NAME = 'PLAYER'
+NET_LINK = {}
+SHARD_STOP = None
+
+def net_clock():
+    return time.perf_counter() * 1000
+
+def net_packet(kind, conn, body=b''):
+    buf = bytearray(NET_MAGIC)
+    buf.append(kind)
+    write_varint(buf, conn)
+    buf.extend(body)
+    return bytes(buf)
+
+def read_net_header(data):
+    if data[:3] != NET_MAGIC:
+        raise ValueError("not a Math Tug War packet")
+    conn, pos = read_varint(data, 4)
+    return data[3], conn, pos
+
+def parse_address(text, default_port=NET_PORT):
+    host, _, port = text.rpartition(':')
+    if not host:
+        return text, default_port
+    return host, int(port)
+
+# Bigger kernel buffers ride out event loop stalls instead of dropping datagrams
+def enlarge_socket_buffers(transport):
+    sock = transport.get_extra_info('socket')
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, NET_SOCKET_BUFFER)
+        except OSError:
+            pass
+
+def is_loopback(addr):
+    return addr[0].startswith('127.') or addr[0] == '::1'
+
+# The input field edit rules of Game.on_digit/on_decimal/backspace/clear_input
+def edit_input(text, op, arg=0):
+    if op == REC_DIGIT:
+        return text + chr(arg) if len(text) < 6 else text
+    if op == REC_DECIMAL:
+        return text if '.' in text else text + '.'
+    if op == REC_BACKSPACE:
+        return text[:-1]
+    if op == REC_CLEAR:
+        return ""
+    return text
+
+# Only what the keypads and the settings panel can produce reaches a server Game
+def valid_net_input(op, arg):
+    if op == REC_DIGIT:
+        return 0 <= arg < 0x110000 and chr(arg) in NET_INPUT_CHARS
+    if op == REC_TARGET:
+        return TARGET_PULL_RANGE[0] <= arg <= TARGET_PULL_RANGE[1]
+    return op in NET_INPUT_OPS
+
+# Reads a question the way a player would (scripted test and load clients)
+def solve_question(text):
+    def term(token):
+        if '√' in token:
+            index, _, value = token.partition('√')
+            return Fraction(round(int(value) ** (1 / int(index or 2))))
+        return Fraction(token)
+    left, op, right = text.replace(' = ?', '').split(' ')
+    ops = {'+': operator.add, '-': operator.sub, '*': operator.mul}
+    return str(ops[op](term(left), term(right)))
+
+def encode_snapshot(game, tick=None):
+    buf = bytearray()
+    if game is None:
+        values, texts = {'waiting': 1}, {}
+    else:
+        values = {
+            'tick': game.sim_tick if tick is None else tick, 'seed': game.seed,
+            'countdown': int(game.countdown_active),
+            'position': zigzag(game.position), 'target': game.target_pull,
+            'left_score': game.left.correct_count, 'right_score': game.right.correct_count,
+            'left_wrong': game.left.wrong_count, 'right_wrong': game.right.wrong_count,
+            'timeouts': game.timeouts, 'q_start_time': game.q_start_time,
+            'countdown_start_time': game.countdown_start_time,
+            'game_start_time': game.game_start_time, 'time_limit': game.time_limit,
+        }
+        texts = {
+            'question': game.question_text, 'left_input': game.left.current_input,
+            'right_input': game.right.current_input, 'left_label': game.left_label,
+            'right_label': game.right_label, 'winner': game.winner or "",
+        }
+    for name in NET_SNAPSHOT_FIELDS:
+        write_varint(buf, values.get(name, 0))
+    for name in NET_SNAPSHOT_TEXT:
+        write_replay_str(buf, texts.get(name, ""))
+    return buf
+
+def decode_snapshot(data, pos):
+    snap = {}
+    for name in NET_SNAPSHOT_FIELDS:
+        snap[name], pos = read_varint(data, pos)
+    for name in NET_SNAPSHOT_TEXT:
+        snap[name], pos = read_replay_str(data, pos)
+    snap['position'] = unzigzag(snap['position'])
+    return snap
+
+def encode_hello(name, mode, difficulty):
+    buf = bytearray()
+    for text in (name, mode, difficulty):
+        write_replay_str(buf, text)
+    return buf
+
+def decode_hello(data, pos):
+    name, pos = read_replay_str(data, pos)
+    mode, pos = read_replay_str(data, pos)
+    difficulty, pos = read_replay_str(data, pos)
+    name = (name.strip() or "PLAYER")[:10].upper()
+    return (name, mode if mode in NET_MODES else 'PvP',
+            difficulty if difficulty in NET_DIFFICULTIES else DIFFICULTY)
+
+# Outgoing datagrams go through a link that can delay, reorder and drop them.
+# With an asyncio loop delays are loop timers; otherwise pump() sends what is due.
+class LossyLink:
+    def __init__(self, sendto, latency=0, jitter=0, loss=0.0, loop=None, seed=None):
+        self.sendto = sendto
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.loop = loop
+        self.rng = random.Random(seed)
+        self.queue = []
+        self.count = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, data, addr):
+        self.sent += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay <= 0:
+            self.deliver(data, addr)
+        elif self.loop:
+            self.loop.call_later(delay / 1000, self.deliver, data, addr)
+        else:
+            self.count += 1
+            heapq.heappush(self.queue, (net_clock() + delay, self.count, data, addr))
+
+    def deliver(self, data, addr):
+        try:
+            self.sendto(data, addr)
+        except OSError:
+            pass
+
+    def pump(self):
+        now = net_clock()
+        while self.queue and self.queue[0][0] <= now:
+            _, _, data, addr = heapq.heappop(self.queue)
+            self.deliver(data, addr)
+
+
+# Hashed timer wheel: one slot per sim tick, timers further out than a turn
+# wait in their slot until their tick comes round. Cancelling just clears the
+# callback, so rescheduling a match is O(1).
+class TimerWheel:
+    def __init__(self, slots=NET_WHEEL_SLOTS):
+        self.slots = [[] for _ in range(slots)]
+        self.tick = 0
+
+    def schedule(self, tick, callback, *args):
+        timer = [max(tick, self.tick + 1), callback, args]
+        self.slots[timer[0] % len(self.slots)].append(timer)
+        return timer
+
+    @staticmethod
+    def cancel(timer):
+        if timer:
+            timer[1] = None
+
+    def advance(self, tick):
+        while self.tick < tick:
+            self.tick += 1
+            slot = self.slots[self.tick % len(self.slots)]
+            if not slot:
+                continue
+            due = [timer for timer in slot if timer[0] <= self.tick]
+            if not due:
+                continue
+            slot[:] = [timer for timer in slot if timer[0] > self.tick]
+            for _, callback, args in due:
+                if callback:
+                    callback(*args)
+
+class ServerMetrics:
+    def __init__(self, shard=0):
+        self.shard = shard
+        self.totals = dict.fromkeys(('started', 'completed', 'inputs', 'packets_in', 'packets_out'), 0)
+        self.lag_sum = 0
+        self.lag_count = 0
+        self.lag_max = 0
+        self.run_lag_max = 0
+
+    def tick_lag(self, ms):
+        ms = max(0, ms)
+        self.lag_sum += ms
+        self.lag_count += 1
+        self.lag_max = max(self.lag_max, ms)
+        self.run_lag_max = max(self.run_lag_max, ms)
+
+    def report(self, matches, clients, reset=True):
+        report = dict(self.totals, shard=self.shard, matches=matches, clients=clients,
+                      ticks=self.lag_count, lag_avg=self.lag_sum / max(1, self.lag_count),
+                      lag_max=self.lag_max, run_lag_max=self.run_lag_max)
+        if reset:
+            self.lag_sum = self.lag_count = self.lag_max = 0
+        return report
+
+def merge_metrics(reports):
+    merged = {'matches': 0, 'clients': 0, 'ticks': 0, 'lag_max': 0, 'run_lag_max': 0,
+              'started': 0, 'completed': 0, 'inputs': 0, 'packets_in': 0, 'packets_out': 0}
+    lag_sum = 0
+    for report in reports:
+        for name in ('matches', 'clients', 'ticks', 'started', 'completed', 'inputs', 'packets_in', 'packets_out'):
+            merged[name] += report[name]
+        lag_sum += report['lag_avg'] * report['ticks']
+        merged['lag_max'] = max(merged['lag_max'], report['lag_max'])
+        merged['run_lag_max'] = max(merged['run_lag_max'], report['run_lag_max'])
+    merged['lag_avg'] = lag_sum / max(1, merged['ticks'])
+    merged['shards'] = len(reports)
+    return merged
+
+# Turns successive metric reports into per-second rates, printed every NET_METRICS_LOG_S
+class MetricsLog:
+    def __init__(self, label):
+        self.label = label
+        self.last = None
+        self.last_time = time.perf_counter()
+        self.lag_max = 0
+
+    def add(self, report):
+        self.lag_max = max(self.lag_max, report['lag_max'])
+        now = time.perf_counter()
+        if now - self.last_time < NET_METRICS_LOG_S:
+            return
+        elapsed = now - self.last_time
+        last = self.last or dict.fromkeys(report, 0)
+        rate = {name: (report[name] - last[name]) / elapsed
+                for name in ('started', 'completed', 'inputs', 'packets_in', 'packets_out')}
+        print(f"[{self.label}] {report['matches']} matches, {report['clients']} clients | "
+              f"{rate['completed']:.1f} matches/s finished, {rate['started']:.1f} started | "
+              f"tick lag avg {report['lag_avg']:.1f} ms, max {self.lag_max:.1f} ms | "
+              f"{rate['inputs']:.0f} inputs/s, {rate['packets_in']:.0f} pkt/s in, "
+              f"{rate['packets_out']:.0f} out", flush=True)
+        self.last, self.last_time, self.lag_max = report, now, 0
+
+# Server-side match state: nobody clicks its keypads, so none are built
+class HeadlessGame(Game):
+    def local_sides(self):
+        return ()
+
+class NetPeer:
+    def __init__(self, key, name, mode, difficulty):
+        self.addr, self.conn = key
+        self.name = name
+        self.mode = mode
+        self.difficulty = difficulty
+        self.side = None
+        self.match = None
+        self.last_seq = 0
+        self.inputs = 0
+        self.last_seen = net_clock()
+
+# One match on a server: a headless Game woken by the timer wheel or by input
+class NetMatch:
+    def __init__(self, server, mode, difficulty):
+        self.server = server
+        self.mode = mode
+        self.difficulty = difficulty
+        self.peers = []
+        self.game = None
+        self.base = 0
+        self.timer = None
+        self.finished = False
+        self.last_sent = 0
+        server.matches.add(self)
+
+    def add(self, peer):
+        taken = {p.side for p in self.peers}
+        peer.side = next(side for side in NET_SIDES if side not in taken)
+        peer.match = self
+        self.peers.append(peer)
+        self.server.dirty.add(self)
+
+    def start(self):
+        names = {p.side: p.name for p in self.peers}
+        self.game = HeadlessGame(self.difficulty, self.mode, lambda: None)
+        self.game.set_labels(names['left'], names.get('right', 'BOT'))
+        self.game.record_results = self.server.record
+        self.game.start()
+        if self.server.record:
+            self.game.start_recording()
+        self.base = self.server.now_tick()
+        self.finished = False
+        self.server.metrics.totals['started'] += 1
+        self.changed()
+
+    def close(self):
+        TimerWheel.cancel(self.timer)
+        self.timer = None
+        if self.game:
+            self.game.leave()
+            self.game = None
+        self.server.matches.discard(self)
+        self.server.dirty.discard(self)
+
+    def changed(self):
+        server = self.server
+        server.dirty.add(self)
+        TimerWheel.cancel(self.timer)
+        due = self.game.next_event_tick()
+        self.timer = None if due is None else server.wheel.schedule(self.base + due, self.fire)
+        if self.game.winner and not self.finished:
+            self.finished = True
+            server.metrics.totals['completed'] += 1
+        elif not self.game.winner:
+            self.finished = False
+
+    def fire(self):
+        self.timer = None
+        self.game.catch_up(self.server.wheel.tick - self.base)
+        self.changed()
+
+    # Ops are applied strictly in sequence; duplicates from redundant resends are skipped
+    def receive_inputs(self, peer, inputs):
+        for seq, op, arg in inputs:
+            if seq != peer.last_seq + 1:
+                continue
+            peer.last_seq = seq
+            peer.inputs += 1
+            self.server.metrics.totals['inputs'] += 1
+            self.server.dirty.add(self)
+            if valid_net_input(op, arg):
+                self.apply(peer.side, op, arg)
+
+    def apply(self, side, op, arg):
+        game = self.game
+        if game is None:
+            return
+        game.catch_up(self.server.now_tick() - self.base)
+        if game.countdown_active:
+            pass
+        elif op == REC_TARGET and arg <= abs(game.position):
+            pass  # a target the rope already reached would hand the leader the match
+        elif op == REC_RESET:
+            game.reset_game_from_button()
+        elif not game.winner:
+            apply_input(game, op, side, arg)
+        self.changed()
+
+    def send_snapshots(self, tick):
+        body = encode_snapshot(self.game, tick - self.base)
+        for peer in self.peers:
+            buf = bytearray()
+            write_varint(buf, peer.last_seq)
+            write_varint(buf, NET_SIDES.index(peer.side))
+            self.server.send(peer.addr, peer.conn, NET_SNAPSHOT, buf + body)
+        self.last_sent = net_clock()
+
+class NetMatchServer(asyncio.DatagramProtocol):
+    def __init__(self, tick_rate=NET_TICK_RATE, link=None, record=True, shard=0, lobby=None, log=True):
+        self.tick_rate = tick_rate
+        self.link_args = link or {}
+        self.record = record
+        self.lobby = lobby
+        self.log = MetricsLog(f"shard {shard}" if lobby else "server") if log else None
+        self.peers = {}
+        self.open = {}
+        self.matches = set()
+        self.dirty = set()
+        self.wheel = TimerWheel()
+        self.metrics = ServerMetrics(shard)
+        self.loop = None
+        self.transport = None
+        self.link = None
+        self.address = None
+        self.epoch = 0
+        self.stopped = False
+
+    def now_tick(self):
+        return int((self.loop.time() - self.epoch) * 1000) // SIM_TICK_MS
+
+    async def serve(self, host, port, ready=None, stop_event=None):
+        self.loop = asyncio.get_running_loop()
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        self.address = self.transport.get_extra_info('sockname')[:2]
+        enlarge_socket_buffers(self.transport)
+        self.link = LossyLink(self.transport.sendto, loop=self.loop, **self.link_args)
+        self.epoch = self.loop.time()
+        self.wheel.schedule(NET_SWEEP_MS // SIM_TICK_MS, self.sweep)
+        self.wheel.schedule(NET_METRICS_MS // SIM_TICK_MS, self.publish_metrics)
+        if ready:
+            ready.set()
+        interval = 1 / self.tick_rate
+        next_tick = self.loop.time()
+        try:
+            while not self.stopped and not (stop_event and stop_event.is_set()):
+                self.metrics.tick_lag((self.loop.time() - next_tick) * 1000)
+                self.wheel.advance(self.now_tick())
+                self.flush()
+                next_tick += interval
+                if self.loop.time() - next_tick > 1:
+                    next_tick = self.loop.time()
+                await asyncio.sleep(max(0, next_tick - self.loop.time()))
+        finally:
+            self.transport.close()
+            for match in list(self.matches):
+                match.close()
+
+    def stop(self):
+        self.stopped = True
+
+    def send(self, addr, conn, kind, body=b''):
+        self.metrics.totals['packets_out'] += 1
+        self.link.send(net_packet(kind, conn, body), addr)
+
+    def datagram_received(self, data, addr):
+        self.metrics.totals['packets_in'] += 1
+        try:
+            kind, conn, pos = read_net_header(data)
+            key = (addr, conn)
+            if kind == NET_HELLO:
+                self.join(key, *decode_hello(data, pos))
+                return
+            # Stats are for operators on the host: a reply to anyone would
+            # make the public port a reflection amplifier
+            if kind == NET_STATS:
+                if is_loopback(addr):
+                    self.send(addr, conn, NET_STATS, json.dumps(self.stats(reset=False)).encode('utf-8'))
+                return
+            peer = self.peers.get(key)
+            if kind == NET_PING:
+                self.send(addr, conn, NET_PONG, data[pos:])
+            if peer is None:
+                return
+            peer.last_seen = net_clock()
+            if kind == NET_INPUT:
+                count, pos = read_varint(data, pos)
+                inputs = []
+                for _ in range(min(count, NET_MAX_INPUTS)):
+                    seq, pos = read_varint(data, pos)
+                    op, pos = read_varint(data, pos)
+                    arg, pos = read_varint(data, pos)
+                    inputs.append((seq, op, arg))
+                peer.match.receive_inputs(peer, inputs)
+            elif kind == NET_BYE:
+                self.drop(key)
+        except (IndexError, ValueError, UnicodeDecodeError):
+            pass
+
+    def join(self, key, name, mode, difficulty):
+        peer = self.peers.get(key)
+        if peer is None:
+            peer = NetPeer(key, name, mode, difficulty)
+            self.peers[key] = peer
+            self.matchmake(peer)
+        peer.last_seen = net_clock()
+        buf = bytearray()
+        write_varint(buf, NET_SIDES.index(peer.side))
+        write_varint(buf, self.tick_rate)
+        self.send(peer.addr, peer.conn, NET_WELCOME, buf)
+
+    # PvBot matches start at once; PvP players wait in one open match per difficulty
+    def matchmake(self, peer):
+        if peer.mode == 'PvBot':
+            match = NetMatch(self, 'PvBot', peer.difficulty)
+            match.add(peer)
+            match.start()
+            return
+        match = self.open.pop(peer.difficulty, None)
+        if match is None:
+            match = NetMatch(self, 'PvP', peer.difficulty)
+            match.add(peer)
+            self.open[peer.difficulty] = match
+        else:
+            match.add(peer)
+            match.start()
+
+    def drop(self, key):
+        peer = self.peers.pop(key, None)
+        if peer is None:
+            return
+        match = peer.match
+        match.peers.remove(peer)
+        if self.open.get(match.difficulty) is match:
+            del self.open[match.difficulty]
+        match.close()
+        for other in match.peers:
+            self.matchmake(other)
+
+    def sweep(self):
+        now = net_clock()
+        for key, peer in list(self.peers.items()):
+            if now - peer.last_seen > NET_TIMEOUT_MS:
+                self.drop(key)
+        for match in self.matches:
+            if now - match.last_sent >= NET_KEEPALIVE_MS:
+                self.dirty.add(match)
+        self.wheel.schedule(self.wheel.tick + NET_SWEEP_MS // SIM_TICK_MS, self.sweep)
+
+    def stats(self, reset=True):
+        return self.metrics.report(len(self.matches), len(self.peers), reset)
+
+    def publish_metrics(self):
+        report = self.stats()
+        if self.lobby:
+            self.transport.sendto(net_packet(NET_METRICS, 0, json.dumps(report).encode('utf-8')), self.lobby)
+        elif self.log:
+            self.log.add(report)
+        self.wheel.schedule(self.wheel.tick + NET_METRICS_MS // SIM_TICK_MS, self.publish_metrics)
+
+    def flush(self):
+        if not self.dirty:
+            return
+        tick = self.now_tick()
+        broken = []
+        for match in self.dirty:
+            try:
+                match.send_snapshots(tick)
+            except Exception as e:
+                print(f"Dropping match that failed to snapshot: {e}")
+                broken.append(match)
+        self.dirty.clear()
+        for match in broken:
+            self.abandon(match)
+
+    # A match the server cannot serve is closed with its players; they time out client-side
+    def abandon(self, match):
+        for peer in match.peers:
+            self.peers.pop((peer.addr, peer.conn), None)
+        if self.open.get(match.difficulty) is match:
+            del self.open[match.difficulty]
+        match.close()
+
+# With several workers the public port is a lobby that redirects each client
+# to a shard process. Consecutive PvP players of one difficulty go to the same
+# shard so they pair up there; shards report metrics back over loopback.
+class NetLobby(asyncio.DatagramProtocol):
+    def __init__(self, shard_ports, log=True):
+        self.shard_ports = shard_ports
+        self.next_shard = 0
+        self.open = {}
+        self.assigned = {}
+        self.reports = {}
+        self.log = MetricsLog("server") if log else None
+        self.transport = None
+        self.stopped = False
+
+    async def serve(self, host, port, ready=None):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        enlarge_socket_buffers(self.transport)
+        if ready:
+            ready.set()
+        try:
+            while not self.stopped:
+                await asyncio.sleep(NET_METRICS_MS / 1000)
+                now = net_clock()
+                self.assigned = {key: value for key, value in self.assigned.items()
+                                 if now - value[1] < NET_TIMEOUT_MS}
+                if self.log and self.reports:
+                    self.log.add(self.stats())
+        finally:
+            self.transport.close()
+
+    def stop(self):
+        self.stopped = True
+
+    def stats(self):
+        return merge_metrics(list(self.reports.values()))
+
+    def assign(self, mode, difficulty):
+        if mode == 'PvP' and difficulty in self.open:
+            return self.open.pop(difficulty)
+        shard = self.next_shard
+        self.next_shard = (shard + 1) % len(self.shard_ports)
+        if mode == 'PvP':
+            self.open[difficulty] = shard
+        return shard
+
+    def datagram_received(self, data, addr):
+        try:
+            kind, conn, pos = read_net_header(data)
+            if kind == NET_HELLO:
+                _, mode, difficulty = decode_hello(data, pos)
+                key = (addr, conn)
+                if key not in self.assigned:
+                    self.assigned[key] = (self.assign(mode, difficulty), net_clock())
+                buf = bytearray()
+                write_varint(buf, self.shard_ports[self.assigned[key][0]])
+                self.transport.sendto(net_packet(NET_REDIRECT, conn, buf), addr)
+            elif kind == NET_PING:
+                self.transport.sendto(net_packet(NET_PONG, conn, data[pos:]), addr)
+            elif kind == NET_STATS and is_loopback(addr):
+                self.transport.sendto(net_packet(NET_STATS, conn, json.dumps(self.stats()).encode('utf-8')), addr)
+            elif kind == NET_METRICS and is_loopback(addr):
+                report = json.loads(data[pos:].decode('utf-8'))
+                self.reports[report['shard']] = report
+        except (IndexError, ValueError, UnicodeDecodeError):
+            pass
+
+def init_shard(lock, stop_event):
+    global LEADERBOARD_LOCK, SHARD_STOP, PIPELINE
+    LEADERBOARD_LOCK = lock
+    SHARD_STOP = stop_event
+    PIPELINE = GameOverPipeline()
+    GAME_SETTINGS['sfx_on'] = False
+
+def run_shard(shard, host, port, tick_rate, link, record, lobby_port, log):
+    server = NetMatchServer(tick_rate, link, record, shard=shard, lobby=('127.0.0.1', lobby_port), log=log)
+    try:
+        asyncio.run(server.serve(host, port, stop_event=SHARD_STOP))
+    except KeyboardInterrupt:
+        pass
+    if RATINGS.loaded:
+        PIPELINE.submit(RATINGS.save)
+    PIPELINE.shutdown()
+    return server.stats()
+
+def start_shards(host, port, workers, tick_rate, link, record, log=True):
+    stop_event = multiprocessing.Event()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_shard,
+                               initargs=(multiprocessing.Lock(), stop_event))
+    ports = [port + 1 + i for i in range(workers)]
+    futures = [pool.submit(run_shard, i, host, shard_port, tick_rate, link, record, port, log)
+               for i, shard_port in enumerate(ports)]
+    return NetLobby(ports, log), pool, futures, stop_event
+
+class NetClient:
+    def __init__(self, address, name, mode='PvP', difficulty=DIFFICULTY, latency=0, jitter=0, loss=0.0):
+        self.lobby = address
+        self.address = address
+        self.name = name
+        self.mode = mode
+        self.difficulty = difficulty
+        self.conn = random.SystemRandom().randrange(1, 1 << 31)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.link = LossyLink(self.sock.sendto, latency, jitter, loss)
+        self.side = None
+        self.tick_rate = None
+        self.seq = 0
+        self.pending = []
+        self.last_input_send = 0
+        self.last_hello = None
+        self.last_ping = None
+        self.last_snapshot = None
+        self.snapshots = 0
+        self.rtt = None
+
+    def send(self, kind, body=b''):
+        self.link.send(net_packet(kind, self.conn, body), self.address)
+
+    def connect(self):
+        self.send(NET_HELLO, encode_hello(self.name, self.mode, self.difficulty))
+        self.last_hello = net_clock()
+
+    def connected(self):
+        return self.last_snapshot is not None and net_clock() - self.last_snapshot < NET_TIMEOUT_MS
+
+    def send_input(self, op, arg=0):
+        self.seq += 1
+        self.pending.append((self.seq, op, arg))
+        self.flush_inputs()
+
+    def flush_inputs(self):
+        batch = self.pending[:NET_MAX_INPUTS]
+        buf = bytearray()
+        write_varint(buf, len(batch))
+        for seq, op, arg in batch:
+            write_varint(buf, seq)
+            write_varint(buf, op)
+            write_varint(buf, arg)
+        self.send(NET_INPUT, buf)
+        self.last_input_send = net_clock()
+
+    def acknowledge(self, ack):
+        self.pending = [p for p in self.pending if p[0] > ack]
+
+    def poll(self, game):
+        self.link.pump()
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(NET_MAX_PACKET)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                continue
+            except OSError:
+                break
+            self.handle(data, game)
+        now = net_clock()
+        stale = self.last_snapshot is None or now - self.last_snapshot > NET_STALE_MS
+        if (stale or self.side is None) and (self.last_hello is None or now - self.last_hello >= NET_HELLO_MS):
+            self.connect()
+        if self.pending and now - self.last_input_send >= NET_RESEND_MS:
+            self.flush_inputs()
+        if self.last_ping is None or now - self.last_ping >= NET_PING_MS:
+            buf = bytearray()
+            write_varint(buf, int(now))
+            self.send(NET_PING, buf)
+            self.last_ping = now
+
+    def handle(self, data, game):
+        try:
+            kind, conn, pos = read_net_header(data)
+            if conn != self.conn:
+                return
+            if kind == NET_REDIRECT:
+                port, pos = read_varint(data, pos)
+                self.address = (self.lobby[0], port)
+                self.connect()
+            elif kind == NET_WELCOME:
+                side, pos = read_varint(data, pos)
+                self.tick_rate, pos = read_varint(data, pos)
+                self.side = NET_SIDES[side]
+                game.on_welcome(self.side)
+            elif kind == NET_SNAPSHOT:
+                ack, pos = read_varint(data, pos)
+                side, pos = read_varint(data, pos)
+                snap = decode_snapshot(data, pos)
+                self.last_snapshot = net_clock()
+                self.snapshots += 1
+                self.acknowledge(ack)
+                if NET_SIDES[side] != self.side:
+                    self.side = NET_SIDES[side]
+                    game.on_welcome(self.side)
+                game.apply_snapshot(snap)
+            elif kind == NET_PONG:
+                sent, pos = read_varint(data, pos)
+                sample = net_clock() - sent
+                self.rtt = sample if self.rtt is None else self.rtt * 0.8 + sample * 0.2
+        except (IndexError, ValueError, UnicodeDecodeError):
+            pass
+
+    def close(self):
+        try:
+            self.sock.sendto(net_packet(NET_BYE, self.conn), self.address)
+        except OSError:
+            pass
+        self.sock.close()
+
+# Client mode of Game: inputs go to the server, the match state comes back in
+# snapshots, and only the local player's input field is predicted
+class NetGame(Game):
+    def __init__(self, client, quit_callback):
+        self.client = client
+        self.side = 'left'
+        self.waiting = True
+        self.last_tick = -1
+        self.mispredictions = 0
+        super().__init__(client.difficulty, client.mode, quit_callback, telemetry=False)
+        self.record_results = False
+        self.question_text = ""
+
+    def local_sides(self):
+        return (self.side,)
+
+    def own(self):
+        return self.left if self.side == 'left' else self.right
+
+    def start(self):
+        self.client.connect()
+
+    def start_recording(self):
+        pass
+
+    def leave(self):
+        self.client.close()
+
+    def on_welcome(self, side):
+        if side != self.side:
+            self.side = side
+            self.create_keypads()
+
+    def send_edit(self, op, arg=0):
+        p = self.own()
+        p.current_input = edit_input(p.current_input, op, arg)
+        self.client.send_input(op, arg)
+
+    def on_digit(self, side, digit_char):
+        self.send_edit(REC_DIGIT, ord(digit_char))
+
+    def on_decimal(self, side):
+        self.send_edit(REC_DECIMAL)
+
+    def backspace(self, side):
+        self.send_edit(REC_BACKSPACE)
+
+    def clear_input(self, side):
+        self.send_edit(REC_CLEAR)
+
+    # Every seat on this machine types for the side the server assigned
+    def type_input(self, side, op, arg):
+        apply_input(self, op, self.side, arg)
+
+    def submit_input(self, side, is_bot=False):
+        if self.own().current_input:
+            self.client.send_input(REC_SUBMIT)
+
+    def set_target_pull(self, value):
+        self.client.send_input(REC_TARGET, value)
+
+    def reset_game_from_button(self, seed=None):
+        self.client.send_input(REC_RESET)
+
+    def toggle_settings(self):
+        self.settings_panel.is_visible = not self.settings_panel.is_visible
+
+    def apply_snapshot(self, snap):
+        if self.winner:
+            return
+        if snap['waiting']:
+            self.waiting = True
+            self.countdown_active = True
+            return
+        new_match = self.waiting or snap['seed'] != self.seed
+        if not new_match and snap['tick'] <= self.last_tick:
+            return
+        own_side = self.side
+        other_side = 'right' if own_side == 'left' else 'left'
+        if new_match:
+            self.waiting = False
+            self.reseed(snap['seed'])
+            if snap['countdown']:
+                play_sfx(SOUND_COUNTDOWN)
+        else:
+            if snap['left_score'] + snap['right_score'] > self.left.correct_count + self.right.correct_count:
+                play_sfx(SOUND_CORRECT)
+            if snap[own_side + '_wrong'] > self.own().wrong_count:
+                play_sfx(SOUND_WRONG)
+            if snap['timeouts'] > self.timeouts:
+                play_sfx(SOUND_TIMEOUT)
+        self.last_tick = self.sim_tick = snap['tick']
+        self.accumulator = 0
+        self.left.correct_count = snap['left_score']
+        self.right.correct_count = snap['right_score']
+        self.left.wrong_count = snap['left_wrong']
+        self.right.wrong_count = snap['right_wrong']
+        self.timeouts = snap['timeouts']
+        self.position = snap['position']
+        self.target_pull = snap['target']
+        self.countdown_active = bool(snap['countdown'])
+        self.q_start_time = snap['q_start_time']
+        self.countdown_start_time = snap['countdown_start_time']
+        self.game_start_time = snap['game_start_time']
+        self.time_limit = snap['time_limit']
+        self.question_text = snap['question']
+        self.left_label = snap['left_label']
+        self.right_label = snap['right_label']
+        (self.left if other_side == 'left' else self.right).current_input = snap[other_side + '_input']
+        text = snap[own_side + '_input']
+        for _, op, arg in self.client.pending:
+            text = edit_input(text, op, arg)
+        if text != self.own().current_input:
+            self.mispredictions += 1
+        self.own().current_input = text
+        if snap['winner']:
+            self.settings_panel.is_visible = False
+            self.check_winner()
+
+    def update(self, dt):
+        self.client.poll(self)
+        super().update(dt)
+
+    # Between snapshots only the clock and the rope animation advance locally
+    def step(self):
+        self.sim_tick += 1
+        self.prev_rope_pos = self.rope_pos
+        self.rope_pos += (self.position - self.rope_pos) * ROPE_EASE
+
+    def draw(self, surf):
+        if self.waiting:
+            surf.blit(cached_layer('dimmed_bg', build_dimmed_background), (0, 0))
+            text = "Waiting for opponent..." if self.client.connected() else "Connecting to server..."
+            msg = FONT_L.render(text, True, TEXT_WHITE)
+            surf.blit(msg, (self.width // 2 - msg.get_width() // 2, self.height // 2 - msg.get_height() // 2))
+            hint = FONT_M.render("Press ESC to leave", True, TEXT_WHITE)
+            surf.blit(hint, (self.width // 2 - hint.get_width() // 2, self.height // 2 + 50))
+            return
+        super().draw(surf)
+        if not self.client.connected():
+            status = "Connection lost"
+        elif self.client.rtt is not None:
+            status = f"Ping: {int(self.client.rtt)} ms"
+        else:
+            status = ""
+        if status:
+            status_txt = FONT_S.render(status, True, TEXT_BROWN)
+            surf.blit(status_txt, (self.width // 2 - status_txt.get_width() // 2, self.height - 55))
+
+def serve(args):
+    GAME_SETTINGS['sfx_on'] = False
+    if args.workers <= 1:
+        server = NetMatchServer(args.tick_rate, NET_LINK, record=RECORD_REPLAYS)
+        print(f"Math Tug War server on {args.host}:{args.serve} at {args.tick_rate} Hz")
+        signal.signal(signal.SIGTERM, lambda *_: server.stop())
+        try:
+            asyncio.run(server.serve(args.host, args.serve))
+        except KeyboardInterrupt:
+            pass
+        return
+    lobby, pool, _, stop_event = start_shards(args.host, args.serve, args.workers, args.tick_rate,
+                                              NET_LINK, RECORD_REPLAYS)
+    print(f"Math Tug War server on {args.host}:{args.serve} with {args.workers} shards "
+          f"(ports {args.serve + 1}-{args.serve + args.workers}) at {args.tick_rate} Hz")
+    signal.signal(signal.SIGTERM, lambda *_: lobby.stop())
+    try:
+        asyncio.run(lobby.serve(args.host, args.serve))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        pool.shutdown()
+
+# Loopback self-test: a server and two scripted clients in one process over a
+# lossy link. The scripted players read and solve the questions they are shown.
+NET_TEST_TARGET = 5
+NET_TEST_TIMEOUT_S = 120
+
+class NetTestPlayer:
+    def __init__(self, name, address, difficulty, link, key_ms, mistake_rate, seed):
+        self.client = NetClient(address, name, 'PvP', difficulty, **link)
+        self.game = NetGame(self.client, lambda: None)
+        self.game.start()
+        self.key_ms = key_ms
+        self.mistake_rate = mistake_rate
+        self.rng = random.Random(seed)
+        self.plan = []
+        self.question = None
+        self.wrong = 0
+        self.next_key = 0
+        self.hold = False
+
+    def update(self, dt):
+        game = self.game
+        game.update(dt)
+        if game.waiting or game.countdown_active or game.winner or self.hold:
+            return
+        if game.question_text != self.question or game.own().wrong_count != self.wrong:
+            self.question = game.question_text
+            self.wrong = game.own().wrong_count
+            answer = solve_question(self.question)
+            if self.rng.random() < self.mistake_rate and answer[-1].isdigit():
+                answer = answer[:-1] + str((int(answer[-1]) + 1) % 10)
+            self.plan = ['C'] + list(answer) + ['\n']
+        now = net_clock()
+        if self.plan and now >= self.next_key:
+            key = self.plan.pop(0)
+            if key == 'C':
+                game.clear_input(game.side)
+            elif key == '\n':
+                game.submit_input(game.side)
+            elif key == '.':
+                game.on_decimal(game.side)
+            else:
+                game.on_digit(game.side, key)
+            self.next_key = now + self.rng.uniform(0.5, 1.5) * self.key_ms
+
+def run_net_test(args):
+    link = {
+        'latency': 40 if args.latency is None else args.latency,
+        'jitter': 20 if args.jitter is None else args.jitter,
+        'loss': 0.1 if args.loss is None else args.loss,
+    }
+    server = NetMatchServer(args.tick_rate, link, record=False, log=False)
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve('127.0.0.1', 0, ready)), daemon=True)
+    thread.start()
+    if not ready.wait(5):
+        print("net test: server did not start")
+        return False
+    print(f"net test: {args.tick_rate} Hz, latency {link['latency']}+{link['jitter']} ms, loss {link['loss']:.0%}")
+    players = [NetTestPlayer("ALICE", server.address, args.difficulty, link, 90, 0.1, 1),
+               NetTestPlayer("BOB", server.address, args.difficulty, link, 180, 0.25, 2)]
+    target_sent = False
+    # Mid-match the leader asks for a target the rope has already reached; the
+    # server must ignore it. Both players stop typing so the position holds still.
+    cheat = None
+    started = last = time.perf_counter()
+    finish_at = None
+    while True:
+        now = time.perf_counter()
+        dt, last = (now - last) * 1000, now
+        for player in players:
+            player.update(dt)
+        first = players[0].game
+        if not target_sent and not first.waiting and not first.countdown_active:
+            first.set_target_pull(NET_TEST_TARGET)
+            target_sent = True
+        lead = abs(first.position)
+        if cheat is None and target_sent and not first.winner and lead >= TARGET_PULL_RANGE[0]:
+            for player in players:
+                player.hold = True
+            cheat = 'hold'
+        elif cheat == 'hold' and not any(p.client.pending for p in players):
+            leader = next(p for p in players if p.game.side == ('left' if first.position < 0 else 'right'))
+            if first.winner or lead < TARGET_PULL_RANGE[0]:
+                cheat = None
+            else:
+                leader.game.set_target_pull(lead)
+                cheat = 'sent'
+            if cheat is None:
+                for player in players:
+                    player.hold = False
+        elif cheat == 'sent' and not any(p.client.pending for p in players):
+            for player in players:
+                player.hold = False
+            cheat = 'done'
+        if finish_at is None and all(p.game.winner for p in players):
+            finish_at = now + 1.0
+        if (finish_at is not None and now >= finish_at) or now - started > NET_TEST_TIMEOUT_S:
+            break
+        time.sleep(0.002)
+    peers = {peer.conn: peer for peer in list(server.peers.values())}
+    matches = {peer.match for peer in peers.values()}
+    game = matches.pop().game if len(matches) == 1 else None
+    problems = []
+    if game is None or not game.winner:
+        problems.append("no finished match on the server")
+    elif game.target_pull != NET_TEST_TARGET or abs(game.position) < NET_TEST_TARGET:
+        problems.append(f"server took a mid-match target: {game.target_pull}, position {game.position}")
+    if cheat != 'done':
+        problems.append("mid-match target change never sent")
+    for player in players:
+        client, view = player.client, player.game
+        peer = peers.get(client.conn)
+        print(f"{client.name} ({client.side}): {client.seq} inputs, {len(client.pending)} unacked, "
+              f"{client.snapshots} snapshots, {view.mispredictions} corrected predictions, "
+              f"rtt {client.rtt or 0:.0f} ms, "
+              f"{client.link.sent} packets sent, {client.link.dropped} dropped")
+        if game is None or peer is None:
+            problems.append(f"{client.name} not connected")
+            continue
+        if peer.inputs != client.seq or client.pending:
+            problems.append(f"{client.name}: server applied {peer.inputs} of {client.seq} inputs")
+        if view.winner != game.winner or view.position != game.position:
+            problems.append(f"{client.name}: view {view.winner}/{view.position} != server {game.winner}/{game.position}")
+        if client.side is None:
+            problems.append(f"{client.name}: never welcomed")
+    if game:
+        print(f"server: winner {game.winner}, position {game.position}, target {game.target_pull}, score "
+              f"{game.left.correct_count}-{game.right.correct_count}, {game.now() / 1000:.1f}s, "
+              f"{server.link.sent} packets sent, {server.link.dropped} dropped")
+    for player in players:
+        player.game.leave()
+    server.stop()
+    thread.join(2)
+    print("PASSED" if not problems else "FAILED: " + "; ".join(problems))
+    return not problems
+
+# Load test: thousands of scripted clients multiplexed over a few UDP sockets,
+# driven by their own timer wheel. They join through the normal handshake,
+# read and answer questions at human speed, and requeue after every match.
+LOAD_RESEND_MS = 200
+LOAD_RESEND_MAX_MS = 2000
+LOAD_TARGET = 3
+LOAD_RAMP_PER_S = 1000
+LOAD_BOT_SHARE = 0.25
+
+class LoadSocket(asyncio.DatagramProtocol):
+    def __init__(self, generator):
+        self.generator = generator
+        self.transport = None
+        self.link = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        enlarge_socket_buffers(transport)
+        self.link = LossyLink(transport.sendto, loop=asyncio.get_running_loop(), **self.generator.link_args)
+
+    def datagram_received(self, data, addr):
+        self.generator.receive(data)
+
+class LoadClient:
+    def __init__(self, generator, index, sock):
+        self.generator = generator
+        self.index = index
+        self.sock = sock
+        self.rng = random.Random(index)
+        self.mode = 'PvBot' if self.rng.random() < LOAD_BOT_SHARE else 'PvP'
+        self.difficulty = self.rng.choice(NET_DIFFICULTIES)
+        self.speed = self.rng.uniform(0.6, 1.6)
+        self.conn = None
+        self.timer = None
+        self.rejoin()
+        self.keepalive()
+
+    def rejoin(self):
+        if self.conn is not None:
+            self.send(NET_BYE)
+        self.generator.clients.pop(self.conn, None)
+        self.conn = self.generator.new_conn()
+        self.generator.clients[self.conn] = self
+        self.address = self.generator.address
+        self.welcomed = False
+        self.in_match = False
+        self.target_sent = False
+        self.seq = 0
+        self.pending = []
+        self.question = None
+        self.wrong = 0
+        self.plan = []
+        self.resend_timer = None
+        self.resend_ms = LOAD_RESEND_MS
+        self.last_snapshot = self.generator.now()
+        self.hello()
+
+    # Pings keep the server from timing the client out; a server silent for as
+    # long as its own timeout has dropped this client, so it queues up again
+    def keepalive(self):
+        if self.welcomed and self.generator.now() - self.last_snapshot > NET_TIMEOUT_MS:
+            self.rejoin()
+        else:
+            buf = bytearray()
+            write_varint(buf, 0)
+            self.send(NET_PING, buf)
+        wheel = self.generator.wheel
+        wheel.schedule(wheel.tick + NET_STALE_MS // SIM_TICK_MS, self.keepalive)
+
+    def wake(self, delay_ms, callback):
+        TimerWheel.cancel(self.timer)
+        wheel = self.generator.wheel
+        self.timer = wheel.schedule(wheel.tick + max(1, int(delay_ms) // SIM_TICK_MS), callback)
+
+    def send(self, kind, body=b''):
+        self.generator.sent += 1
+        self.sock.link.send(net_packet(kind, self.conn, body), self.address)
+
+    def hello(self):
+        if self.welcomed:
+            return
+        self.send(NET_HELLO, encode_hello(f"LOAD{self.index}", self.mode, self.difficulty))
+        self.wake(NET_HELLO_MS * 4, self.hello)
+
+    # Pending inputs are kept pre-encoded; unacked resends back off up to LOAD_RESEND_MAX_MS
+    def send_input(self, op, arg=0):
+        self.seq += 1
+        buf = bytearray()
+        for value in (self.seq, op, arg):
+            write_varint(buf, value)
+        self.pending.append((self.seq, bytes(buf)))
+        self.generator.inputs += 1
+        self.resend_ms = LOAD_RESEND_MS
+        self.flush_inputs()
+
+    def flush_inputs(self):
+        TimerWheel.cancel(self.resend_timer)
+        self.resend_timer = None
+        if not self.pending:
+            return
+        batch = self.pending[:NET_MAX_INPUTS]
+        buf = bytearray()
+        write_varint(buf, len(batch))
+        for _, encoded in batch:
+            buf.extend(encoded)
+        self.send(NET_INPUT, buf)
+        wheel = self.generator.wheel
+        self.resend_timer = wheel.schedule(wheel.tick + self.resend_ms // SIM_TICK_MS, self.resend)
+
+    def resend(self):
+        self.resend_ms = min(self.resend_ms * 2, LOAD_RESEND_MAX_MS)
+        self.flush_inputs()
+
+    def type_next(self):
+        if not self.plan:
+            return
+        op, arg = self.plan.pop(0)
+        self.send_input(op, arg)
+        if self.plan:
+            self.wake(self.rng.uniform(150, 400) * self.speed, self.type_next)
+
+    def receive(self, kind, data, pos):
+        if kind == NET_REDIRECT:
+            port, pos = read_varint(data, pos)
+            self.address = (self.generator.address[0], port)
+            self.send(NET_HELLO, encode_hello(f"LOAD{self.index}", self.mode, self.difficulty))
+        elif kind == NET_WELCOME:
+            self.welcomed = True
+            if not self.in_match:
+                TimerWheel.cancel(self.timer)
+        elif kind == NET_SNAPSHOT:
+            self.generator.snapshots += 1
+            ack, pos = read_varint(data, pos)
+            side, pos = read_varint(data, pos)
+            snap = decode_snapshot(data, pos)
+            if self.pending and self.pending[0][0] <= ack:
+                self.pending = [p for p in self.pending if p[0] > ack]
+                self.resend_ms = LOAD_RESEND_MS
+            self.welcomed = True
+            self.last_snapshot = self.generator.now()
+            self.on_snapshot(NET_SIDES[side], snap)
+
+    def on_snapshot(self, side, snap):
+        if snap['waiting']:
+            return
+        if snap['winner']:
+            if self.in_match:
+                self.generator.finished += 1
+                self.in_match = False
+                TimerWheel.cancel(self.resend_timer)
+                self.wake(self.rng.uniform(1000, 3000), self.rejoin)
+            return
+        self.in_match = True
+        if snap['countdown']:
+            return
+        if side == 'left' and not self.target_sent:
+            self.target_sent = True
+            self.send_input(REC_TARGET, LOAD_TARGET)
+        if snap['question'] != self.question or snap[side + '_wrong'] != self.wrong:
+            self.question = snap['question']
+            self.wrong = snap[side + '_wrong']
+            answer = solve_question(self.question)
+            if self.rng.random() < 0.1 and answer[-1].isdigit():
+                answer = answer[:-1] + str((int(answer[-1]) + 1) % 10)
+            self.plan = [(REC_CLEAR, 0)] + [(REC_DECIMAL, 0) if c == '.' else (REC_DIGIT, ord(c)) for c in answer]
+            self.plan.append((REC_SUBMIT, 0))
+            self.wake(self.rng.uniform(1000, 3000) * self.speed, self.type_next)
+
+class LoadGenerator:
+    def __init__(self, address, count, sockets, link):
+        self.address = address
+        self.count = count
+        self.socket_count = sockets
+        self.link_args = link
+        self.clients = {}
+        self.sockets = []
+        self.wheel = TimerWheel()
+        self.next_conn = 0
+        self.started = 0
+        self.sent = 0
+        self.inputs = 0
+        self.snapshots = 0
+        self.finished = 0
+
+    def now(self):
+        return self.wheel.tick * SIM_TICK_MS
+
+    def new_conn(self):
+        self.next_conn += 1
+        return self.next_conn
+
+    def receive(self, data):
+        try:
+            kind, conn, pos = read_net_header(data)
+            client = self.clients.get(conn)
+            if client:
+                client.receive(kind, data, pos)
+        except (IndexError, ValueError, UnicodeDecodeError):
+            pass
+
+    async def run(self, duration):
+        loop = asyncio.get_running_loop()
+        for _ in range(self.socket_count):
+            _, protocol = await loop.create_datagram_endpoint(lambda: LoadSocket(self), local_addr=('127.0.0.1', 0))
+            self.sockets.append(protocol)
+        epoch = loop.time()
+        last_log = epoch
+        while loop.time() - epoch < duration:
+            elapsed = loop.time() - epoch
+            while self.started < min(self.count, int(elapsed * LOAD_RAMP_PER_S) + 1):
+                LoadClient(self, self.started, self.sockets[self.started % len(self.sockets)])
+                self.started += 1
+            self.wheel.advance(int(elapsed * 1000) // SIM_TICK_MS)
+            if loop.time() - last_log >= NET_METRICS_LOG_S:
+                last_log = loop.time()
+                playing = sum(1 for client in self.clients.values() if client.in_match)
+                print(f"[clients] {self.started} started, {playing} in a match, {self.finished} matches "
+                      f"finished, {self.inputs} inputs, {self.snapshots} snapshots", flush=True)
+            await asyncio.sleep(SIM_TICK_MS / 1000)
+        for client in list(self.clients.values()):
+            client.send(NET_BYE)
+        await asyncio.sleep(0.2)
+        for sock in self.sockets:
+            sock.transport.close()
+
+def run_load_test(args):
+    GAME_SETTINGS['sfx_on'] = False
+    print(f"load test: {args.load_test} clients over {args.load_sockets} sockets, "
+          f"{args.workers} worker(s), {args.tick_rate} Hz, {args.duration}s")
+
+    async def run():
+        if args.workers <= 1:
+            server = NetMatchServer(args.tick_rate, record=False)
+            ready = asyncio.Event()
+            server_task = asyncio.ensure_future(server.serve('127.0.0.1', 0, ready))
+            await ready.wait()
+            address, stats = server.address, server.stats
+        else:
+            port = args.serve or NET_PORT
+            server, pool, _, stop_event = start_shards('127.0.0.1', port, args.workers, args.tick_rate, {}, False)
+            server_task = asyncio.ensure_future(server.serve('127.0.0.1', port))
+            address, stats = ('127.0.0.1', port), server.stats
+        generator = LoadGenerator(address, args.load_test, args.load_sockets, NET_LINK)
+        started = time.perf_counter()
+        await generator.run(args.duration)
+        elapsed = time.perf_counter() - started
+        report = stats()
+        server.stop()
+        await server_task
+        if args.workers > 1:
+            stop_event.set()
+            pool.shutdown()
+        print(f"load test done in {elapsed:.0f}s: {generator.started} clients, {report['started']} matches "
+              f"started, {report['completed']} finished ({report['completed'] / elapsed:.2f} matches/s), "
+              f"{report['inputs']} inputs ({report['inputs'] / elapsed:.0f}/s), "
+              f"worst tick lag {report['run_lag_max']:.0f} ms")
+
+    asyncio.run(run())
+
+# Screen pool: likely next screens are built (and their static layers
+# pre-rendered) one per idle wake-up, so a transition only swaps objects.
+class ScreenPool:
+    def __init__(self):
+        self.ready = {}
+        self.queue = []
+
+    def prewarm(self, key, factory):
+        if key not in self.ready and all(k != key for k, _ in self.queue):
+            self.queue.append((key, factory))
+
+    def take(self, key, factory):
+        if key in self.ready:
+            return self.ready.pop(key)
+        self.queue = [(k, f) for k, f in self.queue if k != key]
+        return factory()
+
+    def discard(self, kind, keep=None):
+        self.ready = {k: v for k, v in self.ready.items() if k[0] != kind or k == keep}
+        self.queue = [(k, f) for k, f in self.queue if k[0] != kind or k == keep]
+
+    def work(self):
+        if not self.queue:
+            return False
+        key, factory = self.queue.pop(0)
+        screen = factory()
+        if hasattr(screen, 'prerender'):
+            screen.prerender()
+        self.ready[key] = screen
+        return True
+
+# Render scheduling: static screens block on the event queue and only redraw
+# when something happened; gameplay keeps ticking at the full frame rate.
+# Until the next frame is due the scheduler waits on the event queue instead
+# of sleeping, so each event is stamped (ev.stamp, pygame ticks) on arrival
+# rather than when the frame gets round to it.
+class RenderScheduler:
+    def __init__(self):
+        self.dirty = True
+        self.last_activity = pygame.time.get_ticks()
+        self.frame_due = self.last_activity
+        pygame.mixer.music.set_endevent(MUSIC_END_EVENT)
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def wait_timeout(self):
+        idle_ms = pygame.time.get_ticks() - self.last_activity
+        return 1000 // (IDLE_FPS if idle_ms > IDLE_AFTER_MS else FPS)
+
+    # Waits until the deadline, or only until the first event unless whole_frame
+    def collect(self, deadline, whole_frame):
+        events = []
+        while True:
+            now = pygame.time.get_ticks()
+            ev = pygame.event.wait(deadline - now) if deadline > now else pygame.event.poll()
+            if ev.type == pygame.NOEVENT:
+                return events
+            ev.stamp = pygame.time.get_ticks()
+            events.append(ev)
+            if not whole_frame:
+                deadline = 0
+
+    # Returns the frame time (pygame ticks) and the stamped events since the last frame
+    def next_frame(self, animating):
+        if animating:
+            events = self.collect(self.frame_due, True)
+        else:
+            events = self.collect(pygame.time.get_ticks() + self.wait_timeout(), False)
+        now = pygame.time.get_ticks()
+        self.frame_due = now + 1000 // FPS
+        if events:
+            self.last_activity = now
+            self.dirty = True
+        return now, events
+
+    def should_draw(self, animating):
+        if animating or self.dirty:
+            self.dirty = False
+            return True
+        return False
+
+# Presents the logical canvas on the real display: integer scaling when the
+# display is an exact multiple, otherwise one fast (nearest) scale, letterboxed.
+class DisplayScaler:
+    def __init__(self, display):
+        self.display = display
+        self.canvas = display
+        self.resize()
+
+    def resize(self):
+        dw, dh = self.display.get_size()
+        if not RENDER_LOGICAL or (dw, dh) == (SCREEN_W, SCREEN_H):
+            self.canvas = self.display
+            self.factor = 1
+            self.dest = pygame.Rect(0, 0, dw, dh)
+            return
+        if self.canvas is self.display or self.canvas.get_size() != (SCREEN_W, SCREEN_H):
+            self.canvas = pygame.Surface((SCREEN_W, SCREEN_H)).convert()
+        factor = min(dw / SCREEN_W, dh / SCREEN_H)
+        if factor >= 1:
+            factor = int(factor) if dw % SCREEN_W == 0 and dh % SCREEN_H == 0 else factor
+        self.factor = factor
+        # Nearest-neighbour is exact for upscaling but drops whole rows and
+        # columns going down (1366x768 laptops), breaking up text and borders
+        self.smooth = factor < 1 and self.canvas.get_bitsize() in (24, 32)
+        self.dest = pygame.Rect(0, 0, int(SCREEN_W * factor), int(SCREEN_H * factor))
+        self.dest.center = (dw // 2, dh // 2)
+        self.target = self.display.subsurface(self.dest)
+        self.display.fill((0, 0, 0))
+
+    def map_event(self, ev):
+        if self.canvas is self.display or not hasattr(ev, 'pos'):
+            return ev
+        x = int((ev.pos[0] - self.dest.x) / self.factor)
+        y = int((ev.pos[1] - self.dest.y) / self.factor)
+        attrs = dict(ev.dict, pos=(x, y))
+        if 'rel' in attrs:
+            attrs['rel'] = (int(ev.rel[0] / self.factor), int(ev.rel[1] / self.factor))
+        return pygame.event.Event(ev.type, attrs)
+
+    def present(self):
+        if self.canvas is not self.display:
+            scale = pygame.transform.smoothscale if self.smooth else pygame.transform.scale
+            scale(self.canvas, self.dest.size, self.target)
+        pygame.display.flip()
+
+def convert_assets():
+    global WALLPAPER_IMG, INGAME_WALLPAPER_IMG
+    if WALLPAPER_IMG:
+        WALLPAPER_IMG = WALLPAPER_IMG.convert()
+    if INGAME_WALLPAPER_IMG:
+        INGAME_WALLPAPER_IMG = INGAME_WALLPAPER_IMG.convert()
+    SPRITES.convert()
+
+# Input backend. Typing reaches a match through seats, one per (match, side):
+# the keyboard's main block is seat 0 and its numeric keypad seat 1 (or seat 0
+# when there is only one), and every joystick, gamepad or USB keypad that SDL
+# exposes as a joystick claims a seat with its first button press: a free
+# one if any is left, otherwise the first seat no other controller holds.
+# SDL 2 reports all keyboards as one device, so extra keyboards share zones.
+KEYPAD_CHARS = {
+    pygame.K_KP0: '0', pygame.K_KP1: '1', pygame.K_KP2: '2', pygame.K_KP3: '3', pygame.K_KP4: '4',
+    pygame.K_KP5: '5', pygame.K_KP6: '6', pygame.K_KP7: '7', pygame.K_KP8: '8', pygame.K_KP9: '9',
+    pygame.K_KP_PERIOD: '.', pygame.K_KP_DIVIDE: '/',
+}
+KEYPAD_OPS = {pygame.K_KP_ENTER: REC_SUBMIT, pygame.K_KP_MINUS: REC_BACKSPACE, pygame.K_KP_MULTIPLY: REC_CLEAR}
+MAIN_KEY_OPS = {pygame.K_RETURN: REC_SUBMIT, pygame.K_BACKSPACE: REC_BACKSPACE, pygame.K_DELETE: REC_CLEAR}
+# Joystick buttons 0-9 type digits (numeric USB keypads usually enumerate this
+# way); a gamepad's d-pad submits, clears, deletes and types the decimal point
+JOY_BUTTON_OPS = {10: (REC_DECIMAL, 0), 11: (REC_DIGIT, ord('/')), 12: (REC_BACKSPACE, 0), 13: (REC_SUBMIT, 0)}
+JOY_HAT_OPS = {(0, 1): (REC_SUBMIT, 0), (0, -1): (REC_CLEAR, 0), (-1, 0): (REC_BACKSPACE, 0), (1, 0): (REC_DECIMAL, 0)}
+KEYBOARD_ZONES = ('main', 'numpad')
+
+def char_op(char):
+    return (REC_DECIMAL, 0) if char == '.' else (REC_DIGIT, ord(char))
+
+# KEYDOWN -> (keyboard zone, op, arg), or None for keys that do not type
+def keyboard_op(ev):
+    if ev.key in KEYPAD_CHARS:
+        return ('numpad',) + char_op(KEYPAD_CHARS[ev.key])
+    if ev.key in KEYPAD_OPS:
+        return 'numpad', KEYPAD_OPS[ev.key], 0
+    if ev.key in MAIN_KEY_OPS:
+        return 'main', MAIN_KEY_OPS[ev.key], 0
+    if ev.unicode and ev.unicode in '0123456789./':
+        return ('main',) + char_op(ev.unicode)
+    return None
+
+def joystick_op(ev):
+    if ev.type == pygame.JOYHATMOTION:
+        return JOY_HAT_OPS.get(tuple(ev.value))
+    if ev.button < 10:
+        return char_op(str(ev.button))
+    return JOY_BUTTON_OPS.get(ev.button)
+
+# A seat is (target, side); the target's type_input(side, op, arg) applies it
+class InputRouter:
+    def __init__(self, seats=()):
+        self.seats = list(seats)
+        self.joysticks = {}
+        self.joystick_seats = {}
+        for index in range(pygame.joystick.get_count()):
+            self.open_joystick(index)
+
+    def set_seats(self, seats):
+        self.seats = list(seats)
+
+    def open_joystick(self, index):
+        try:
+            joystick = pygame.joystick.Joystick(index)
+            self.joysticks[joystick.get_instance_id()] = joystick
+        except pygame.error:
+            pass
+
+    def zone_seat(self, zone):
+        return min(KEYBOARD_ZONES.index(zone), len(self.seats) - 1)
+
+    def joystick_seat(self, instance_id):
+        seat = self.joystick_seats.get(instance_id)
+        if seat is None or seat >= len(self.seats):
+            held = set(self.joystick_seats.values())
+            keyboard = {self.zone_seat(zone) for zone in KEYBOARD_ZONES}
+            open_seats = [i for i in range(len(self.seats)) if i not in held]
+            if not open_seats:
+                return None
+            seat = next((i for i in open_seats if i not in keyboard), open_seats[0])
+            self.joystick_seats[instance_id] = seat
+        return seat
+
+    # Hot-plugging is tracked on every screen, so controllers are ready in game
+    def handle_device(self, ev):
+        if ev.type == pygame.JOYDEVICEADDED:
+            self.open_joystick(ev.device_index)
+        elif ev.type == pygame.JOYDEVICEREMOVED:
+            self.joysticks.pop(ev.instance_id, None)
+            self.joystick_seats.pop(ev.instance_id, None)
+
+    def route(self, ev):
+        if not self.seats:
+            return
+        seat = typed = None
+        if ev.type == pygame.KEYDOWN:
+            typed = keyboard_op(ev)
+            if typed:
+                zone, op, arg = typed
+                seat, typed = self.zone_seat(zone), (op, arg)
+        elif ev.type in (pygame.JOYBUTTONDOWN, pygame.JOYHATMOTION):
+            typed = joystick_op(ev)
+            if typed:
+                seat = self.joystick_seat(ev.instance_id)
+        if seat is not None and typed:
+            target, side = self.seats[seat]
+            target.type_input(side, *typed)
+
+# Kiosk mode: up to four matches on one display, one per viewport, all drawn
+# into the same logical canvas and scaled once per frame. Clicks and touches go
+# to the match under the pointer; typing goes through the InputRouter seats.
+KIOSK_MAX = 4
+
+def kiosk_viewports(count):
+    cols = 1 if count == 1 else 2
+    rows = 1 if count <= 2 else 2
+    w, h = SCREEN_W // cols, SCREEN_H // rows
+    return [pygame.Rect((i % cols) * w, (i // cols) * h, w, h) for i in range(count)]
+
+class KioskStation:
+    def __init__(self, index, rect, mode, difficulty):
+        self.index = index
+        self.rect = rect
+        self.mode = mode
+        self.difficulty = difficulty
+        self.game = None
+        self.new_match()
+
+    # "Back to menu" in a kiosk viewport just starts that station over
+    def new_match(self):
+        if self.game:
+            self.game.leave()
+        game = Game(self.difficulty, self.mode, self.new_match, size=self.rect.size)
+        game.set_labels(f"P{self.index * 2 + 1}", f"P{self.index * 2 + 2}")
+        game.replay_tag = f"-k{self.index + 1}"
+        game.prerender()
+        game.start()
+        game.start_recording()
+        self.game = game
+
+    def accepts_input(self):
+        return not (self.game.countdown_active or self.game.settings_panel.is_visible)
+
+    def local_event(self, ev):
+        attrs = dict(ev.dict, pos=(ev.pos[0] - self.rect.x, ev.pos[1] - self.rect.y))
+        return pygame.event.Event(ev.type, attrs)
+
+    def handle_pointer(self, ev):
+        if not self.game.countdown_active:
+            self.game.handle_pointer(self.local_event(ev))
+
+    def type_input(self, side, op, arg):
+        if self.game.winner:
+            if op == REC_SUBMIT:
+                play_sfx(SOUND_CLICK)
+                self.game.reset_game_from_button()
+        elif self.accepts_input():
+            apply_input(self.game, op, side, arg)
+
+def run_kiosk(count, mode, difficulty):
+    display = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    convert_assets()
+    scaler = DisplayScaler(display)
+    screen = scaler.canvas
+    pygame.display.set_caption("Math Tug of War - Kiosk")
+    stations = [KioskStation(i, rect, mode, difficulty)
+                for i, rect in enumerate(kiosk_viewports(min(count, KIOSK_MAX)))]
+    router = InputRouter((station, side) for station in stations for side in station.game.local_sides())
+    empty = [rect for rect in kiosk_viewports(KIOSK_MAX)[len(stations):] if len(stations) > 2]
+    teacher = TeacherOverlay()
+    scheduler = RenderScheduler()
+    while True:
+        now, events = scheduler.next_frame(True)
+        for ev in events:
+            ev = scaler.map_event(ev)
+            if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE):
+                for station in stations:
+                    station.game.leave()
+                terminate_program()
+            if ev.type == pygame.KEYDOWN and (ev.key == pygame.K_RETURN and ev.mod & pygame.KMOD_ALT):
+                pygame.display.toggle_fullscreen()
+                continue
+            if ev.type == pygame.KEYDOWN and ev.key == pygame.K_t:
+                teacher.toggle()
+                continue
+            if ev.type in (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED):
+                scaler.resize()
+                screen = scaler.canvas
+            for station in stations:
+                station.game.sync(ev.stamp)
+            router.handle_device(ev)
+            router.route(ev)
+            if ev.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                for station in stations:
+                    if ev.type == pygame.MOUSEMOTION or station.rect.collidepoint(ev.pos):
+                        station.handle_pointer(ev)
+        for station in stations:
+            station.game.sync(now)
+            station.game.draw(screen.subsurface(station.rect))
+        for rect in empty:
+            screen.blit(cached_layer('dimmed_bg', build_dimmed_background), rect, rect)
+        teacher.draw(screen)
+        scaler.present()
+
+# Main loop 
+def main(replay=None):
+    display = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    convert_assets()
+    scaler = DisplayScaler(display)
+    screen = scaler.canvas
+    pygame.display.set_caption("Math Tug of War - Ultimate")
+    current_state = STATE_MAIN_MENU
+    game_instance = None
+    name_input_screen = None
+    leaderboard_screen = None
+    game_over_screen = None
+    audio_settings_screen = None
+
+    def quit_to_menu():
+        nonlocal current_state, game_instance, leaderboard_screen, game_over_screen, audio_settings_screen
+        if game_instance:
+            game_instance.leave()
+        current_state = STATE_MAIN_MENU
+        game_instance = None
+        leaderboard_screen = None
+        game_over_screen = None
+        audio_settings_screen = None
+        restart_bg_music()
+
+    def show_leaderboard():
+        nonlocal current_state, leaderboard_screen
+        leaderboard_screen = pool.take(('leaderboard',), new_leaderboard)
+        current_state = STATE_LEADERBOARD
+
+    def show_audio_settings():
+        nonlocal current_state, audio_settings_screen
+        audio_settings_screen = pool.take(('audio',), new_audio_settings)
+        current_state = STATE_AUDIO_SETTINGS
+
+    def new_leaderboard():
+        return LeaderboardScreen(quit_to_menu, terminate_program)
+
+    def new_audio_settings():
+        return AudioSettingsScreen(quit_to_menu)
+
+    def new_name_input():
+        return NameInputScreen(start_game_play_callback, quit_to_menu)
+
+    def game_factory(mode, difficulty):
+        return lambda: Game(difficulty, mode, quit_to_menu)
+
+    def take_game():
+        if NET_SERVER:
+            game = NetGame(NetClient(NET_SERVER, NET_NAME, GAME_MODE, DIFFICULTY, **NET_LINK), quit_to_menu)
+        else:
+            game = pool.take(('game', GAME_MODE, DIFFICULTY), game_factory(GAME_MODE, DIFFICULTY))
+            game.set_labels(PLAYER_NAMES["left"], PLAYER_NAMES["right"])
+        game.start()
+        # Scores are about to change, so a pooled leaderboard would be stale
+        pool.discard('leaderboard')
+        return game
+
+    def prewarm_next_screens():
+        pool.prewarm(('layers',), prewarm_shared_layers)
+        if current_state == STATE_MAIN_MENU and not NET_SERVER:
+            mode, difficulty = main_menu.selected_mode, main_menu.selected_difficulty
+            game_key = ('game', mode, difficulty)
+            pool.discard('game', keep=game_key)
+            pool.prewarm(game_key, game_factory(mode, difficulty))
+            if mode == 'PvP':
+                pool.prewarm(('name_input',), new_name_input)
+            pool.prewarm(('leaderboard',), new_leaderboard)
+            pool.prewarm(('audio',), new_audio_settings)
+        elif current_state == STATE_NAME_INPUT:
+            pool.prewarm(('game', 'PvP', DIFFICULTY), game_factory('PvP', DIFFICULTY))
+
+    def start_game_play_callback():
+        nonlocal current_state, game_instance
+        if GAME_MODE == 'PvBot':
+            def pvbot_game_over(reason):
+                nonlocal current_state, game_over_screen
+                if reason == 'win':
+                    game_over_screen = GameOverScreen(
+                        reason='pvp',
+                        p1_name=PLAYER_NAMES["left"],
+                        p2_name="BOT",
+                        p1_score=game_instance.left.correct_count,
+                        p2_score=game_instance.right.correct_count,
+                        return_callback=quit_to_menu,
+                        seed=game_instance.seed
+                    )
+                else:
+                    game_over_screen = GameOverScreen(
+                        reason='lose',
+                        player_name=PLAYER_NAMES["left"],
+                        return_callback=quit_to_menu,
+                        seed=game_instance.seed
+                    )
+                current_state = STATE_GAME_OVER
+            game_instance = take_game()
+            game_instance.show_game_over_callback = pvbot_game_over
+        else:
+            game_instance = take_game()
+            game_instance.show_game_over_callback = show_game_over_pvp
+        game_instance.start_recording()
+        router.set_seats((game_instance, side) for side in game_instance.local_sides())
+        current_state = STATE_GAME_PLAY
+
+    def show_game_over_pvp(p1_name, p2_name, p1_score, p2_score):
+        nonlocal current_state, game_over_screen
+        game_over_screen = GameOverScreen(
+            reason='pvp',
+            p1_name=p1_name, p2_name=p2_name,
+            p1_score=p1_score, p2_score=p2_score,
+            return_callback=quit_to_menu,
+            seed=game_instance.seed
+        )
+        current_state = STATE_GAME_OVER
+
+    def start_game_callback():
+        nonlocal current_state, name_input_screen
+        if NET_SERVER:
+            start_game_play_callback()
+        elif GAME_MODE == 'PvP':
+            name_input_screen = pool.take(('name_input',), new_name_input)
+            current_state = STATE_NAME_INPUT
+        else:
+            PLAYER_NAMES["left"] = "YOU"
+            PLAYER_NAMES["right"] = "BOT"
+            start_game_play_callback()
+
+    pool = ScreenPool()
+    router = InputRouter()
+    main_menu = MainMenu(start_game_callback, show_leaderboard, show_audio_settings)
+    if replay:
+        game_instance = replay.build_game(quit_to_menu)
+        game_instance.start()
+        current_state = STATE_GAME_PLAY
+    teacher = TeacherOverlay()
+    scheduler = RenderScheduler()
+    running = True
+    while running:
+        active_screen = {
+            STATE_MAIN_MENU: main_menu,
+            STATE_AUDIO_SETTINGS: audio_settings_screen,
+            STATE_NAME_INPUT: name_input_screen,
+            STATE_GAME_PLAY: game_instance,
+            STATE_LEADERBOARD: leaderboard_screen,
+            STATE_GAME_OVER: game_over_screen,
+        }.get(current_state)
+        animating = bool(active_screen and getattr(active_screen, 'is_animating', lambda: False)())
+        now, events = scheduler.next_frame(animating)
+        previous_state = current_state
+        for ev in events:
+            ev = scaler.map_event(ev)
+            router.handle_device(ev)
+            if ev.type == pygame.QUIT:
+                if game_instance:
+                    game_instance.leave()
+                terminate_program()
+            if ev.type == pygame.KEYDOWN and (ev.key == pygame.K_RETURN and ev.mod & pygame.KMOD_ALT):
+                pygame.display.toggle_fullscreen()
+            if ev.type in (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED):
+                scaler.resize()
+                screen = scaler.canvas
+            if current_state == STATE_MAIN_MENU:
+                main_menu.handle_event(ev)
+            elif current_state == STATE_AUDIO_SETTINGS:
+                audio_settings_screen.handle_event(ev)
+            elif current_state == STATE_NAME_INPUT:
+                name_input_screen.handle_event(ev)
+            elif current_state == STATE_GAME_PLAY:
+                game_instance.sync(ev.stamp)
+                if game_instance.replay:
+                    if ev.type == pygame.KEYDOWN:
+                        if ev.key == pygame.K_ESCAPE:
+                            quit_to_menu()
+                        elif ev.unicode in REPLAY_SPEED_KEYS:
+                            game_instance.replay.speed = REPLAY_SPEED_KEYS[ev.unicode]
+                    continue
+                if game_instance.countdown_active:
+                    if (ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE and
+                            getattr(game_instance, 'waiting', False)):
+                        quit_to_menu()
+                    continue
+                game_instance.handle_pointer(ev)
+                if not game_instance.settings_panel.is_visible:
+                    if ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE:
+                        quit_to_menu()
+                        continue
+                    if ev.type == pygame.KEYDOWN and ev.key == pygame.K_t:
+                        teacher.toggle()
+                        scheduler.mark_dirty()
+                        continue
+                    router.route(ev)
+            elif current_state == STATE_LEADERBOARD:
+                leaderboard_screen.handle_event(ev)
+            elif current_state == STATE_GAME_OVER:
+                game_over_screen.handle_event(ev)
+        if current_state != previous_state:
+            scheduler.mark_dirty()
+        if not animating and not events:
+            prewarm_next_screens()
+            pool.work()
+
+        if current_state == STATE_GAME_PLAY and game_instance:
+            game_instance.sync(now)
+        if not scheduler.should_draw(animating):
+            continue
+
+        if current_state == STATE_MAIN_MENU:
+            main_menu.draw(screen)
+        elif current_state == STATE_AUDIO_SETTINGS:
+            audio_settings_screen.draw(screen)
+        elif current_state == STATE_NAME_INPUT:
+            name_input_screen.draw(screen)
+        elif current_state == STATE_GAME_PLAY:
+            if game_instance:
+                game_instance.draw(screen)
+                teacher.draw(screen)
+        elif current_state == STATE_LEADERBOARD:
+            if leaderboard_screen:
+                leaderboard_screen.draw(screen)
+        elif current_state == STATE_GAME_OVER:
+            if game_over_screen:
+                game_over_screen.draw(screen)
+
+        scaler.present()
+
+    terminate_program()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Math Tug of War")
+    parser.add_argument("--native", action="store_true",
+                        help=f"draw at the display resolution instead of {LOGICAL_SIZE[0]}x{LOGICAL_SIZE[1]} scaled")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="play every match with this RNG seed (tournaments, benchmarks)")
+    parser.add_argument("--no-record", action="store_true", help="do not write match replays")
+    parser.add_argument("--no-telemetry", action="store_true", help="do not log per-question telemetry")
+    parser.add_argument("--build-bundle", nargs="?", const=BUNDLE_FILE, metavar="FILE",
+                        help="build a single-file .pyz with bytecode and a packed asset archive")
+    parser.add_argument("--rebuild-ratings", action="store_true",
+                        help="recompute player ratings from the match history and exit")
+    parser.add_argument("--replay", metavar="FILE", help="play back a recorded match")
+    parser.add_argument("--speed", type=int, default=1, help="replay speed multiplier (keys 1-4 change it)")
+    parser.add_argument("--verify-replay", metavar="FILE",
+                        help="re-simulate a replay headlessly at max speed and check the result")
+    parser.add_argument("--export-replay", metavar="FILE",
+                        help="render a replay offscreen to a PNG sequence or raw RGB stream")
+    parser.add_argument("--out", default="frames",
+                        help="export target: PNG directory, raw RGB file, or '-' for stdout")
+    parser.add_argument("--fps", type=int, default=EXPORT_FPS, help="export frame rate")
+    parser.add_argument("--size", default=None, help="export resolution, e.g. 1280x720")
+    parser.add_argument("--raw", action="store_true", help="export raw RGB24 frames instead of PNGs")
+    parser.add_argument("--encoder", default=None,
+                        help="command that reads raw RGB24 frames on stdin, e.g. "
+                             "\"ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 30 -i - clip.mp4\"")
+    parser.add_argument("--serve", type=int, nargs="?", const=NET_PORT, metavar="PORT",
+                        help=f"run a headless LAN match server (default port {NET_PORT})")
+    parser.add_argument("--host", default="0.0.0.0", help="address the server listens on")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="play PvP against a LAN match server")
+    parser.add_argument("--name", default=NET_NAME, help="your player name for --connect")
+    parser.add_argument("--difficulty", choices=NET_DIFFICULTIES + (ADAPTIVE,), default=DIFFICULTY,
+                        help="difficulty of the --kiosk matches and the --net-test players")
+    parser.add_argument("--kiosk", type=int, nargs="?", const=KIOSK_MAX, metavar="N",
+                        help=f"split the screen between N matches (up to {KIOSK_MAX}); the keyboard's main block "
+                             "and numeric keypad are the first two players, controllers join in order")
+    parser.add_argument("--mode", choices=NET_MODES, default=GAME_MODE, help="mode of the --kiosk matches")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="server processes; with more than one, matches are sharded across them")
+    parser.add_argument("--tick-rate", type=int, default=NET_TICK_RATE,
+                        help="server snapshots per second")
+    parser.add_argument("--latency", type=float, default=None,
+                        help="simulated one-way delay in ms added to every packet sent")
+    parser.add_argument("--jitter", type=float, default=None, help="simulated extra random delay in ms")
+    parser.add_argument("--loss", type=float, default=None, help="simulated packet loss rate, 0-1")
+    parser.add_argument("--net-test", action="store_true",
+                        help="play a scripted match over loopback with simulated latency and loss")
+    parser.add_argument("--load-test", type=int, nargs="?", const=10000, metavar="CLIENTS",
+                        help="drive a local server with this many simulated clients (default 10000)")
+    parser.add_argument("--load-sockets", type=int, default=16, help="UDP sockets the load test clients share")
+    parser.add_argument("--duration", type=int, default=60, help="load test length in seconds")
+    return parser.parse_args(argv)
+
+def export_replay(args):
+    size = tuple(int(v) for v in args.size.lower().split('x')) if args.size else None
+    exporter = ReplayExporter(load_replay(args.export_replay), args.out, size, args.fps,
+                              args.raw, args.encoder)
+    started = time.perf_counter()
+    frames = exporter.run()
+    elapsed = time.perf_counter() - started
+    print(f"exported {frames} frames ({frames / args.fps:.1f}s of match) in {elapsed:.1f}s "
+          f"({frames / args.fps / max(elapsed, 1e-6):.1f}x real time)", file=sys.stderr)
+
+# Command-line replay loading: a missing or damaged file is an error message, not a traceback
+def load_replay(path, speed=1):
+    try:
+        return ReplayPlayer(path, speed)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Cannot load replay: {e}")
+
+def verify_replay(path):
+    player = load_replay(path)
+    started = time.perf_counter()
+    ok, game = player.verify()
+    elapsed = time.perf_counter() - started
+    print(f"{path}: {player.size} bytes, seed {player.seed}, {len(player.events)} inputs, "
+          f"{len(player.bot_keys)} bot keys")
+    print(f"simulated {game.now() / 1000:.1f}s in {elapsed:.3f}s, winner: {game.winner or 'none'}, "
+          f"position {game.position}, score {game.left.correct_count}-{game.right.correct_count}")
+    if player.end_tick is None:
+        print("recording has no end marker (cut short?), verified up to its last complete record")
+    print("VERIFIED" if ok else f"MISMATCH ({player.verifier.mismatches} bot keystrokes differ)")
+    return ok
+
+# Bundle build: the loose assets, plus every image and sound this run decoded
+# (module setup loads them all), go into one pack; main.py goes in as bytecode.
+BUNDLE_MAIN = "import runpy\nrunpy.run_module('main', run_name='__main__', alter_sys=True)\n"
+
+def build_asset_pack():
+    entries = []
+    for name in sorted(os.listdir(GAME_DIR)):
+        if os.path.splitext(name)[1].lower() in ASSET_EXTENSIONS:
+            with open(asset_path(name), 'rb') as f:
+                entries.append((name, f.read(), {'mtime': int(os.stat(asset_path(name)).st_mtime)}))
+    for key, surf in BAKED_SURFACES.items():
+        fmt = 'RGBA' if surf.get_flags() & pygame.SRCALPHA else 'RGB'
+        entries.append((key, pygame.image.tostring(surf, fmt), {'shape': list(surf.get_size()), 'format': fmt}))
+    for key, sound in BAKED_SOUNDS.items():
+        entries.append((key, sound.get_raw(), {}))
+    index = {}
+    offset = 0
+    for name, data, meta in entries:
+        index[name] = dict(meta, offset=offset, size=len(data))
+        offset = align_asset(offset + len(data))
+    index_data = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    header = ASSET_PACK_MAGIC + struct.pack('<I', len(index_data)) + index_data
+    pack = bytearray(header.ljust(align_asset(len(header)), b'\0'))
+    for name, data, meta in entries:
+        pack += data
+        pack += bytes(align_asset(len(pack)) - len(pack))
+    return pack
+
+def build_bundle(path):
+    if BUNDLE_PATH:
+        raise SystemExit("--build-bundle needs the main.py source, not a bundle")
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as staging:
+        py_compile.compile(os.path.abspath(__file__), cfile=os.path.join(staging, 'main.pyc'), doraise=True,
+                           invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+        with open(os.path.join(staging, '__main__.py'), 'w') as f:
+            f.write(BUNDLE_MAIN)
+        with open(os.path.join(staging, ASSET_PACK_NAME), 'wb') as f:
+            f.write(build_asset_pack())
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Stored, not deflated: the pack has to be mappable in place
+        zipapp.create_archive(staging, path, interpreter='/usr/bin/env python3', compressed=False)
+    print(f"built {path}: {os.path.getsize(path) / (1 << 20):.1f} MB, {len(BAKED_SURFACES)} prescaled images, "
+          f"{len(BAKED_SOUNDS)} decoded sounds in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    MATCH_SEED = args.seed
+    RECORD_REPLAYS = not args.no_record
+    if args.verify_replay:
+        ok = verify_replay(args.verify_replay)
+        pygame.quit()
+        sys.exit(0 if ok else 1)
+    if args.export_replay:
+        export_replay(args)
+        pygame.quit()
+        sys.exit(0)
+    if args.build_bundle:
+        build_bundle(args.build_bundle)
+        pygame.quit()
+        sys.exit(0)
+    if args.rebuild_ratings:
+        start = time.perf_counter()
+        RATINGS.rebuild()
+        games = sum(entry[1] for entry in RATINGS.players.values())
+        print(f"rated {len(RATINGS.players)} players over {games} player-games in "
+              f"{time.perf_counter() - start:.2f}s", file=sys.stderr)
+        pygame.quit()
+        sys.exit(0)
+    NET_LINK = {'latency': args.latency or 0, 'jitter': args.jitter or 0, 'loss': args.loss or 0.0}
+    if args.net_test:
+        ok = run_net_test(args)
+        PIPELINE.shutdown()
+        pygame.quit()
+        sys.exit(0 if ok else 1)
+    if args.load_test:
+        run_load_test(args)
+        PIPELINE.shutdown()
+        pygame.quit()
+        sys.exit(0)
+    if args.serve is not None:
+        serve(args)
+        terminate_program()
+    if not args.no_telemetry:
+        TELEMETRY = QuestionTelemetry(TELEMETRY_DIR)
+    if args.kiosk:
+        run_kiosk(args.kiosk, args.mode, args.difficulty)
+    if args.connect:
+        NET_SERVER = parse_address(args.connect)
+        NET_NAME = args.name.upper()[:10]
+    main(load_replay(args.replay, args.speed) if args.replay else None)
\ No newline at end of file